@@ -1,19 +1,51 @@
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, redirect, url_for, g
 import os
+import gzip
+import hashlib
 import pandas as pd
 import requests
-from flask import jsonify
+from flask import jsonify, make_response, Response, stream_with_context
 from dotenv import load_dotenv
 import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # --- 导入项目模块 ---
-from src.crawler.steam_api_crawler import get_appid_by_name
-from src.database.cache_manager import get_reviews_with_cache
+from src.crawler.steam_api_crawler import get_appid_by_name, get_game_details, fetch_review_summary
+from src.database.cache_manager import (
+    DB_NAME, get_reviews_with_cache, get_review_page, get_data_version, get_cache_state, schedule_refresh,
+    load_review_columns
+)
+from src.database import export
+from src.database.cache_governor import start_governor, cache_stats
+from src.database.catalog import lookup_appid, popular_appids, start_catalog_sync, get_ccu
+from src.database.response_cache import ResponseCache, RESPONSE_CACHE_DIR
+from src.monitoring.metrics import timed, record_cache, render_prometheus
+from src.monitoring.profiling import start_profiler, stop_profiler
+from src.monitoring import admission
 # --- 核心修改：导入新的分析管理器 ---
-from src.analysis.analysis_manager import get_analysis_results
+from src.analysis.analysis_manager import (
+    ANALYSIS_CACHE_DIR, get_analysis_results, load_word_cloud, load_playtime_cohorts, store_playtime_cohorts
+)
+from src.analysis import playtime_cohorts
+from src.analysis.semantic_search import search_reviews
+from src.analysis.leaderboard import query_leaderboard
+from src.analysis.comparison import compare_games, parse_appids, prewarm_games
 
 load_dotenv()
 API_KEY = os.getenv("STEAM_API_KEY")
+# 本地 SteamSpy 目录同步 (CATALOG_SYNC_ENABLED=0 关闭)；每轮同步后预热在线人数最多的 N 个游戏 (0 为不预热)
+CATALOG_SYNC_ENABLED = os.getenv("CATALOG_SYNC_ENABLED", "1") == "1"
+CATALOG_PREWARM_TOP_N = int(os.getenv("CATALOG_PREWARM_TOP_N", "0"))
+# 同时在线人数达到该值的游戏视为热门，与已缓存的游戏一起优先获得爬取 / 推理名额
+ADMISSION_POPULAR_CCU = int(os.getenv("ADMISSION_POPULAR_CCU", "1000"))
+# 设置 PROFILING_ENABLED=1 后，带 ?profile=1 的请求会导出 cProfile 文件
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED") == "1"
 
 RATING_DISPLAY_MAP = {
     "Overwhelmingly Positive": "好评如潮",
@@ -29,90 +61,446 @@ RATING_DISPLAY_MAP = {
 
 app = Flask(__name__)
 
+# 压缩后的词云响应缓存 (LRU): (appid, review_type) -> (mtime, etag, {encoding: body})
+WORD_DATA_CACHE_MAX_ENTRIES = 256
+_word_data_cache = OrderedDict()
+_word_data_lock = threading.Lock()
+
 # --- 缓存目录和时序爬虫已移走 ---
 
-@app.route("/", methods=["GET", "POST"])
-def index():
-    # --- 默认值 ---
-    game_name_search_term = ""
-    review_type = "positive"
-    game_info = None
-    reviews = pd.DataFrame()
-    positive_count = 0
-    negative_count = 0
-    review_label = "评论"
-    error = None
-    game_rating_desc = None
-    
-    # 分析结果的默认值
-    analysis_results = {
+# 渲染结果缓存 (内存 LRU，设置 RESPONSE_CACHE_DIR 后同时落盘)
+response_cache = ResponseCache(disk_dir=RESPONSE_CACHE_DIR)
+
+# 后台缓存容量管理 (访问统计落库、超预算淘汰、增量 VACUUM)
+start_governor()
+
+def _prewarm_popular():
+    prewarm_games(popular_appids(CATALOG_PREWARM_TOP_N))
+
+if CATALOG_SYNC_ENABLED:
+    start_catalog_sync(on_synced=_prewarm_popular if CATALOG_PREWARM_TOP_N > 0 else None)
+
+
+@app.before_request
+def _start_request_profiling():
+    if PROFILING_ENABLED and request.args.get("profile") == "1":
+        g.profiler = start_profiler()
+
+
+@app.after_request
+def _stop_request_profiling(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        path = stop_profiler(profiler, request.path)
+        response.headers["X-Profile-File"] = path
+    return response
+
+
+def _render_page(**context):
+    with timed("template_render"):
+        return render_template("index.html", **context)
+
+
+def _empty_page_context():
+    """页面变量的默认值"""
+    return {
+        "appid": None,
+        "game_info": None,
+        "game_name": "",
+        "review_type": "positive",
+        "review_label": "评论",
+        "positive_count": 0,
+        "negative_count": 0,
+        "error": None,
+        # 过载降级：只有评论总数 / 评级，或主题和时序分析被推迟
+        "degraded": False,
+        "game_rating_desc": None,
+        # 分析结果的默认值
         "recommend_score": None, "suggestion": None,
-        "word_data_json": "[]", "topic_map_json": "{}",
+        "topic_map_json": "{}",
         "negative_topics": {}, "time_series_json": "{}",
-        "radar_json": "{}", "playtime_sentiment_json": "{}"
+        "radar_json": "{}", "playtime_sentiment_json": "{}",
+        # 多游戏对比
+        "compare_appids": "", "compare_json": None
     }
 
+
+def _analysis_refresher(appid, review_type, game_info=None):
+    """后台刷新评论后重算分析缓存 (见 cache_manager.schedule_refresh)"""
+    def refresh(df, review_summary):
+        info = game_info or get_game_details(appid)
+        if info:
+            get_analysis_results(appid, df, info, review_summary, True, review_type)
+    return refresh
+
+
+def _rating_display(game_rating_desc_raw):
+    """Steam 评级描述翻译为中文 (没有对应翻译时返回原始值)"""
+    for key, chinese_val in RATING_DISPLAY_MAP.items():
+        # 使用 "in" 来匹配 "Overwhelmingly Positive (1,234)" 这样的情况
+        if key in game_rating_desc_raw:
+            return chinese_val
+    return game_rating_desc_raw
+
+
+def _admission_priority(appid):
+    """已缓存或热门的游戏优先获得昂贵阶段的名额"""
+    if get_data_version(appid) or (get_ccu(appid) or 0) >= ADMISSION_POPULAR_CCU:
+        return admission.PRIORITY_CACHED
+    return admission.PRIORITY_DEFAULT
+
+
+def _summary_only_context(context, appid, review_type, game_real_name):
+    """
+    降级页面：只用 Steam 的评论总数和评级 (一次 num_per_page=0 的请求)，
+    评论爬取和全部分析交给后台刷新，完成后数据版本出现，再访问即为完整页面。
+    """
+    try:
+        summary = fetch_review_summary(appid)
+    except requests.RequestException as e:
+        print(f"❌ 获取评论摘要失败: {e}")
+        summary = {}
+    if not summary:
+        context["error"] = "服务器繁忙，请稍后再试"
+        return context
+    schedule_refresh(appid, game_real_name, on_refreshed=_analysis_refresher(appid, review_type, context["game_info"]))
+    context["degraded"] = True
+    context["positive_count"] = int(summary.get("total_positive", 0))
+    context["negative_count"] = int(summary.get("total_negative", 0))
+    context["review_label"] = "好评" if review_type == "positive" else "差评"
+    context["game_rating_desc"] = _rating_display(summary.get("review_score_desc", "无评分"))
+    return context
+
+
+def _build_game_context(appid, review_type, force_update=False, game_real_name=None, game_info=None):
+    """
+    跑完整流程 (数据库缓存 -> 分析管理器)，返回模板变量。
+    """
+    with admission.request_context(_admission_priority(appid)) as ticket:
+        return _run_game_pipeline(appid, review_type, ticket, force_update, game_real_name, game_info)
+
+
+def _run_game_pipeline(appid, review_type, ticket, force_update, game_real_name, game_info):
+    context = _empty_page_context()
+    context["appid"] = appid
+    context["review_type"] = review_type
+
+    if game_info is None:
+        game_info = get_game_details(appid)
+    if not game_info:
+        context["error"] = "未找到该游戏，请检查名称"
+        return context
+    context["game_info"] = game_info
+    context["game_name"] = game_info.get("name") or ""
+    game_real_name = game_real_name or context["game_name"]
+
+    # 过载时未缓存的游戏不再排队爬取，先返回 Steam 摘要
+    if not get_data_version(appid) and admission.should_degrade():
+        return _summary_only_context(context, appid, review_type, game_real_name)
+
+    # 1. 从数据库缓存获取评论
+    df, is_fresh_fetch, review_summary = get_reviews_with_cache(
+        appid, game_real_name, force_update=force_update,
+        on_refreshed=_analysis_refresher(appid, review_type, game_info)
+    )
+
+    if df.empty:
+        # 爬取 / 推理等不到名额时同样退回 Steam 摘要
+        if ticket.rejected:
+            return _summary_only_context(context, appid, review_type, game_real_name)
+        context["error"] = "未获取到评论数据"
+        return context
+
+    # 2. 准备基础数据
+    context["positive_count"] = int((df["voted_up"] == True).sum())
+    context["negative_count"] = int((df["voted_up"] == False).sum())
+    context["review_label"] = "好评" if review_type == "positive" else "差评"
+
+    # 1. 获取原始字符串 (e.g., "Overwhelmingly Positive")
+    game_rating_desc_raw = review_summary.get('review_score_desc', '无评分')
+
+    # 2. 翻译 (默认为原始值)
+    context["game_rating_desc"] = _rating_display(game_rating_desc_raw)
+
+    # --- 3. 调用分析管理器 ---
+    context.update(get_analysis_results(
+        appid, df, game_info, review_summary,
+        is_fresh_fetch, review_type
+    ))
+    return context
+
+
+@app.route("/", methods=["GET", "POST"])
+def index():
     if request.method == "POST":
+        # 搜索只负责解析 appid，然后重定向到可缓存的 GET 地址
         game_name_search_term = request.form["game_name"]
-        review_type = request.form.get("review_type", "positive")
-        force_update = "force_update_button" in request.form
-        
+        review_type = "negative" if request.form.get("review_type") == "negative" else "positive"
+        # 先在本地 SteamSpy 目录里按名称精确匹配，命中时不必请求商店搜索和详情接口
+        appid, _ = lookup_appid(game_name_search_term)
+        if appid:
+            return redirect(url_for("game_page", appid=appid, type=review_type), code=303)
         appid, game_real_name, img_url, game_info = get_appid_by_name(game_name_search_term)
-        
-        if not appid:
-            error = "未找到该游戏，请检查名称"
+
+        if not appid or not game_info:
+            context = _empty_page_context()
+            context["game_name"] = game_name_search_term
+            context["error"] = "未找到该游戏，请检查名称"
+            return _render_page(**context)
+
+        return redirect(url_for("game_page", appid=appid, type=review_type), code=303)
+
+    return _render_page(**_empty_page_context())
+
+
+@app.route("/game/<int:appid>", methods=["GET", "POST"])
+def game_page(appid):
+    review_type = "negative" if request.values.get("type") == "negative" else "positive"
+
+    if request.method == "POST":
+        # 强制更新：刷新后重定向回 GET
+        if "force_update_button" in request.form:
+            response_cache.invalidate(appid)
+            _build_game_context(appid, review_type, force_update=True)
+        return redirect(url_for("game_page", appid=appid, type=review_type), code=303)
+
+    # 1. 数据版本未变 -> 直接走 304 / 内存缓存，不碰 Steam API 和分析缓存
+    data_version = get_data_version(appid)
+    if data_version:
+        # 数据已过期 (stale)：照常返回旧版本，后台刷新完成后数据版本会变化
+        if get_cache_state(appid) == "stale":
+            schedule_refresh(appid, on_refreshed=_analysis_refresher(appid, review_type))
+        etag = ResponseCache.make_etag(appid, review_type, data_version)
+        last_modified = datetime.fromisoformat(data_version)
+        if request.if_none_match.contains(etag) or (
+            not request.if_none_match
+            and request.if_modified_since
+            and request.if_modified_since >= last_modified.astimezone(timezone.utc).replace(microsecond=0)
+        ):
+            record_cache("response", "not_modified")
+            response = make_response("", 304)
+            response.set_etag(etag)
+            return response
+
+        body = response_cache.get(appid, review_type, data_version)
+        if body is not None:
+            record_cache("response", "hit")
+            return _cacheable_page(body, etag, last_modified)
+    record_cache("response", "miss")
+
+    # 2. 缓存未命中：跑完整流程并渲染
+    context = _build_game_context(appid, review_type)
+    html = _render_page(**context)
+    # 降级页面不进渲染缓存：后台分析完成后数据版本可能不变
+    if context["error"] or context["degraded"]:
+        return html
+
+    # 刷新后数据版本可能已变化，重新读取
+    data_version = get_data_version(appid)
+    if not data_version:
+        return html
+    response_cache.put(appid, review_type, data_version, html)
+    return _cacheable_page(
+        html, ResponseCache.make_etag(appid, review_type, data_version),
+        datetime.fromisoformat(data_version)
+    )
+
+
+def _cacheable_page(body, etag, last_modified):
+    response = make_response(body)
+    response.mimetype = "text/html"
+    response.set_etag(etag)
+    # last_updated 以本地时间写入，这里按本地时区转换为 HTTP 时间
+    response.last_modified = last_modified.astimezone(timezone.utc)
+    response.headers["Cache-Control"] = "private, max-age=0, must-revalidate"
+    return response
+
+# ===== 多游戏对比 =====
+@app.route("/compare")
+def compare():
+    raw_appids = request.args.get("appids", "")
+    try:
+        appids = parse_appids(raw_appids)
+    except ValueError as e:
+        if request.args.get("format") == "json":
+            return jsonify({"error": str(e)}), 400
+        context = _empty_page_context()
+        context["compare_appids"] = raw_appids
+        context["error"] = str(e)
+        return _render_page(**context), 400
+
+    result = compare_games(appids)
+    if request.args.get("format") == "json":
+        return jsonify(result)
+    context = _empty_page_context()
+    context["compare_appids"] = ",".join(str(a) for a in appids)
+    context["compare_json"] = json.dumps(result, ensure_ascii=False)
+    context["compare_games"] = result["games"]
+    return _render_page(**context)
+
+# ===== 词云数据接口 (压缩 + ETag) =====
+@app.route("/word_data/<int:appid>")
+def word_data(appid):
+    review_type = "negative" if request.args.get("type") == "negative" else "positive"
+    word_cloud, mtime = load_word_cloud(appid, review_type)
+    cache_key = (appid, review_type)
+    if word_cloud is None:
+        # 分析缓存已被淘汰或尚未生成
+        with _word_data_lock:
+            _word_data_cache.pop(cache_key, None)
+        return jsonify({"names": [], "values": [], "topics": []}), 404
+
+    with _word_data_lock:
+        cached = _word_data_cache.get(cache_key)
+        if cached:
+            _word_data_cache.move_to_end(cache_key)
+    if not cached or cached[0] != mtime:
+        raw = json.dumps(word_cloud, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        bodies = {"identity": raw, "gzip": gzip.compress(raw)}
+        if brotli:
+            bodies["br"] = brotli.compress(raw)
+        cached = (mtime, hashlib.md5(raw).hexdigest(), bodies)
+        with _word_data_lock:
+            _word_data_cache[cache_key] = cached
+            _word_data_cache.move_to_end(cache_key)
+            while len(_word_data_cache) > WORD_DATA_CACHE_MAX_ENTRIES:
+                _word_data_cache.popitem(last=False)
+    _, etag, bodies = cached
+
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        accept = request.accept_encodings
+        encoding = "identity"
+        if "br" in bodies and accept["br"]:
+            encoding = "br"
+        elif accept["gzip"]:
+            encoding = "gzip"
+        response = make_response(bodies[encoding])
+        response.mimetype = "application/json"
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "public, max-age=0, must-revalidate"
+    return response
+
+# ===== 评论流接口 (键集分页) =====
+@app.route("/reviews/<int:appid>")
+def review_feed(appid):
+    review_type = "negative" if request.args.get("type") == "negative" else "positive"
+    sort_by = request.args.get("sort", "votes_up")
+    try:
+        reviews, next_cursor = get_review_page(
+            appid, review_type, sort_by,
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit", 20, type=int)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"reviews": reviews, "next_cursor": next_cursor})
+
+# ===== 评论语义搜索接口 =====
+@app.route("/search_reviews")
+def search_reviews_api():
+    query = (request.args.get("q") or "").strip()
+    appid = request.args.get("appid", type=int)
+    if not query:
+        return jsonify({"error": "缺少搜索词 q", "results": []}), 400
+    results = search_reviews(query, appid=appid, top_k=request.args.get("k", 10, type=int))
+    if results is None:
+        return jsonify({"error": "暂无可搜索的评论", "results": []}), 404
+    return jsonify({"query": query, "appid": appid, "results": results})
+
+# ===== 推荐排行榜接口 =====
+@app.route("/leaderboard")
+def leaderboard():
+    def _names(param):
+        return [r for r in (request.args.get(param) or "").split(",") if r]
+    try:
+        total, games = query_leaderboard(
+            tier=request.args.get("tier") or None,
+            risks=_names("risk"),
+            exclude_risks=_names("exclude_risk"),
+            min_score=request.args.get("min_score", type=int),
+            ascending=request.args.get("order") == "asc",
+            limit=request.args.get("limit", 50, type=int),
+            offset=request.args.get("offset", 0, type=int)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"total": total, "games": games})
+
+# ===== 玩家体验阶段自定义分段 =====
+@app.route("/playtime_cohorts/<int:appid>")
+def playtime_cohort_stats(appid):
+    """?bins=1,2,5,10 (小时) 自定义分段，或 ?quantiles=4 按分位数分组；都不传时为默认四个阶段"""
+    index = load_playtime_cohorts(appid)
+    if index is None:
+        # 旧的分析缓存没有前缀和索引：直接用数据库里的评论补建
+        df = load_review_columns(appid, ["playtime_at_review", "voted_up", "votes_up", *playtime_cohorts.SCORE_COLUMNS])
+        if df.empty:
+            return jsonify({"error": "该游戏尚未分析"}), 404
+        index = store_playtime_cohorts(appid, df)
+    try:
+        if request.args.get("quantiles"):
+            cohorts = playtime_cohorts.quantile_cohorts(index, request.args["quantiles"])
+        elif request.args.get("bins"):
+            cohorts = playtime_cohorts.boundary_cohorts(index, playtime_cohorts.parse_boundaries(request.args["bins"]))
         else:
-            # 1. 从数据库缓存获取评论
-            df, is_fresh_fetch, review_summary = get_reviews_with_cache(
-                appid, game_real_name, force_update=force_update
-            )
-
-            if df.empty:
-                error = "未获取到评论数据"
-            else:
-                # 2. 准备基础数据
-                positive_reviews = df[df["voted_up"] == True]
-                negative_reviews = df[df["voted_up"] == False]
-                positive_count = len(positive_reviews)
-                negative_count = len(negative_reviews)
-                review_label = "好评" if review_type == "positive" else "差评"
-                reviews_to_analyze = positive_reviews if review_type == "positive" else negative_reviews
-                reviews = reviews_to_analyze # 用于 Masonry 布局
-                game_rating_desc = review_summary.get('review_score_desc', '无评分')
-                
-                # 1. 获取原始字符串 (e.g., "Overwhelmingly Positive")
-                game_rating_desc_raw = review_summary.get('review_score_desc', '无评分')
-                
-                # 2. 翻译 (默认为原始值)
-                game_rating_desc = game_rating_desc_raw 
-                for key, chinese_val in RATING_DISPLAY_MAP.items():
-                    # 使用 "in" 来匹配 "Overwhelmingly Positive (1,234)" 这样的情况
-                    if key in game_rating_desc_raw:
-                        game_rating_desc = chinese_val
-                        break
-
-                # --- 3. 【核心修改】调用分析管理器 ---
-                analysis_results = get_analysis_results(
-                    appid, df, game_info, review_summary, 
-                    is_fresh_fetch, review_type
-                )
-                # --- 修改结束 ---
-
-    # --- 4. 统一 render_template ---
-    return render_template(
-        "index.html",
-        game_info=game_info,
-        game_name=game_name_search_term,
-        review_type=review_type,
-        review_label=review_label,
-        reviews=reviews,
-        positive_count=positive_count,
-        negative_count=negative_count,
-        error=error,
-        game_rating_desc=game_rating_desc,
-        # --- 使用字典解包传递所有分析结果 ---
-        **analysis_results
+            cohorts = playtime_cohorts.boundary_cohorts(index)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"cohorts": cohorts, "refund_window": playtime_cohorts.refund_window_stats(index)})
+
+# ===== 评论批量导出 (流式，边读边写，不会把全部评论载入内存) =====
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+@app.route("/export")
+def export_reviews():
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in export.EXPORT_FORMATS:
+        return jsonify({"error": f"不支持的导出格式: {fmt}"}), 400
+    if fmt == "parquet" and export.pa is None:
+        return jsonify({"error": "服务器未安装 pyarrow，无法导出 Parquet"}), 501
+    try:
+        # 不传 appids 时导出整个目录
+        appids = parse_appids(request.args["appids"], limit=None) if request.args.get("appids") else None
+        since = export.parse_time(request.args.get("since"))
+        until = export.parse_time(request.args.get("until"))
+        polarity = request.args.get("polarity") or None
+        if polarity not in (None, "positive", "negative"):
+            raise ValueError(f"无效的极性: {polarity}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    chunks = export.iter_review_chunks(
+        appids, since, until, polarity, db_path=DB_NAME, analysis_dir=ANALYSIS_CACHE_DIR
     )
+    filename = f"reviews_{appids[0] if appids and len(appids) == 1 else 'export'}.{fmt}"
+    return Response(
+        stream_with_context(export.stream_export(fmt, chunks)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# ===== 缓存容量统计 (最近一轮 cache_governor 的结果) =====
+@app.route("/cache_stats")
+def cache_stats_api():
+    return jsonify(cache_stats())
+
+# ===== 性能指标接口 (Prometheus 文本格式) =====
+@app.route("/metrics")
+def metrics():
+    response = make_response(render_prometheus())
+    response.mimetype = "text/plain"
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+# ===== 当前负载等级 (准入控制) =====
+@app.route("/load")
+def load_status():
+    return jsonify(admission.load_status())
 
 # ===== 评论详情接口 (不变) =====
 @app.route("/comment_detail/<steamid>/<appid>")
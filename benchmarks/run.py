@@ -0,0 +1,423 @@
+"""
+离线端到端基准测试。
+
+不访问真实 Steam：所有 HTTP 请求都发往本地替身 (stub_steam_api)，
+评论来自可复现的合成语料 (synthetic_reviews)。
+每个阶段在多个规模下重复运行，输出延迟分位数、吞吐量和峰值内存的 JSON 报告，
+可用 --compare 与另一次提交的报告对比。
+
+用法:
+    python -m benchmarks.run --scales 100,10000,1000000 --repeats 3
+    python -m benchmarks.run --stages review_cache_warm,review_page --compare old.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.synthetic_reviews import iter_reviews, make_texts
+from benchmarks.stub_steam_api import StubSteamServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_APPID = 424242
+SCORE_COLUMNS = ["score_gameplay", "score_visuals", "score_story", "score_opt", "score_value"]
+DEFAULT_RESULTS_DIR = os.path.join("benchmarks", "results")
+
+
+# ===================================
+# 工具函数
+# ===================================
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def synthetic_frame(scale, appid=BENCH_APPID, seed=42):
+    """构造与 fetch_game_reviews 输出同结构的 DataFrame (情感分数随机生成，不跑模型)"""
+    rng = random.Random(seed)
+    rows = []
+    for r in iter_reviews(seed + appid, scale):
+        row = {
+            "author_name": r["author"]["steamid"],
+            "author_avatar": r["author"]["avatar"],
+            "content": r["review"],
+            "voted_up": r["voted_up"],
+            "appid": appid,
+            "playtime_at_review": r["author"]["playtime_at_review"],
+            "votes_up": r["votes_up"],
+            "timestamp_created": r["timestamp_created"],
+        }
+        for col in SCORE_COLUMNS:
+            row[col] = rng.random()
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+class BenchContext:
+    """一次基准运行的共享环境：本地 Steam 替身 + 临时数据库 / 分析缓存目录"""
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="steam_radar_bench_")
+        self.server = None
+
+    def __enter__(self):
+        self.server = StubSteamServer(
+            corpus_size=self.args.corpus_size, latency_ms=self.args.latency_ms, seed=42
+        ).start()
+        os.environ["STEAM_STORE_BASE_URL"] = self.server.base_url
+        return self
+
+    def __exit__(self, *exc):
+        self.server.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def fresh_db(self):
+        """切换 cache_manager 到一个全新的临时数据库"""
+        from src.database import cache_manager
+        path = os.path.join(self.workdir, f"bench_{time.time_ns()}.db")
+        cache_manager.DB_NAME = path
+        return path
+
+    def fresh_analysis_dir(self):
+        from src.analysis import analysis_manager
+        path = tempfile.mkdtemp(prefix="analysis_", dir=self.workdir)
+        analysis_manager.ANALYSIS_CACHE_DIR = path
+        return path
+
+    def point_crawler_at_stub(self):
+        from src.crawler import steam_api_crawler
+        steam_api_crawler.STEAM_STORE_BASE_URL = self.server.base_url
+
+
+# ===================================
+# 各阶段：setup(ctx, scale) -> state；run(ctx, scale, state) -> 处理条数
+# ===================================
+def _setup_none(ctx, scale):
+    return None
+
+
+def _run_generate(ctx, scale, state):
+    count = 0
+    for _ in iter_reviews(42, scale):
+        count += 1
+    return count
+
+
+def _run_fetch_reviews(ctx, scale, state):
+    from src.crawler.steam_api_crawler import fetch_game_reviews
+    ctx.point_crawler_at_stub()
+    df, _ = fetch_game_reviews(BENCH_APPID, review_type="positive", num_reviews=min(scale, 100))
+    return len(df)
+
+
+def _setup_cache_cold(ctx, scale):
+    ctx.point_crawler_at_stub()
+    return None
+
+
+def _run_cache_cold(ctx, scale, state):
+    from src.database.cache_manager import get_reviews_with_cache
+    ctx.fresh_db()
+    df, _, _ = get_reviews_with_cache(BENCH_APPID, "Bench Game")
+    return len(df)
+
+
+def _setup_cache_warm(ctx, scale):
+    from src.database import cache_manager
+    ctx.fresh_db()
+    cache_manager._init_db()
+    summary = {"total_positive": scale, "total_negative": 0, "review_score_desc": "Very Positive"}
+    cache_manager._write_reviews(BENCH_APPID, synthetic_frame(scale), summary)
+    return None
+
+
+def _run_cache_warm(ctx, scale, state):
+    from src.database.cache_manager import get_reviews_with_cache
+    df, _, _ = get_reviews_with_cache(BENCH_APPID, "Bench Game")
+    return len(df)
+
+
+def _run_review_page(ctx, scale, state):
+    from src.database.cache_manager import get_review_page
+    # 翻 10 页，模拟无限滚动
+    cursor, count = None, 0
+    for _ in range(10):
+        reviews, cursor = get_review_page(BENCH_APPID, "positive", "votes_up", cursor=cursor, limit=30)
+        count += len(reviews)
+        if not cursor:
+            break
+    return count
+
+
+def _setup_texts(ctx, scale):
+    return make_texts(42, scale)
+
+
+def _run_analyze_batch(ctx, scale, texts):
+    from src.crawler.steam_api_crawler import analyzer
+    if analyzer is None:
+        raise RuntimeError("SentimentAnalyzer 未初始化")
+    return len(analyzer.analyze_batch(texts))
+
+
+def _run_preprocess(ctx, scale, texts):
+    from src.preprocess.text_cleaner import preprocess_text
+    return sum(1 for _ in map(preprocess_text, texts))
+
+
+def _run_dedup(ctx, scale, texts):
+    from src.preprocess.dedup import find_duplicates
+    groups, _ = find_duplicates(texts)
+    return len(groups)
+
+
+def _setup_vector_index(ctx, scale):
+    # 随机单位向量 (与 MiniLM 同为 384 维)，只测索引本身，不跑嵌入模型
+    import numpy as np
+    from src.database import vector_index
+    vector_index.VECTOR_INDEX_DIR = tempfile.mkdtemp(prefix="vector_index_", dir=ctx.workdir)
+    rng = np.random.RandomState(42)
+    vectors = rng.standard_normal((scale, 384)).astype(np.float32)
+    ids = np.column_stack([np.full(scale, BENCH_APPID), np.arange(scale)])
+    index = vector_index.build_index("bench", vectors, ids)
+    return index, rng
+
+
+def _run_vector_search(ctx, scale, state):
+    index, rng = state
+    hits, _ = index.search(rng.standard_normal(384), top_k=10)
+    return len(hits)
+
+
+def _setup_catalog_features(ctx, scale):
+    rng = random.Random(42)
+    return [{
+        "base_score": rng.choice([98, 88, 85, 82, 60, 30, 10, 5, 50]),
+        "opt_mean": rng.random(),
+        "value_mean": rng.random() if rng.random() < 0.9 else None,
+        "is_paid": rng.random() < 0.8,
+        "refund_rate": rng.random() if rng.random() < 0.95 else None,
+        "flaw": rng.random() < 0.2,
+    } for _ in range(scale)]
+
+
+def _run_catalog_scoring(ctx, scale, features_list):
+    from src.analysis.risk_model import score_feature_list
+    return len(score_feature_list(features_list)["score"])
+
+
+def _setup_frame(ctx, scale):
+    return synthetic_frame(scale)
+
+
+def _run_playtime_cohorts(ctx, scale, df):
+    from src.analysis import playtime_cohorts
+    index = playtime_cohorts.build_cohort_index(df)
+    playtime_cohorts.boundary_cohorts(index)
+    playtime_cohorts.quantile_cohorts(index, 10)
+    playtime_cohorts.refund_window_stats(index)
+    return len(df)
+
+
+def _run_bertopic(ctx, scale, texts):
+    from src.analysis.topic_modeler import analyze_with_bertopic
+    analyze_with_bertopic(pd.Series(texts))
+    return len(texts)
+
+
+def _setup_analysis(ctx, scale):
+    ctx.point_crawler_at_stub()
+    return synthetic_frame(scale)
+
+
+def _game_info():
+    return {"name": "Bench Game", "price": "¥ 98.00"}
+
+
+def _run_analysis_cold(ctx, scale, df):
+    from src.analysis.analysis_manager import get_analysis_results
+    ctx.fresh_analysis_dir()
+    get_analysis_results(BENCH_APPID, df, _game_info(), {"review_score_desc": "Very Positive"}, True, "positive")
+    return len(df)
+
+
+def _setup_analysis_warm(ctx, scale):
+    from src.analysis.analysis_manager import get_analysis_results
+    df = _setup_analysis(ctx, scale)
+    ctx.fresh_analysis_dir()
+    get_analysis_results(BENCH_APPID, df, _game_info(), {"review_score_desc": "Very Positive"}, True, "positive")
+    return df
+
+
+def _run_analysis_warm(ctx, scale, df):
+    from src.analysis.analysis_manager import get_analysis_results
+    get_analysis_results(BENCH_APPID, df, _game_info(), {"review_score_desc": "Very Positive"}, False, "positive")
+    return len(df)
+
+
+# name -> (setup, run, 是否受 --max-model-scale 限制, 是否与规模无关)
+STAGES = {
+    "synthetic_generate":   (_setup_none, _run_generate, False, False),
+    "fetch_game_reviews":   (_setup_none, _run_fetch_reviews, True, True),
+    "review_cache_cold":    (_setup_cache_cold, _run_cache_cold, True, True),
+    "review_cache_warm":    (_setup_cache_warm, _run_cache_warm, False, False),
+    "review_page":          (_setup_cache_warm, _run_review_page, False, False),
+    "preprocess":           (_setup_texts, _run_preprocess, False, False),
+    "dedup":                (_setup_texts, _run_dedup, False, False),
+    "vector_search":        (_setup_vector_index, _run_vector_search, False, False),
+    "catalog_scoring":      (_setup_catalog_features, _run_catalog_scoring, False, False),
+    "playtime_cohorts":     (_setup_frame, _run_playtime_cohorts, False, False),
+    "analyze_batch":        (_setup_texts, _run_analyze_batch, True, False),
+    "analyze_with_bertopic": (_setup_texts, _run_bertopic, True, False),
+    "analysis_cold":        (_setup_analysis, _run_analysis_cold, True, False),
+    "analysis_warm":        (_setup_analysis_warm, _run_analysis_warm, True, False),
+}
+
+
+def run_stage(ctx, name, scale, repeats):
+    setup, run, _, _ = STAGES[name]
+    state = setup(ctx, scale)
+    latencies = []
+    items = 0
+    alloc_peak = 0
+    for _ in range(repeats):
+        tracemalloc.start()
+        start = time.perf_counter()
+        items = run(ctx, scale, state)
+        latencies.append(time.perf_counter() - start)
+        alloc_peak = max(alloc_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies.sort()
+    p50 = _percentile(latencies, 50)
+    return {
+        "stage": name,
+        "scale": scale,
+        "repeats": repeats,
+        "items": items,
+        "latency_ms": {
+            "min": round(latencies[0] * 1000, 3),
+            "p50": round(p50 * 1000, 3),
+            "p95": round(_percentile(latencies, 95) * 1000, 3),
+            "p99": round(_percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+        },
+        "throughput_per_s": round(items / p50, 1) if p50 > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "py_alloc_peak_mb": round(alloc_peak / (1024 * 1024), 2),
+    }
+
+
+def compare_reports(current, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    base_index = {(r["stage"], r["scale"]): r for r in baseline.get("results", [])}
+    print(f"\n📊 与 {baseline.get('commit', baseline_path)} 对比 (p50):")
+    for r in current["results"]:
+        old = base_index.get((r["stage"], r["scale"]))
+        if not old:
+            continue
+        old_p50, new_p50 = old["latency_ms"]["p50"], r["latency_ms"]["p50"]
+        ratio = new_p50 / old_p50 if old_p50 else float("inf")
+        print(f"  {r['stage']:<24} n={r['scale']:<8} {old_p50:>10.2f}ms -> {new_p50:>10.2f}ms  ({ratio:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Steam Review Radar 离线基准测试")
+    parser.add_argument("--scales", default="100,10000,1000000", help="逗号分隔的评论规模")
+    parser.add_argument("--stages", default=",".join(STAGES), help="逗号分隔的阶段名")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20, help="本地 Steam 替身的每请求延迟")
+    parser.add_argument("--corpus-size", type=int, default=10000, help="本地 Steam 替身的评论总数")
+    parser.add_argument("--max-model-scale", type=int, default=10000,
+                        help="涉及模型推理/爬取的阶段的最大规模 (1M 条推理不现实)")
+    parser.add_argument("--output", default=None, help="JSON 报告路径 (默认 benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="与之前的 JSON 报告对比")
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(",") if s]
+    stage_names = [s for s in args.stages.split(",") if s]
+    unknown = [s for s in stage_names if s not in STAGES]
+    if unknown:
+        parser.error(f"未知阶段: {', '.join(unknown)}")
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": [],
+        "skipped": [],
+    }
+
+    with BenchContext(args) as ctx:
+        for name in stage_names:
+            _, _, model_bound, scale_independent = STAGES[name]
+            stage_scales = [min(scales)] if scale_independent else scales
+            for scale in stage_scales:
+                if model_bound and scale > args.max_model_scale:
+                    report["skipped"].append({"stage": name, "scale": scale, "reason": "超过 --max-model-scale"})
+                    continue
+                print(f"⏱️ [Bench] {name} (n={scale}) ...")
+                try:
+                    result = run_stage(ctx, name, scale, args.repeats)
+                except Exception as e:
+                    # 缺少模型依赖等情况：记录并继续其余阶段
+                    print(f"⚠️ [Bench] {name} (n={scale}) 跳过: {e}")
+                    report["skipped"].append({"stage": name, "scale": scale, "reason": repr(e)})
+                    continue
+                print(f"   p50={result['latency_ms']['p50']}ms  p95={result['latency_ms']['p95']}ms  "
+                      f"吞吐={result['throughput_per_s']}/s  峰值RSS={result['peak_rss_mb']}MB")
+                report["results"].append(result)
+        report["stub_requests"] = ctx.server.request_count
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 [Bench] 报告已写入 {output}")
+
+    if args.compare:
+        compare_reports(report, args.compare)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+本地 Steam Store API 替身：appreviews / storesearch / appdetails。
+评论由 synthetic_reviews 按需生成，可配置每个请求的额外延迟。
+"""
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.synthetic_reviews import make_review
+
+
+class StubSteamServer:
+    """
+    用法:
+        with StubSteamServer(corpus_size=10000, latency_ms=50) as server:
+            os.environ["STEAM_STORE_BASE_URL"] = server.base_url
+    """
+    def __init__(self, corpus_size=10000, latency_ms=0, seed=42, host="127.0.0.1", port=0):
+        self.corpus_size = corpus_size
+        self.latency = latency_ms / 1000.0
+        self.seed = seed
+        self.request_count = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- 接口实现 ---
+    def _appreviews(self, appid, query):
+        # 与真实接口一致：每页最多 100 条
+        num_per_page = min(int(query.get("num_per_page", ["20"])[0]), 100)
+        review_type = query.get("review_type", ["all"])[0]
+        cursor = query.get("cursor", ["*"])[0]
+        position = 0 if cursor in ("*", "") else int(cursor)
+
+        summary = {
+            "num_reviews": 0,
+            "review_score_desc": "Very Positive",
+            "total_positive": int(self.corpus_size * 0.75),
+            "total_negative": self.corpus_size - int(self.corpus_size * 0.75),
+            "total_reviews": self.corpus_size,
+        }
+        reviews = []
+        while position < self.corpus_size and len(reviews) < num_per_page:
+            review = make_review(self.seed + appid, position)
+            position += 1
+            if review_type == "positive" and not review["voted_up"]:
+                continue
+            if review_type == "negative" and review["voted_up"]:
+                continue
+            reviews.append(review)
+        summary["num_reviews"] = len(reviews)
+        next_cursor = str(position) if position < self.corpus_size else ""
+        return {"success": 1, "query_summary": summary, "reviews": reviews, "cursor": next_cursor}
+
+    def _storesearch(self, query):
+        term = query.get("term", [""])[0]
+        return {"total": 1, "items": [{"id": 1000 + len(term), "name": term or "Stub Game", "tiny_image": ""}]}
+
+    def _appdetails(self, query):
+        appid = query.get("appids", ["0"])[0]
+        return {appid: {"success": True, "data": {
+            "name": f"Stub Game {appid}",
+            "is_free": False,
+            "price_overview": {"final_formatted": "¥ 98.00"},
+            "release_date": {"date": "2024 年 1 月 1 日"},
+            "developers": ["Stub Studio"],
+            "publishers": ["Stub Publisher"],
+            "short_description": "基准测试用的虚拟游戏。",
+            "header_image": "",
+        }}}
+
+    def _make_handler(server):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.request_count += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                parts = [p for p in parsed.path.split("/") if p]
+                if len(parts) == 2 and parts[0] == "appreviews":
+                    payload = server._appreviews(int(parts[1]), query)
+                elif parts == ["api", "storesearch"]:
+                    payload = server._storesearch(query)
+                elif parts == ["api", "appdetails"]:
+                    payload = server._appdetails(query)
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        return Handler
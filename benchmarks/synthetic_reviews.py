@@ -0,0 +1,73 @@
+"""
+可复现的合成评论语料 (中文 / 英文混合)。
+每条评论只由 (seed, index) 决定，不需要把整个语料放进内存，
+因此 100 万条规模也可以按页按需生成。
+"""
+import random
+
+BASE_TIMESTAMP = 1609459200  # 2021-01-01
+TIME_SPAN_SECONDS = 4 * 365 * 24 * 3600
+
+ZH_POSITIVE = [
+    "玩法很有趣，越玩越上头", "画面很精美，音乐也很棒", "剧情很感人，结局哭了",
+    "运行很流畅，没有遇到卡顿", "价格很良心，打折入手血赚", "boss 设计很有挑战性",
+    "联机和朋友一起玩很开心", "美术风格独特，每一帧都能当壁纸",
+]
+ZH_NEGATIVE = [
+    "优化太差了，掉帧严重", "服务器经常连接失败", "闪退好几次，存档也坏了",
+    "价格太贵，内容太少", "剧情拖沓，后期很无聊", "bug 太多，打不开游戏",
+    "数值平衡很差，后期全是重复劳动", "客服不处理退款",
+]
+EN_POSITIVE = [
+    "Great gameplay loop, easy to lose hours", "Beautiful art and soundtrack",
+    "Runs smoothly even on old hardware", "Worth every penny", "The story hit hard",
+]
+EN_NEGATIVE = [
+    "Crashes on startup", "Terrible optimization, constant stutter",
+    "Servers are always down", "Overpriced for the content", "Too many bugs to enjoy",
+]
+SPAM = ["666", "好玩", "yyds", "10/10", "⣿⣿⣿⣿⣿⣿⣿⣿"]
+
+
+def make_review(seed, index, positive_ratio=0.75):
+    """生成第 index 条评论 (Steam appreviews 接口的单条 JSON 结构)"""
+    rng = random.Random(seed * 1_000_003 + index)
+    voted_up = rng.random() < positive_ratio
+    english = rng.random() < 0.2
+
+    if rng.random() < 0.05:
+        text = rng.choice(SPAM)
+    else:
+        if english:
+            pool = EN_POSITIVE if voted_up else EN_NEGATIVE
+            sep = ". "
+        else:
+            pool = ZH_POSITIVE if voted_up else ZH_NEGATIVE
+            sep = "，"
+        text = sep.join(rng.choice(pool) for _ in range(rng.randint(1, 6)))
+
+    # 差评集中在短时长 (模拟退款窗口)，好评时长分布更长尾
+    playtime = int(rng.expovariate(1 / (900 if voted_up else 240)))
+    return {
+        "recommendationid": str(seed * 10_000_000 + index),
+        "author": {
+            "steamid": str(76561198000000000 + index),
+            "avatar": "",
+            "playtime_at_review": playtime,
+        },
+        "language": "english" if english else "schinese",
+        "review": text,
+        "voted_up": voted_up,
+        "votes_up": int(rng.paretovariate(1.2)) - 1,
+        "timestamp_created": BASE_TIMESTAMP + rng.randrange(TIME_SPAN_SECONDS),
+    }
+
+
+def iter_reviews(seed, count, positive_ratio=0.75):
+    for index in range(count):
+        yield make_review(seed, index, positive_ratio)
+
+
+def make_texts(seed, count):
+    """只取评论正文 (用于情感分析 / 主题模型阶段)"""
+    return [review["review"] for review in iter_reviews(seed, count)]
@@ -1,44 +1,280 @@
 import os
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 # 导入需要调用的分析函数
 from src.analysis.topic_modeler import analyze_with_bertopic
-from src.analysis.risk_model import calculate_recommend_score
+from src.analysis.semantic_search import publish_appid_index
+from src.analysis.risk_model import extract_score_features, recommend_from_features
+from src.analysis.review_aggregates import ReviewAggregates
+from src.analysis.leaderboard import update_game as update_leaderboard
 # 【加回】导入时序分析爬虫
 from src.crawler.steam_api_crawler import fetch_data_for_timeseries 
+from src.monitoring.metrics import timed, record_cache, register_queue
+from src.monitoring import admission
+from src.database.catalog import get_catalog_entry
+from src.preprocess.text_cleaner import ensure_preprocessed
+from src.analysis.playtime_cohorts import build_cohort_index, boundary_cohorts, save_cohort_index, load_cohort_index
 
 # 定义缓存目录
 ANALYSIS_CACHE_DIR = "static/analysis_cache"
 os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
 
-def _calculate_playtime_sentiment(df):
+# 词云最多保留的词数 (按权重取前 N)
+WORD_CLOUD_TOP_N = 150
+
+# 过载降级时推迟的分析任务 (单线程，以后台优先级排队，不与前台请求抢名额)
+_deferred_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deferred-analysis")
+_deferred = set()
+_deferred_lock = threading.Lock()
+register_queue("deferred_analysis", lambda: len(_deferred))
+
+def _write_json(path, data):
+    """
+    原子写入 JSON 缓存：先写临时文件再替换，
+    后台刷新时并发读取的请求不会读到写了一半的文件。
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _compact_word_data(word_data, top_n=WORD_CLOUD_TOP_N):
+    """
+    将 BERTopic 输出的词云数据 (每个主题各 20 个词的 dict 列表)
+    合并去重并压缩为平行数组:
+    {"names": [...], "values": [...], "topics": [[topic_id, ...], ...]}
+    同一个词出现在多个主题时取最大权重，并记录所有相关主题。
+    """
+    merged = {}
+    for item in word_data:
+        name = item["name"]
+        entry = merged.get(name)
+        if entry is None:
+            merged[name] = [item["value"], [item["topic_id"]]]
+        else:
+            entry[0] = max(entry[0], item["value"])
+            if item["topic_id"] not in entry[1]:
+                entry[1].append(item["topic_id"])
+
+    top_words = sorted(merged.items(), key=lambda kv: kv[1][0], reverse=True)[:top_n]
+    return {
+        "names": [name for name, _ in top_words],
+        "values": [entry[0] for _, entry in top_words],
+        "topics": [entry[1] for _, entry in top_words]
+    }
+
+
+def _topics_cache_file(appid, review_type):
+    suffix = "pos" if review_type == "positive" else "neg"
+    return os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_{suffix}_topics.json")
+
+
+def load_word_cloud(appid, review_type):
+    """
+    读取指定视图的压缩词云数据 (供 /word_data 接口使用)。
+    返回: (word_cloud_dict, mtime)；缓存不存在时返回 (None, None)
+    """
+    topic_cache_file = _topics_cache_file(appid, review_type)
+    if not os.path.exists(topic_cache_file):
+        return None, None
+    try:
+        mtime = os.path.getmtime(topic_cache_file)
+        with open(topic_cache_file, 'r', encoding='utf-8') as f:
+            topic_data = json.load(f)
+    except Exception as e:
+        print(f"❌ [AnalysisManager] 读取词云缓存失败: {e}")
+        return None, None
+    # 兼容旧缓存：只有 word_data 时现场压缩
+    word_cloud = topic_data.get("word_cloud") or _compact_word_data(topic_data.get("word_data", []))
+    return word_cloud, mtime
+
+def load_stored_artifacts(appid):
+    """
+    读取对比视图需要的已缓存分析结果 (推荐分、雷达、玩家体验阶段、时序)。
+    任一文件缺失或损坏时返回 None，调用方应走完整的分析流程。
+    """
+    artifacts = {}
+    for key in ("score", "radar", "playtime_sentiment", "timeseries"):
+        path = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                artifacts[key] = json.load(f)
+        except (OSError, ValueError):
+            return None
+    return artifacts
+
+def _review_topics(reviews, doc_topics):
+    """
+    每条评论 (按作者 steamid，同一游戏每人只有一条评论) 的主题编号。
+    被折叠的重复评论沿用代表评论的主题；垃圾评论和离群评论不记录。
+    """
+    if doc_topics.empty:
+        return {}
+    topics = doc_topics.reindex(reviews.index).to_numpy(dtype=float)
+    if "dup_of" in reviews.columns:
+        # dup_of 是代表评论的作者 steamid：按它取代表评论的主题
+        by_author = pd.Series(topics, index=reviews["author_name"].astype(str))
+        by_author = by_author[~by_author.index.duplicated()]
+        topics = by_author.reindex(reviews["dup_of"]).to_numpy(dtype=float)
+    elif "dup_group" in reviews.columns:
+        # 旧缓存: dup_group 是代表评论在同一次爬取 (同一极性) 中的位置
+        groups = reviews["dup_group"].to_numpy()
+        topics = np.where(groups >= 0, topics[np.clip(groups, 0, len(topics) - 1)], np.nan)
+    return {
+        str(author): int(topic)
+        for author, topic in zip(reviews["author_name"], topics)
+        if not np.isnan(topic) and topic >= 0
+    }
+
+def _topic_input(reviews):
+    """
+    BERTopic 的输入 (预处理好的 text_topic 列)：有去重信息时只用代表评论
+    (dup_weight > 0) 并带上权重，旧缓存没有去重列时退回全部评论。
+    """
+    if "dup_weight" in reviews.columns:
+        representatives = reviews[reviews["dup_weight"] > 0]
+        return representatives["text_topic"], representatives["dup_weight"]
+    return reviews["text_topic"], None
+
+def _publish_search_index(appid, parts):
+    """
+    用 BERTopic 已算好的句向量发布语义搜索索引，替换旧索引。
+    :param parts: [(评论 DataFrame, 主题输入 Series, 与之逐行对应的句向量)]
+    """
+    authors, vectors = [], []
+    for reviews, texts, embeddings in parts:
+        if embeddings is None or len(texts) == 0:
+            continue
+        authors.extend(reviews.loc[texts.index, "author_name"])
+        vectors.append(np.asarray(embeddings, dtype=np.float32))
+    if not vectors:
+        return
+    try:
+        publish_appid_index(appid, authors, np.concatenate(vectors))
+    except Exception as e:
+        print(f"❌ [AnalysisManager] 语义搜索索引发布失败: {e}")
+
+def _cohort_index_file(appid):
+    return os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_playtime_cohorts.npz")
+
+
+def store_playtime_cohorts(appid, df):
+    """建立并保存游玩时长前缀和索引 (见 playtime_cohorts)，返回索引"""
+    index = build_cohort_index(df)
+    save_cohort_index(_cohort_index_file(appid), index)
+    return index
+
+
+def load_playtime_cohorts(appid):
+    """读取游玩时长前缀和索引；尚未建立时返回 None"""
+    return load_cohort_index(_cohort_index_file(appid))
+
+
+def _calculate_playtime_sentiment(appid, df):
     """
     【保留】分析一：计算玩家体验阶段
+    同时保存前缀和索引，自定义分段 / 分位数 / 退款窗口查询直接复用，不修改 df。
     """
     print("  ... 正在分析 [玩家体验阶段]...")
     try:
-        df['avg_sentiment'] = df[[
-            'score_gameplay', 'score_visuals', 'score_story', 'score_opt', 'score_value'
-        ]].mean(axis=1)
-        bins = [-1, 120, 600, 1200, 999999] 
-        labels = ['0-2h (初见)', '2-10h (中期)', '10-20h (深入)', '20h+ (老手)']
-        df['playtime_bin'] = pd.cut(pd.to_numeric(df['playtime_at_review']), bins=bins, labels=labels, right=True)
-        grouped = df.groupby(['playtime_bin', 'voted_up'])['avg_sentiment'].mean().unstack(fill_value=0.5)
-        grouped = grouped.rename(columns={True: 'positive', False: 'negative'})
-        if 'positive' not in grouped: grouped['positive'] = 0.5
-        if 'negative' not in grouped: grouped['negative'] = 0.5
-        data = {
-            'labels': labels,
-            'positive_scores': [round(s * 100, 1) for s in grouped['positive']],
-            'negative_scores': [round(s * 100, 1) for s in grouped['negative']]
-        }
-        return data
+        return boundary_cohorts(store_playtime_cohorts(appid, df))
     except Exception as e:
         print(f"❌ [AnalysisManager] 玩家体验阶段分析失败: {e}")
         return {}
 
 
+def _score_and_radar(appid, df, game_info, review_summary, neg_topic_map):
+    """推荐指数和情感雷达 (只用聚合量，不需要跑模型)"""
+    print("  ... 正在计算 [推荐指数]...")
+    catalog_entry = get_catalog_entry(appid)
+    if catalog_entry and catalog_entry.get("price_cents") is not None:
+        game_info = {**game_info, "price_cents": catalog_entry["price_cents"]}
+    # 入库时已流式累加的聚合量 (大样本入库时 df 只是其中的一部分)，旧缓存没有时由 df 现算
+    aggregates = ReviewAggregates.from_dict(review_summary["aggregates"]) if review_summary.get("aggregates") \
+        else ReviewAggregates.from_frame(df)
+    score_features = extract_score_features(df, game_info, neg_topic_map, review_summary, aggregates)
+    recommend_score, suggestion = recommend_from_features(score_features)
+
+    print("  ... 正在计算 [情感雷达]...")
+    radar_dimensions = {
+        "score_gameplay": "玩法性", "score_visuals": "画面/音乐", "score_story": "剧情叙事",
+        "score_opt": "优化/联机", "score_value": "性价比"
+    }
+    radar_values = []
+    indicator_config = []
+    for col, name in radar_dimensions.items():
+        avg_score = aggregates.mean(col, "positive")
+        radar_values.append(0 if avg_score is None else round(avg_score * 100, 1))
+        indicator_config.append({"name": name, "max": 100})
+    radar_data = {"indicator": indicator_config, "value": radar_values}
+    return score_features, recommend_score, suggestion, radar_data
+
+
+def _load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _defer(key, func, *args):
+    """把 func(*args) 交给后台线程按后台优先级执行 (同一 key 同时只排一次)"""
+    with _deferred_lock:
+        if key in _deferred:
+            return False
+        _deferred.add(key)
+    _deferred_executor.submit(_run_deferred, key, func, args)
+    return True
+
+
+def _run_deferred(key, func, args):
+    try:
+        with admission.request_context(admission.PRIORITY_BACKGROUND):
+            func(*args)
+    except Exception as e:
+        print(f"❌ [AnalysisManager] 推迟的任务 {key} 失败: {e}")
+    finally:
+        with _deferred_lock:
+            _deferred.discard(key)
+
+
+def _refresh_timeseries(appid):
+    """时序爬取 (占用 timeseries 阶段的名额) 并写入缓存"""
+    with admission.slot("timeseries"), timed("timeseries_crawl"):
+        time_series_data = fetch_data_for_timeseries(appid)
+    _write_json(os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_timeseries.json"), time_series_data)
+
+
+def _degraded_results(appid, df, game_info, review_summary, is_fresh_fetch, review_type):
+    """
+    降级模式 (负载过高)：立即返回推荐指数、情感雷达和玩家体验阶段，主题沿用已有缓存 (没有时为空)；
+    BERTopic 和时序爬取连同完整分析推迟到后台。
+    此时的推荐指数缺少本次差评主题的硬伤检查，只用于展示，不写分数缓存和排行榜。
+    """
+    print(f"🚦 [AnalysisManager] 负载过高，先返回 {appid} 的基础结果，主题和时序分析推迟到后台")
+    record_cache("analysis", "degraded")
+    _defer(("analysis", appid), get_analysis_results, appid, df, game_info, review_summary, is_fresh_fetch, review_type)
+
+    neg_topic_map = _load_json(_topics_cache_file(appid, "negative"), {}).get("topic_map", {})
+    current_topic_map = neg_topic_map if review_type == "negative" else \
+        _load_json(_topics_cache_file(appid, "positive"), {}).get("topic_map", {})
+    _, recommend_score, suggestion, radar_data = _score_and_radar(appid, df, game_info, review_summary, neg_topic_map)
+    time_series_data = _load_json(os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_timeseries.json"), {})
+    return {
+        "recommend_score": recommend_score, "suggestion": suggestion,
+        "topic_map_json": json.dumps(current_topic_map, ensure_ascii=False),
+        "current_topic_map": current_topic_map,
+        "radar_json": json.dumps(radar_data, ensure_ascii=False),
+        "playtime_sentiment_json": json.dumps(_calculate_playtime_sentiment(appid, df), ensure_ascii=False),
+        "time_series_json": json.dumps(time_series_data, ensure_ascii=False),
+        "degraded": True
+    }
+
+
 def get_analysis_results(appid, df, game_info, review_summary, is_fresh_fetch, review_type):
     """
     协调所有分析并使用文件缓存。
@@ -46,79 +282,82 @@ def get_analysis_results(appid, df, game_info, review_summary, is_fresh_fetch, r
     
     # --- 1. 定义所有缓存文件的路径 ---
     score_cache_file = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_score.json")
-    pos_topics_cache_file = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_pos_topics.json")
-    neg_topics_cache_file = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_neg_topics.json")
+    pos_topics_cache_file = _topics_cache_file(appid, "positive")
+    neg_topics_cache_file = _topics_cache_file(appid, "negative")
     radar_cache_file = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_radar.json")
     playtime_sentiment_cache_file = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_playtime_sentiment.json")
     # 【加回】时序图缓存
     time_series_cache_file = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_timeseries.json")
+    # 每条评论的主题编号 (供批量导出使用)
+    review_topics_cache_file = os.path.join(ANALYSIS_CACHE_DIR, f"{appid}_review_topics.json")
     
     # --- 2. 检查是否需要重新计算 ---
+    # 时序缓存不在其中：它单独爬取，缺失时只补爬时序，不重跑 BERTopic
     files_to_check = [score_cache_file, pos_topics_cache_file, neg_topics_cache_file, 
-                      radar_cache_file, playtime_sentiment_cache_file, 
-                      time_series_cache_file] # <-- 【加回】
+                      radar_cache_file, playtime_sentiment_cache_file]
+    timeseries_deferred = False
     
-    if is_fresh_fetch or not all(os.path.exists(f) for f in files_to_check):
+    needs_update = is_fresh_fetch or not all(os.path.exists(f) for f in files_to_check)
+    if needs_update and admission.should_degrade():
+        return _degraded_results(appid, df, game_info, review_summary, is_fresh_fetch, review_type)
+
+    if needs_update:
         
         print(f"♻️ [AnalysisManager] 缓存丢失或数据已更新。正在运行 *所有* 分析...")
+        record_cache("analysis", "miss")
+        # 旧缓存没有预处理列时现场补齐 (新爬取的数据入库时已处理)
+        df = ensure_preprocessed(df)
         
         positive_reviews = df[df["voted_up"] == True]
         negative_reviews = df[df["voted_up"] == False]
 
-        # A: 差评主题 (BERTopic)
-        print("  ... 正在分析 [差评] 主题...")
-        neg_topic_map, neg_word_data = analyze_with_bertopic(negative_reviews["content"])
-        with open(neg_topics_cache_file, 'w', encoding='utf-8') as f:
-            json.dump({"topic_map": neg_topic_map, "word_data": neg_word_data}, f, ensure_ascii=False)
-        
-        # B: 好评主题 (BERTopic)
-        print("  ... 正在分析 [好评] 主题...")
-        pos_topic_map, pos_word_data = analyze_with_bertopic(positive_reviews["content"])
-        with open(pos_topics_cache_file, 'w', encoding='utf-8') as f:
-            json.dump({"topic_map": pos_topic_map, "word_data": pos_word_data}, f, ensure_ascii=False)
-
-        # C: 推荐分数
-        print("  ... 正在计算 [推荐指数]...")
-        current_topic_map = pos_topic_map if review_type == "positive" else neg_topic_map
-        recommend_score, suggestion = calculate_recommend_score(df, game_info, current_topic_map, review_summary)
-        with open(score_cache_file, 'w', encoding='utf-8') as f:
-            json.dump({"score": recommend_score, "suggestion": suggestion}, f, ensure_ascii=False)
+        try:
+            # BERTopic 有独立的并发预算，等不到名额时降级
+            with admission.slot("topics"):
+                # A: 差评主题 (BERTopic)
+                print("  ... 正在分析 [差评] 主题...")
+                neg_input = _topic_input(negative_reviews)
+                neg_topic_map, neg_word_data, neg_doc_topics, neg_embeddings = analyze_with_bertopic(*neg_input)
+                _write_json(neg_topics_cache_file, {"topic_map": neg_topic_map, "word_cloud": _compact_word_data(neg_word_data)})
+
+                # B: 好评主题 (BERTopic)
+                print("  ... 正在分析 [好评] 主题...")
+                pos_input = _topic_input(positive_reviews)
+                pos_topic_map, pos_word_data, pos_doc_topics, pos_embeddings = analyze_with_bertopic(*pos_input)
+                _write_json(pos_topics_cache_file, {"topic_map": pos_topic_map, "word_cloud": _compact_word_data(pos_word_data)})
+        except admission.AdmissionRejected:
+            return _degraded_results(appid, df, game_info, review_summary, is_fresh_fetch, review_type)
+
+        review_topics = _review_topics(negative_reviews, neg_doc_topics)
+        review_topics.update(_review_topics(positive_reviews, pos_doc_topics))
+        _write_json(review_topics_cache_file, review_topics)
+        _publish_search_index(appid, [
+            (negative_reviews, neg_input[0], neg_embeddings),
+            (positive_reviews, pos_input[0], pos_embeddings),
+        ])
+
+        # C: 推荐分数 (聚合特征一并缓存，供排行榜批量打分)
+        # 硬伤关键词只在差评主题中检查，分数缓存不再取决于先访问的是哪个视图
+        score_features, recommend_score, suggestion, radar_data = _score_and_radar(
+            appid, df, game_info, review_summary, neg_topic_map
+        )
+        _write_json(score_cache_file, {"score": recommend_score, "suggestion": suggestion, "features": score_features})
+        update_leaderboard(appid, score_features)
 
         # D: 雷达图
-        print("  ... 正在计算 [情感雷达]...")
-        # ( ... 雷达图计算逻辑 ... )
-        radar_dimensions = {
-            "score_gameplay": "玩法性", "score_visuals": "画面/音乐", "score_story": "剧情叙事",
-            "score_opt": "优化/联机", "score_value": "性价比"
-        }
-        radar_values = []
-        indicator_config = []
-        if not positive_reviews.empty:
-            for col, name in radar_dimensions.items():
-                if col in positive_reviews.columns:
-                    avg_score = positive_reviews[col].mean() * 100 
-                    radar_values.append(round(avg_score, 1))
-                else: radar_values.append(0)
-                indicator_config.append({"name": name, "max": 100})
-        else:
-             for col, name in radar_dimensions.items():
-                radar_values.append(0)
-                indicator_config.append({"name": name, "max": 100})
-        radar_data = {"indicator": indicator_config, "value": radar_values}
-        with open(radar_cache_file, 'w', encoding='utf-8') as f:
-            json.dump(radar_data, f, ensure_ascii=False)
+        _write_json(radar_cache_file, radar_data)
 
         # E: 玩家体验阶段
-        playtime_sentiment_data = _calculate_playtime_sentiment(df)
-        with open(playtime_sentiment_cache_file, 'w', encoding='utf-8') as f:
-            json.dump(playtime_sentiment_data, f, ensure_ascii=False)
+        playtime_sentiment_data = _calculate_playtime_sentiment(appid, df)
+        _write_json(playtime_sentiment_cache_file, playtime_sentiment_data)
             
         # F: 【加回】情感时序分析
         print("  ... 正在分析 [情感时序]...")
         try:
-            time_series_data = fetch_data_for_timeseries(appid) 
-            with open(time_series_cache_file, 'w', encoding='utf-8') as f:
-                json.dump(time_series_data, f, ensure_ascii=False)
+            _refresh_timeseries(appid)
+        except admission.AdmissionRejected:
+            print("  ... 时序爬取繁忙，推迟到后台")
+            timeseries_deferred = True
         except Exception as e:
             print(f"❌ [AnalysisManager] 情感时序分析失败: {e}")
 
@@ -126,6 +365,7 @@ def get_analysis_results(appid, df, game_info, review_summary, is_fresh_fetch, r
 
     else:
         print(f"✅ [AnalysisManager] 正在从缓存文件加载所有分析结果...")
+        record_cache("analysis", "hit")
 
     # --- 4. 组装返回结果 ---
     results = {}
@@ -136,11 +376,10 @@ def get_analysis_results(appid, df, game_info, review_summary, is_fresh_fetch, r
         results["recommend_score"] = score_data['score']
         results["suggestion"] = score_data['suggestion']
         
-        # B: 加载当前视图的主题 (词云 + 列表)
+        # B: 加载当前视图的主题列表 (词云数据由 /word_data 接口单独提供)
         topic_cache_file = pos_topics_cache_file if review_type == "positive" else neg_topics_cache_file
         with open(topic_cache_file, 'r', encoding='utf-8') as f:
             topic_data = json.load(f)
-        results["word_data_json"] = json.dumps(topic_data['word_data'], ensure_ascii=False)
         results["topic_map_json"] = json.dumps(topic_data['topic_map'], ensure_ascii=False)
         results["current_topic_map"] = topic_data['topic_map']
         
@@ -153,14 +392,17 @@ def get_analysis_results(appid, df, game_info, review_summary, is_fresh_fetch, r
             results["playtime_sentiment_json"] = json.dumps(json.load(f), ensure_ascii=False)
             
         # E: 【加回】加载时序数据
-        with open(time_series_cache_file, 'r', encoding='utf-8') as f:
-            results["time_series_json"] = json.dumps(json.load(f), ensure_ascii=False)
+        # 时序爬取被推迟或之前失败 (缓存缺失) 时交给后台补爬，本次结果标记为降级，不进渲染缓存
+        if timeseries_deferred or not os.path.exists(time_series_cache_file):
+            _defer(("timeseries", appid), _refresh_timeseries, appid)
+            results["degraded"] = True
+        results["time_series_json"] = json.dumps(_load_json(time_series_cache_file, {}), ensure_ascii=False)
             
     except Exception as e:
         print(f"❌ [AnalysisManager] 从缓存加载分析结果时失败: {e}")
         results = {
             "recommend_score": 50, "suggestion": "分析缓存读取失败。",
-            "word_data_json": "[]", "topic_map_json": "{}",
+            "topic_map_json": "{}",
             "current_topic_map": {}, 
             "radar_json": "{}",
             "playtime_sentiment_json": "{}",
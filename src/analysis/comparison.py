@@ -0,0 +1,189 @@
+"""
+多游戏对比。
+
+已有分析缓存的游戏直接读取缓存文件；缺失的游戏提交到有界线程池，
+并行走完整流程 (get_reviews_with_cache -> get_analysis_results)，
+总耗时约等于最慢的那个未缓存游戏，而不是逐个相加。
+同一 appid 同时只计算一次 (多个对比请求共享同一个任务)。
+热门游戏的预热使用单独的单线程池，以后台优先级执行，不占用对比请求的线程；
+对比请求也不会挂到正在执行的预热任务上 (那样会以后台优先级排队)。
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from src.analysis.analysis_manager import get_analysis_results, load_stored_artifacts
+from src.crawler.steam_api_crawler import get_game_details
+from src.database.cache_manager import (
+    get_reviews_with_cache, get_data_version, get_cache_state, schedule_refresh, record_access
+)
+from src.monitoring.metrics import register_queue, record_cache
+from src.monitoring import admission
+
+COMPARE_MAX_GAMES = 10
+# 并行计算的游戏数上限 (爬取和推理都很重，不宜过多)
+COMPARE_MAX_WORKERS = int(os.getenv("COMPARE_MAX_WORKERS", "4"))
+# 整个对比请求等待未缓存游戏的最长时间
+COMPARE_TIMEOUT_SECONDS = 300
+
+_compare_executor = ThreadPoolExecutor(max_workers=COMPARE_MAX_WORKERS, thread_name_prefix="compare")
+_prewarm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prewarm")
+# appid -> Future，前台对比任务和后台预热任务分开记录
+_inflight = {}
+_prewarming = {}
+# 可重入：任务已完成时 add_done_callback 会在持锁的当前线程里立即回调
+_inflight_lock = threading.RLock()
+register_queue("compare", lambda: len(_inflight))
+register_queue("prewarm", lambda: len(_prewarming))
+
+
+def parse_appids(raw, limit=COMPARE_MAX_GAMES):
+    """"a,b,c" -> 去重后的 appid 列表；格式错误或超过 limit 个 (None 为不限) 时抛出 ValueError"""
+    appids = []
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit():
+            raise ValueError(f"无效的 appid: {part}")
+        if int(part) not in appids:
+            appids.append(int(part))
+    if not appids:
+        raise ValueError("请至少提供一个 appid")
+    if limit is not None and len(appids) > limit:
+        raise ValueError(f"最多同时对比 {limit} 个游戏")
+    return appids
+
+
+def _analysis_refresher(appid):
+    """后台刷新评论后重算分析缓存 (见 cache_manager.schedule_refresh)"""
+    def refresh(df, review_summary):
+        info = get_game_details(appid)
+        if info:
+            get_analysis_results(appid, df, info, review_summary, True, "positive")
+    return refresh
+
+
+def _compute_game(appid, priority=admission.PRIORITY_DEFAULT):
+    """未缓存的游戏：走完整流程后读取分析结果"""
+    game_info = get_game_details(appid)
+    if not game_info:
+        raise LookupError("未找到该游戏")
+    with admission.request_context(priority):
+        df, is_fresh_fetch, review_summary = get_reviews_with_cache(
+            appid, game_info.get("name"), on_refreshed=_analysis_refresher(appid)
+        )
+        if df.empty:
+            raise LookupError("未获取到评论数据")
+        results = get_analysis_results(appid, df, game_info, review_summary, is_fresh_fetch, "positive")
+    if results.get("degraded"):
+        raise LookupError("服务器繁忙，分析已推迟到后台")
+    artifacts = load_stored_artifacts(appid)
+    if artifacts is None:
+        raise LookupError("分析结果缺失")
+    return artifacts
+
+
+def _submit(appid):
+    """前台对比请求：同一 appid 共享同一个前台任务"""
+    with _inflight_lock:
+        future = _inflight.get(appid)
+        if future is None:
+            future = _compare_executor.submit(_compute_game, appid)
+            _inflight[appid] = future
+            future.add_done_callback(lambda _: _discard_inflight(_inflight, appid))
+        return future
+
+
+def _submit_prewarm(appid):
+    """后台预热：该 appid 已在计算 (前台或预热) 时不重复提交，返回是否提交"""
+    with _inflight_lock:
+        if appid in _inflight or appid in _prewarming:
+            return False
+        future = _prewarm_executor.submit(_compute_game, appid, admission.PRIORITY_BACKGROUND)
+        _prewarming[appid] = future
+        future.add_done_callback(lambda _: _discard_inflight(_prewarming, appid))
+        return True
+
+
+def _discard_inflight(tasks, appid):
+    with _inflight_lock:
+        tasks.pop(appid, None)
+
+
+def prewarm_games(appids):
+    """在独立的后台线程里预先计算尚未缓存的游戏，返回提交的数量"""
+    submitted = 0
+    for appid in appids:
+        if not get_data_version(appid) and _submit_prewarm(appid):
+            submitted += 1
+    if submitted:
+        print(f"🔥 [Compare] 已提交 {submitted} 个热门游戏的预热任务")
+    return submitted
+
+
+def _game_entry(appid, artifacts):
+    score = artifacts["score"]
+    return {
+        "appid": appid,
+        "name": (score.get("features") or {}).get("name") or str(appid),
+        "score": score.get("score"),
+        "suggestion": score.get("suggestion"),
+        "radar": artifacts["radar"],
+        "playtime_sentiment": artifacts["playtime_sentiment"],
+        "timeseries": artifacts["timeseries"],
+    }
+
+
+def _align_trends(games):
+    """把各游戏的月度好差评数对齐到同一条月份轴上，换算为好评率 (%)"""
+    months = sorted({m for g in games if "timeseries" in g for m in g["timeseries"].get("dates", [])})
+    series = []
+    for game in games:
+        if "timeseries" not in game:
+            continue
+        ts = game["timeseries"]
+        by_month = {
+            m: (p, n) for m, p, n in zip(ts.get("dates", []), ts.get("positive_counts", []), ts.get("negative_counts", []))
+        }
+        rates = []
+        for month in months:
+            p, n = by_month.get(month, (0, 0))
+            rates.append(round(p * 100 / (p + n), 1) if p + n else None)
+        series.append({"appid": game["appid"], "name": game["name"], "positive_rate": rates})
+    return {"months": months, "series": series}
+
+
+def compare_games(appids):
+    """
+    返回: {"games": [...按传入顺序], "trend": 对齐后的月度好评率}
+    计算失败的游戏只带 appid / error 字段。
+    """
+    entries = {}
+    pending = {}
+    for appid in appids:
+        artifacts = load_stored_artifacts(appid) if get_data_version(appid) else None
+        if artifacts is not None:
+            record_cache("compare", "hit")
+            record_access(appid)
+            entries[appid] = _game_entry(appid, artifacts)
+            if get_cache_state(appid) == "stale":
+                schedule_refresh(appid, on_refreshed=_analysis_refresher(appid))
+        else:
+            record_cache("compare", "miss")
+            pending[appid] = _submit(appid)
+
+    if pending:
+        print(f"⚖️ [Compare] 并行计算 {len(pending)} 个未缓存的游戏 (最多 {COMPARE_MAX_WORKERS} 个同时进行)...")
+        wait(pending.values(), timeout=COMPARE_TIMEOUT_SECONDS)
+        for appid, future in pending.items():
+            if not future.done():
+                entries[appid] = {"appid": appid, "error": "计算超时，请稍后重试"}
+                continue
+            try:
+                entries[appid] = _game_entry(appid, future.result())
+            except Exception as e:
+                print(f"❌ [Compare] {appid} 计算失败: {e}")
+                entries[appid] = {"appid": appid, "error": str(e)}
+
+    games = [entries[appid] for appid in appids]
+    return {"games": games, "trend": _align_trends(games)}
@@ -0,0 +1,213 @@
+"""
+全目录推荐排行榜。
+
+首次查询时读取所有 {appid}_score.json 里的聚合特征，用 risk_model.score_catalog
+一次性向量化打分，并按 (分数降序, appid 升序) 排好序存放在 numpy 数组中；
+之后某个游戏重新分析时只在有序数组里删除旧位置、二分插入新位置。
+查询 (按档位 / 风险标记 / 最低分过滤) 直接在有序数组上做布尔掩码。
+
+每个 worker 进程各有一份索引。分数缓存只通过原子替换写入、淘汰时直接删除，
+都会改变缓存目录的修改时间；查询时发现目录变了就对比各分数文件的修改时间，
+只重新读取其他进程新增 / 更新的文件，并移除已被删除的游戏。
+"""
+import os
+import json
+import threading
+import numpy as np
+from src.analysis.risk_model import score_feature_list, TIERS, RISK_FLAGS, risk_names
+
+LEADERBOARD_PAGE_MAX_SIZE = 200
+SCORE_FILE_SUFFIX = "_score.json"
+
+_lock = threading.Lock()
+_loaded = False
+# 以下数组等长，按 _keys 升序 (即分数降序) 排列
+_keys = np.empty(0, dtype=np.int64)
+_appids = np.empty(0, dtype=np.int64)
+_scores = np.empty(0, dtype=np.int64)
+_tiers = np.empty(0, dtype=np.int64)
+_flags = np.empty(0, dtype=np.int64)
+_names = {}
+# 上次同步时缓存目录的修改时间，以及各分数文件的 {appid: 修改时间}
+_dir_mtime = None
+_file_mtimes = {}
+
+
+def _sort_key(score, appid):
+    # 分数降序、同分按 appid 升序
+    return (100 - np.asarray(score, dtype=np.int64)) * (1 << 32) + np.asarray(appid, dtype=np.int64)
+
+
+def _cache_dir():
+    from src.analysis import analysis_manager
+    return analysis_manager.ANALYSIS_CACHE_DIR
+
+
+def _scan_score_files():
+    """返回 {appid: 分数文件修改时间}"""
+    mtimes = {}
+    try:
+        entries = list(os.scandir(_cache_dir()))
+    except OSError:
+        return mtimes
+    for entry in entries:
+        appid = entry.name[:-len(SCORE_FILE_SUFFIX)]
+        if not entry.name.endswith(SCORE_FILE_SUFFIX) or not appid.isdigit():
+            continue
+        try:
+            mtimes[int(appid)] = entry.stat().st_mtime_ns
+        except OSError:
+            continue  # 扫描期间被淘汰
+    return mtimes
+
+
+def _read_features(appid):
+    path = os.path.join(_cache_dir(), f"{appid}{SCORE_FILE_SUFFIX}")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("features")
+    except (OSError, ValueError):
+        return None
+
+
+def _load_catalog(mtimes):
+    """读取全部分数缓存并一次性打分 (调用方持有 _lock)"""
+    global _loaded, _keys, _appids, _scores, _tiers, _flags, _file_mtimes
+
+    appids, features_list = [], []
+    for appid in mtimes:
+        features = _read_features(appid)
+        # 旧缓存没有特征，下次重新分析后才会进入排行榜
+        if features:
+            appids.append(appid)
+            features_list.append(features)
+            _names[appid] = features.get("name", "")
+
+    if features_list:
+        result = score_feature_list(features_list)
+        appids = np.array(appids, dtype=np.int64)
+        order = np.argsort(_sort_key(result["score"], appids), kind="stable")
+        _appids = appids[order]
+        _scores = result["score"][order].astype(np.int64)
+        _tiers = result["tier"][order].astype(np.int64)
+        _flags = result["risk_flags"][order].astype(np.int64)
+        _keys = _sort_key(_scores, _appids)
+    _file_mtimes = mtimes
+    _loaded = True
+    print(f"🏆 [Leaderboard] 已为 {len(_appids)} 个游戏建立排行榜索引。")
+
+
+def _remove_locked(appid):
+    global _keys, _appids, _scores, _tiers, _flags
+    old = np.flatnonzero(_appids == appid)
+    if len(old):
+        _keys, _appids, _scores, _tiers, _flags = (
+            np.delete(a, old) for a in (_keys, _appids, _scores, _tiers, _flags)
+        )
+    _names.pop(appid, None)
+
+
+def _insert_locked(appid, features):
+    """删除旧位置，二分插入新位置"""
+    global _keys, _appids, _scores, _tiers, _flags
+    result = score_feature_list([features])
+    score = int(result["score"][0])
+    _remove_locked(appid)
+    key = int(_sort_key(score, appid))
+    pos = int(np.searchsorted(_keys, key))
+    _keys = np.insert(_keys, pos, key)
+    _appids = np.insert(_appids, pos, appid)
+    _scores = np.insert(_scores, pos, score)
+    _tiers = np.insert(_tiers, pos, int(result["tier"][0]))
+    _flags = np.insert(_flags, pos, int(result["risk_flags"][0]))
+    _names[appid] = features.get("name", "")
+
+
+def _ensure_loaded():
+    """首次查询时建立索引；之后缓存目录有变化时同步其他进程写入或淘汰的游戏 (调用方持有 _lock)"""
+    global _dir_mtime, _file_mtimes
+    try:
+        dir_mtime = os.stat(_cache_dir()).st_mtime_ns
+    except OSError:
+        dir_mtime = None
+    if _loaded and dir_mtime == _dir_mtime:
+        return
+    _dir_mtime = dir_mtime
+    mtimes = _scan_score_files()
+    if not _loaded:
+        _load_catalog(mtimes)
+        return
+    removed = set(_file_mtimes) - set(mtimes)
+    for appid in removed:
+        _remove_locked(appid)
+    changed = [appid for appid, mtime in mtimes.items() if _file_mtimes.get(appid) != mtime]
+    for appid in changed:
+        features = _read_features(appid)
+        if features:
+            _insert_locked(appid, features)
+        else:
+            _remove_locked(appid)
+    _file_mtimes = mtimes
+    if changed or removed:
+        print(f"🏆 [Leaderboard] 同步分数缓存: 更新 {len(changed)} 个，移除 {len(removed)} 个游戏。")
+
+
+def update_game(appid, features):
+    """某个游戏重新分析后，增量更新排行榜 (删除旧位置，二分插入新位置)"""
+    appid = int(appid)
+    with _lock:
+        _ensure_loaded()
+        _insert_locked(appid, features)
+
+
+def remove_game(appid):
+    """游戏的缓存被淘汰后从排行榜中移除"""
+    with _lock:
+        if _loaded:
+            _remove_locked(int(appid))
+
+
+def query_leaderboard(tier=None, risks=(), exclude_risks=(), min_score=None, ascending=False, limit=50, offset=0):
+    """
+    :param tier: 推荐档位名 (见 risk_model.TIERS)
+    :param risks: 必须带有的风险标记名 (见 risk_model.RISK_FLAGS)
+    :param exclude_risks: 不能带有的风险标记名
+    返回: (符合条件的总数, 当前页的游戏 dict 列表)
+    不认识的档位 / 风险名抛出 ValueError
+    """
+    if tier is not None and tier not in TIERS:
+        raise ValueError(f"未知档位: {tier}")
+    unknown = [r for r in list(risks) + list(exclude_risks) if r not in RISK_FLAGS]
+    if unknown:
+        raise ValueError(f"未知风险标记: {', '.join(unknown)}")
+    limit = max(1, min(int(limit), LEADERBOARD_PAGE_MAX_SIZE))
+    offset = max(0, int(offset))
+    required = sum(RISK_FLAGS[r] for r in risks)
+    excluded = sum(RISK_FLAGS[r] for r in exclude_risks)
+
+    with _lock:
+        _ensure_loaded()
+        appids, scores, tiers, flags = _appids, _scores, _tiers, _flags
+
+    mask = np.ones(len(appids), dtype=bool)
+    if tier is not None:
+        mask &= tiers == TIERS.index(tier)
+    if required:
+        mask &= (flags & required) == required
+    if excluded:
+        mask &= (flags & excluded) == 0
+    if min_score is not None:
+        mask &= scores >= int(min_score)
+    matched = np.flatnonzero(mask)
+    if ascending:
+        matched = matched[::-1]
+    page = matched[offset:offset + limit]
+
+    games = [{
+        "appid": int(appids[i]),
+        "name": _names.get(int(appids[i]), ""),
+        "score": int(scores[i]),
+        "tier": TIERS[int(tiers[i])],
+        "risks": risk_names(flags[i]),
+    } for i in page]
+    return len(matched), games
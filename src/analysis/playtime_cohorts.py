@@ -0,0 +1,202 @@
+"""
+玩家体验阶段 (游玩时长分组) 统计。
+
+分析时按游玩时长把评论排序一次，好评 / 差评各保存四条前缀和数组
+(评论数、有情感分的评论数、平均情感分之和、有用票数)。
+任意分段、分位数分组、退款窗口 (<= 2 小时) 统计都只需对分段边界做二分查找再相减，
+复杂度 O(分段数 * log n)，不复制也不修改评论 DataFrame。
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+SCORE_COLUMNS = ['score_gameplay', 'score_visuals', 'score_story', 'score_opt', 'score_value']
+POLARITIES = ("positive", "negative")
+
+# 默认分段 (小时) 及标签，与旧版玩家体验阶段图一致
+DEFAULT_BOUNDARIES_HOURS = [2, 10, 20]
+DEFAULT_LABELS = ['0-2h (初见)', '2-10h (中期)', '10-20h (深入)', '20h+ (老手)']
+# Steam 退款条件: 游玩时长不超过 2 小时
+REFUND_WINDOW_MINUTES = 120
+COHORT_MAX_BINS = 24
+# 组内没有情感分时按中立处理
+NEUTRAL_SENTIMENT = 0.5
+
+_PREFIX_FIELDS = ("count", "scored", "score", "votes")
+
+# 已加载的索引: path -> (mtime, index)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def build_cohort_index(df):
+    """
+    评论 DataFrame -> 前缀和索引 (dict of numpy arrays)。
+    playtime 为升序的游玩时长 (分钟)；"{极性}_{字段}" 长度为 n + 1，首元素为 0。
+    """
+    playtime = pd.to_numeric(df['playtime_at_review'], errors='coerce').to_numpy(dtype=np.float64)
+    valid = ~np.isnan(playtime)
+    order = np.argsort(playtime[valid], kind="stable")
+    index = {"playtime": playtime[valid][order]}
+
+    voted_up = df['voted_up'].to_numpy(dtype=bool)[valid][order]
+    # 垃圾评论没有情感分 (NaN)，不计入平均
+    columns = [c for c in SCORE_COLUMNS if c in df.columns]
+    if columns:
+        sentiment = df[columns].mean(axis=1).to_numpy(dtype=np.float64)[valid][order]
+    else:
+        sentiment = np.full(len(order), np.nan)
+    scored = ~np.isnan(sentiment)
+    if 'votes_up' in df.columns:
+        votes = pd.to_numeric(df['votes_up'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)[valid][order]
+    else:
+        votes = np.zeros(len(order))
+
+    for polarity, mask in (("positive", voted_up), ("negative", ~voted_up)):
+        fields = {
+            "count": mask,
+            "scored": mask & scored,
+            "score": np.where(mask & scored, sentiment, 0.0),
+            "votes": np.where(mask, votes, 0.0),
+        }
+        for field in _PREFIX_FIELDS:
+            index[f"{polarity}_{field}"] = np.concatenate(([0.0], np.cumsum(fields[field], dtype=np.float64)))
+    return index
+
+
+def _range_sums(index, edges):
+    """各分段 (edges[i], edges[i + 1]] 内的汇总值"""
+    bounds = np.searchsorted(index["playtime"], edges, side="right")
+    lo, hi = bounds[:-1], bounds[1:]
+    return {
+        key: index[key][hi] - index[key][lo]
+        for key in (f"{p}_{f}" for p in POLARITIES for f in _PREFIX_FIELDS)
+    }
+
+
+def _hours(minutes):
+    return f"{round(minutes / 60, 1):g}"
+
+
+def _hours_label(lo, hi):
+    if np.isinf(hi):
+        return f"{_hours(lo)}h+"
+    return f"{_hours(max(lo, 0))}-{_hours(hi)}h"
+
+
+def cohort_stats(index, edges, labels=None):
+    """
+    按分钟边界 edges (升序，首尾一般为 -1 / inf) 汇总。
+    返回与 playtime_sentiment 缓存兼容的 dict (labels / positive_scores / negative_scores)，
+    另带各组评论数、有用票数和好评率。
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    sums = _range_sums(index, edges)
+    if labels is None:
+        labels = [_hours_label(lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+    data = {"labels": list(labels)}
+    for polarity in POLARITIES:
+        scored = sums[f"{polarity}_scored"]
+        mean = np.divide(sums[f"{polarity}_score"], scored, out=np.full(len(scored), NEUTRAL_SENTIMENT), where=scored > 0)
+        data[f"{polarity}_scores"] = [round(float(s) * 100, 1) for s in mean]
+        data[f"{polarity}_counts"] = sums[f"{polarity}_count"].astype(int).tolist()
+        data[f"{polarity}_votes"] = sums[f"{polarity}_votes"].astype(int).tolist()
+    total = sums["positive_count"] + sums["negative_count"]
+    data["positive_rate"] = [
+        round(float(p * 100 / t), 1) if t else None for p, t in zip(sums["positive_count"], total)
+    ]
+    return data
+
+
+def parse_boundaries(raw):
+    """"2,10,20" (小时) -> 升序去重的分钟边界；格式错误抛出 ValueError"""
+    hours = []
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            value = float(part)
+        except ValueError:
+            raise ValueError(f"无效的分段边界: {part}")
+        if not np.isfinite(value) or value <= 0:
+            raise ValueError(f"分段边界必须是正数: {part}")
+        hours.append(value)
+    hours = sorted(set(hours))
+    if not hours:
+        raise ValueError("请至少提供一个分段边界")
+    if len(hours) + 1 > COHORT_MAX_BINS:
+        raise ValueError(f"最多分成 {COHORT_MAX_BINS} 段")
+    return [h * 60 for h in hours]
+
+
+def boundary_cohorts(index, boundaries_minutes=None):
+    """按给定分钟边界分段；不传时使用默认的四个体验阶段"""
+    if boundaries_minutes is None:
+        boundaries_minutes = [h * 60 for h in DEFAULT_BOUNDARIES_HOURS]
+        labels = DEFAULT_LABELS
+    else:
+        labels = None
+    return cohort_stats(index, [-1, *boundaries_minutes, np.inf], labels)
+
+
+def quantile_cohorts(index, quantiles):
+    """按游玩时长分位数等分为 quantiles 组 (时长相同的评论不拆开，组数可能更少)"""
+    try:
+        quantiles = int(quantiles)
+    except ValueError:
+        raise ValueError(f"无效的分位数组数: {quantiles}")
+    if not 2 <= quantiles <= COHORT_MAX_BINS:
+        raise ValueError(f"分位数组数必须在 2 到 {COHORT_MAX_BINS} 之间")
+    playtime = index["playtime"]
+    if len(playtime) == 0:
+        return cohort_stats(index, [-1, np.inf])
+    positions = (np.arange(1, quantiles) * len(playtime)) // quantiles
+    inner = np.unique(playtime[np.maximum(positions - 1, 0)])
+    inner = inner[inner < playtime[-1]]
+    return cohort_stats(index, [-1, *inner, np.inf])
+
+
+def refund_window_stats(index, window_minutes=REFUND_WINDOW_MINUTES):
+    """退款窗口内 (游玩时长 <= window_minutes) 的评论统计"""
+    stats = cohort_stats(index, [-1, window_minutes], [f"<= {_hours(window_minutes)}h"])
+    total = len(index["playtime"])
+    in_window = stats["positive_counts"][0] + stats["negative_counts"][0]
+    return {
+        "window_hours": window_minutes / 60,
+        "reviews": in_window,
+        "share": round(in_window * 100 / total, 1) if total else None,
+        "positive_rate": stats["positive_rate"][0],
+        "negative_reviews": stats["negative_counts"][0],
+        "positive_score": stats["positive_scores"][0],
+        "negative_score": stats["negative_scores"][0],
+    }
+
+
+def save_cohort_index(path, index):
+    """原子写入 .npz"""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}.npz"
+    np.savez(tmp_path, **index)
+    os.replace(tmp_path, path)
+
+
+def load_cohort_index(path):
+    """读取索引 (按文件修改时间缓存在内存中)；不存在或损坏时返回 None"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    try:
+        with np.load(path) as data:
+            index = {key: data[key] for key in data.files}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ [PlaytimeCohorts] 读取索引失败 ({path}): {e}")
+        return None
+    with _loaded_lock:
+        _loaded[path] = (mtime, index)
+    return index
@@ -0,0 +1,96 @@
+"""
+雷达图 / 推荐指数需要的评论聚合量 (流式累加)。
+
+按好评 / 差评分别累加: 评论数、各情感维度的分数之和与有效条数、退款窗口内的评论数。
+所有量都按 sample_weight 加权 (抽样入库时每条评论代表的评论数，未抽样时为 1)，
+逐块 update 即可，不需要把全部评论放在同一个 DataFrame 里。
+"""
+import numpy as np
+import pandas as pd
+
+SCORE_COLUMNS = ["score_gameplay", "score_visuals", "score_story", "score_opt", "score_value"]
+POLARITIES = ("positive", "negative")
+# Steam 退款条件: 游玩时长不超过 2 小时
+REFUND_WINDOW_MINUTES = 120
+
+
+class ReviewAggregates:
+    def __init__(self):
+        self.totals = {
+            polarity: {
+                "weight": 0.0,
+                "refund_weight": 0.0,
+                "score_sum": {col: 0.0 for col in SCORE_COLUMNS},
+                "score_weight": {col: 0.0 for col in SCORE_COLUMNS},
+            }
+            for polarity in POLARITIES
+        }
+
+    @classmethod
+    def from_frame(cls, df):
+        aggregates = cls()
+        aggregates.update(df)
+        return aggregates
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregates = cls()
+        for polarity in POLARITIES:
+            totals = aggregates.totals[polarity]
+            stored = (data or {}).get(polarity, {})
+            totals["weight"] = float(stored.get("weight", 0.0))
+            totals["refund_weight"] = float(stored.get("refund_weight", 0.0))
+            for col in SCORE_COLUMNS:
+                totals["score_sum"][col] = float(stored.get("score_sum", {}).get(col, 0.0))
+                totals["score_weight"][col] = float(stored.get("score_weight", {}).get(col, 0.0))
+        return aggregates
+
+    def to_dict(self):
+        return self.totals
+
+    def update(self, chunk):
+        """累加一块评论 (需要 voted_up，可选 score_* / playtime_at_review / sample_weight)"""
+        if chunk is None or chunk.empty:
+            return self
+        if "sample_weight" in chunk.columns:
+            weight = pd.to_numeric(chunk["sample_weight"], errors="coerce").fillna(1.0).to_numpy(dtype=np.float64)
+        else:
+            weight = np.ones(len(chunk))
+        voted_up = chunk["voted_up"].to_numpy(dtype=bool)
+        if "playtime_at_review" in chunk.columns:
+            playtime = pd.to_numeric(chunk["playtime_at_review"], errors="coerce").to_numpy(dtype=np.float64)
+            in_refund_window = playtime <= REFUND_WINDOW_MINUTES
+        else:
+            in_refund_window = np.zeros(len(chunk), dtype=bool)
+
+        for polarity, mask in (("positive", voted_up), ("negative", ~voted_up)):
+            totals = self.totals[polarity]
+            w = weight[mask]
+            totals["weight"] += float(w.sum())
+            totals["refund_weight"] += float(w[in_refund_window[mask]].sum())
+            for col in SCORE_COLUMNS:
+                if col not in chunk.columns:
+                    continue
+                values = pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=np.float64)[mask]
+                # 垃圾评论没有情感分 (NaN)，不计入均值
+                valid = ~np.isnan(values)
+                totals["score_sum"][col] += float((values[valid] * w[valid]).sum())
+                totals["score_weight"][col] += float(w[valid].sum())
+        return self
+
+    def mean(self, col, polarity=None):
+        """某个情感维度的加权均值 (polarity 为 None 时不分好差评)；没有有效分数时返回 None"""
+        polarities = POLARITIES if polarity is None else (polarity,)
+        total = sum(self.totals[p]["score_sum"][col] for p in polarities)
+        weight = sum(self.totals[p]["score_weight"][col] for p in polarities)
+        return total / weight if weight > 0 else None
+
+    def count(self, polarity):
+        return self.totals[polarity]["weight"]
+
+    def refund_rate(self):
+        """差评中游玩时长在退款窗口内的比例 (0-1)；没有差评时返回 None"""
+        negative = self.totals["negative"]
+        if negative["weight"] <= 0:
+            return None
+        return negative["refund_weight"] / negative["weight"]
@@ -1,5 +1,6 @@
+import re
 import numpy as np
-import pandas as pd
+from src.analysis.review_aggregates import ReviewAggregates
 
 # 【新增】Steam 官方评级到基础分的映射
 # 我们同时包含中英文，因为爬虫抓取的 summary 语言可能不固定
@@ -36,6 +37,143 @@ CRITICAL_FLAW_KEYWORDS = [
     "闪退", "崩溃", "bug", "服务器", "连接", 
     "优化", "掉帧", "欺诈", "打不开", "无法启动"
 ]
+# 预编译为一个正则，逐个主题扫描，不再拼接全部主题文本
+_FLAW_PATTERN = re.compile("|".join(re.escape(kw) for kw in CRITICAL_FLAW_KEYWORDS))
+
+# 推荐档位 (按分数从低到高)，分界见 TIER_BOUNDS
+TIERS = ["avoid", "not_recommended", "mixed", "recommended", "must_play"]
+TIER_BOUNDS = [25, 51, 76, 91]
+TIER_SUGGESTIONS = [
+    "【千万别买】(0-25分) 风险极高！",
+    "【不推荐】(25-50分) 踩雷风险较高。官方评级低，且存在明显短板。",
+    "【褒贬不一】(50-75分) 游戏评价两极分化。官方评级尚可，但请注意减分项。",
+    "【强烈推荐】(75-90分) 游戏总体优秀。官方评级高，核心体验良好。",
+    "【必玩神作】(90-100分) 官方评级极高，且我们的分析未发现明显短板。",
+]
+
+# 风险标记 (位掩码) 及其触发条件 / 建议文案
+RISK_FLAGS = {"opt": 1, "value": 2, "refund": 4, "flaw": 8}
+RISK_NOTES = {
+    "opt": " [注意：游戏“优化/联机”问题被普遍提及]",
+    "value": " [注意：玩家普遍认为游戏“性价比”偏低]",
+    "refund": " [注意：大量差评集中在2小时内（可能存在Bug或欺诈）]",
+    "flaw": " [注意：主题中检测到“闪退/崩溃”等硬伤关键词]",
+}
+
+
+def _base_score(rating_string):
+    # 使用 "in" 是为了匹配 "好评 (1,234)" 这样的字符串
+    for key, score in STEAM_RATING_MAP.items():
+        if key in rating_string:
+            return score
+    return 50 # 默认中立
+
+
+def _is_paid(game_info):
+    # 优先使用本地目录的数值价格 (分)，没有时再解析商店接口的价格字符串
+    if game_info.get('price_cents') is not None:
+        return game_info['price_cents'] > 0
+    price_str = game_info.get('price', '0').replace('¥', '').replace(',', '').strip()
+    return bool(price_str) and price_str.lower() not in ['free', '免费', '0']
+
+
+def has_critical_flaw(topic_map):
+    """主题关键词 / 摘要中是否出现“闪退/崩溃”等硬伤关键词"""
+    for info in (topic_map or {}).values():
+        if _FLAW_PATTERN.search(info.get('keywords', '')) or _FLAW_PATTERN.search(info.get('summary', '')):
+            return True
+    return False
+
+
+def extract_score_features(df, game_info, topic_map, review_summary, aggregates=None):
+    """
+    把一个游戏的评论压缩成打分所需的聚合特征 (可 JSON 序列化，存入 _score.json)。
+    缺失的均值记为 None。
+    :param aggregates: 入库时流式累加好的 ReviewAggregates；不传时由 df 现算
+    """
+    if aggregates is None:
+        aggregates = ReviewAggregates.from_frame(df)
+
+    rating_string = review_summary.get('review_score_desc', '无评分')
+    return {
+        "name": game_info.get('name', ''),
+        "rating_desc": rating_string,
+        "base_score": _base_score(rating_string),
+        # 全是垃圾评论、没有分数时记为缺失 (不减分)
+        "opt_mean": aggregates.mean('score_opt'),
+        "value_mean": aggregates.mean('score_value'),
+        "is_paid": _is_paid(game_info),
+        "refund_rate": aggregates.refund_rate(),
+        "flaw": has_critical_flaw(topic_map),
+    }
+
+
+def _feature_array(features_list, key, dtype=float):
+    return np.array([np.nan if f.get(key) is None else f[key] for f in features_list], dtype=dtype)
+
+
+def score_catalog(base_score, opt_mean, value_mean, is_paid, refund_rate, flaw):
+    """
+    【向量化】一次为整个目录打分。参数都是等长的 numpy 数组，均值缺失用 NaN。
+    基础分来自 Steam 官方评级，再按优化 (最多 15)、性价比 (最多 10, 仅付费游戏)、
+    退款率 (最多 10) 减分。
+    返回: dict，包含 score / tier / risk_flags 及各项减分
+    """
+    opt_penalty = np.where(np.isnan(opt_mean), 0.0, (1.0 - opt_mean) * 15)
+    value_penalty = np.where(is_paid & ~np.isnan(value_mean), (1.0 - value_mean) * 10, 0.0)
+    refund_penalty = np.nan_to_num(refund_rate) * 10
+
+    # 推荐分 = 基础分 - 减分，归一化 (0-100) 后取整
+    score = np.clip(base_score - (opt_penalty + value_penalty + refund_penalty), 0, 100).astype(int)
+
+    risk_flags = (
+        np.where(opt_penalty > 10, RISK_FLAGS["opt"], 0)
+        | np.where(value_penalty > 7, RISK_FLAGS["value"], 0)
+        | np.where(refund_penalty > 7, RISK_FLAGS["refund"], 0)
+        | np.where(flaw, RISK_FLAGS["flaw"], 0)
+    )
+    return {
+        "score": score,
+        "tier": np.digitize(score, TIER_BOUNDS),
+        "risk_flags": risk_flags,
+        "opt_penalty": opt_penalty,
+        "value_penalty": value_penalty,
+        "refund_penalty": refund_penalty,
+    }
+
+
+def score_feature_list(features_list):
+    """对 extract_score_features 的结果列表批量打分"""
+    return score_catalog(
+        _feature_array(features_list, "base_score"),
+        _feature_array(features_list, "opt_mean"),
+        _feature_array(features_list, "value_mean"),
+        _feature_array(features_list, "is_paid", bool),
+        _feature_array(features_list, "refund_rate"),
+        _feature_array(features_list, "flaw", bool),
+    )
+
+
+def risk_names(flags):
+    """位掩码 -> 风险名列表"""
+    return [name for name, bit in RISK_FLAGS.items() if int(flags) & bit]
+
+
+def build_suggestion(score, tier, flags):
+    suggestion = TIER_SUGGESTIONS[int(tier)]
+    # 针对性建议 (只对 75 分以下的游戏提示)
+    if score < 75:
+        for name in risk_names(flags):
+            suggestion += RISK_NOTES[name]
+    return suggestion
+
+
+def recommend_from_features(features):
+    """单个游戏：特征 -> (recommend_score, suggestion)"""
+    result = score_feature_list([features])
+    score = int(result["score"][0])
+    return score, build_suggestion(score, result["tier"][0], result["risk_flags"][0])
+
 
 def calculate_recommend_score(df, game_info, topic_map, review_summary):
     """
@@ -51,90 +189,4 @@ def calculate_recommend_score(df, game_info, topic_map, review_summary):
     
     if df.empty:
         return 50, "评论数据不足，评估中立。"
-
-    # --- 1. 基础分 (100%) ---
-    # 【核心修改】使用 Steam 官方评级字符串
-    
-    rating_string = review_summary.get('review_score_desc', '无评分')
-    base_score = 50 # 默认中立
-    
-    # 使用 "in" 是为了匹配 "好评 (1,234)" 这样的字符串
-    for key, score in STEAM_RATING_MAP.items():
-        if key in rating_string:
-            base_score = score
-            break
-    
-    # --- 2. 核心减分项 (保持 V2.0 逻辑不变，最多 35 分) ---
-    
-    # A: “优化/联机” 减分 (最高 15 分)
-    opt_penalty = 0
-    if 'score_opt' in df.columns:
-        opt_mean_score = df['score_opt'].mean()
-        # 优化均分 0 -> 减 15 分
-        opt_penalty = (1.0 - opt_mean_score) * 15
-    
-    # B: “性价比” 减分 (最高 10 分)
-    value_penalty = 0
-    if 'score_value' in df.columns:
-        price_str = game_info.get('price', '0').replace('¥', '').replace(',', '').strip()
-        if price_str.lower() not in ['free', '免费', '0'] and price_str:
-            value_mean_score = df['score_value'].mean()
-            value_penalty = (1.0 - value_mean_score) * 10
-    
-    # C: “退款率” 减分 (最高 10 分)
-    refund_penalty = 0
-    negative_reviews = df[df['voted_up'] == False]
-    total_negative_sampled = len(negative_reviews)
-    
-    if total_negative_sampled > 0:
-        try:
-            playtime_col = pd.to_numeric(df['playtime_at_review'])
-            refund_reviews = negative_reviews[pd.to_numeric(negative_reviews['playtime_at_review']) <= 120]
-            refund_rate = len(refund_reviews) / total_negative_sampled # (0-1)
-            refund_penalty = refund_rate * 10
-        except Exception as e:
-            print(f"⚠️ [Risk Model] 计算退款率失败: {e}")
-            pass 
-    
-    # --- 3. 汇总计算 ---
-    total_penalty = opt_penalty + value_penalty + refund_penalty
-    
-    # 推荐分 = 基础分 - 减分
-    final_score = base_score - total_penalty
-    
-    # 归一化 (0-100)
-    final_score = int(np.clip(final_score, 0, 100))
-
-    # --- 4. 生成建议 (保持 V2.0 逻辑不变) ---
-    suggestion = ""
-    flaw_detected = False
-    try:
-        all_topic_text = " ".join([info['keywords'] + info['summary'] for info in topic_map.values()])
-        if any(kw in all_topic_text for kw in CRITICAL_FLAW_KEYWORDS):
-            flaw_detected = True
-    except Exception:
-        pass
-
-    if final_score > 90:
-        suggestion = "【必玩神作】(90-100分) 官方评级极高，且我们的分析未发现明显短板。"
-    elif final_score > 75:
-        suggestion = "【强烈推荐】(75-90分) 游戏总体优秀。官方评级高，核心体验良好。"
-    elif final_score > 50:
-        suggestion = "【褒贬不一】(50-75分) 游戏评价两极分化。官方评级尚可，但请注意减分项。"
-    else:
-        suggestion = "【不推荐】(25-50分) 踩雷风险较高。官方评级低，且存在明显短板。"
-    
-    if final_score < 25:
-        suggestion = "【千万别买】(0-25分) 风险极高！"
-
-    # 针对性建议
-    if opt_penalty > 10 and final_score < 75:
-        suggestion += " [注意：游戏“优化/联机”问题被普遍提及]"
-    if value_penalty > 7 and final_score < 75:
-        suggestion += " [注意：玩家普遍认为游戏“性价比”偏低]"
-    if refund_penalty > 7 and final_score < 75:
-        suggestion += " [注意：大量差评集中在2小时内（可能存在Bug或欺诈）]"
-    if flaw_detected and final_score < 75:
-        suggestion += " [注意：主题中检测到“闪退/崩溃”等硬伤关键词]"
-
-    return final_score, suggestion
\ No newline at end of file
+    return recommend_from_features(extract_score_features(df, game_info, topic_map, review_summary))
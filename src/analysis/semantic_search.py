@@ -0,0 +1,170 @@
+"""
+评论语义搜索。
+
+每个 appid 的向量索引 (src.database.vector_index) 在分析阶段直接用 BERTopic
+已经算好的 MiniLM 句向量发布 (publish_appid_index)，搜索请求里不再计算评论嵌入。
+索引按作者 steamid 回表，评论刷新后、新的分析完成前继续使用旧索引；
+只有从未建过索引的 appid 才在搜索时按需构建 (占用 inference 阶段的名额)。
+所有 appid 的索引可以合并成一个全局索引 (不重新计算嵌入):
+
+    python -m src.analysis.semantic_search --build 1245620 2358720
+    python -m src.analysis.semantic_search --build-global
+"""
+import sys
+import threading
+import argparse
+import numpy as np
+from src.analysis.topic_modeler import embedding_model
+from src.database.cache_manager import get_data_version, load_review_texts, get_reviews_by_authors
+from src.database.vector_index import build_index, load_index, list_indexes, normalize_rows
+from src.monitoring.metrics import timed
+from src.monitoring import admission
+
+GLOBAL_INDEX = "global"
+SEARCH_TOP_K_MAX = 50
+EMBED_BATCH_SIZE = 256
+# current.json 中的 ids 格式标记：每行 [appid, 作者 steamid] (旧索引按 rowid，刷新后会错位)
+INDEX_ID_KIND = "steamid"
+
+# 同一 appid 同时只构建一次
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def _embed(texts):
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        batch = [str(t) for t in texts[start:start + EMBED_BATCH_SIZE]]
+        vectors.append(np.asarray(embedding_model.encode(batch, show_progress_bar=False), dtype=np.float32))
+    return normalize_rows(np.concatenate(vectors))
+
+
+def _build_lock(name):
+    with _build_locks_guard:
+        return _build_locks.setdefault(name, threading.Lock())
+
+
+def _usable(index):
+    return index is not None and index.meta.get("ids") == INDEX_ID_KIND
+
+
+def publish_appid_index(appid, authors, vectors, version=None):
+    """
+    用已算好的句向量发布一个 appid 的索引 (分析阶段复用 BERTopic 的嵌入)。
+    :param authors: 与 vectors 逐行对应的作者 steamid；非数字的 (匿名) 评论不进索引
+    """
+    authors = [str(a) for a in authors]
+    keep = [i for i, author in enumerate(authors) if author.isdigit()]
+    if not keep:
+        return None
+    steamids = np.array([int(authors[i]) for i in keep], dtype=np.int64)
+    ids = np.column_stack([np.full(len(steamids), int(appid), dtype=np.int64), steamids])
+    with _build_lock(str(appid)):
+        return build_index(str(appid), np.asarray(vectors, dtype=np.float32)[keep], ids,
+                           version=version or get_data_version(appid), extra={"ids": INDEX_ID_KIND})
+
+
+def build_appid_index(appid, version=None):
+    """为一个 appid 的缓存评论计算句向量并 (重新) 构建索引；没有评论时返回 None"""
+    rows = load_review_texts(appid)
+    if not rows:
+        return None
+    print(f"🔎 [Search] 正在为 {appid} 的 {len(rows)} 条评论计算句向量...")
+    with timed("embedding"):
+        vectors = _embed([r[1] for r in rows])
+    return publish_appid_index(appid, [r[0] for r in rows], vectors, version)
+
+
+def ensure_appid_index(appid):
+    """
+    返回 appid 的索引。已有索引时直接使用 (数据刷新后由分析阶段重建，此前旧索引仍可按 steamid 回表)；
+    从未建过索引时按需构建，等不到 inference 名额时返回 None。
+    """
+    index = load_index(str(appid))
+    if _usable(index):
+        return index
+    try:
+        with admission.slot("inference"):
+            # 排队期间可能已由其他请求或分析阶段建好
+            index = load_index(str(appid))
+            if _usable(index):
+                return index
+            return build_appid_index(appid)
+    except admission.AdmissionRejected:
+        return None
+
+
+def build_global_index():
+    """合并所有 appid 索引为全局索引 (直接复用已计算的向量)"""
+    vectors, ids = [], []
+    for name in list_indexes():
+        if not name.isdigit():
+            continue
+        index = load_index(name)
+        if not _usable(index) or len(index) == 0:
+            continue
+        vectors.append(np.asarray(index.vectors, dtype=np.float32))
+        ids.append(np.asarray(index.ids))
+    if not vectors:
+        print("⚠️ [Search] 没有可合并的 appid 索引。")
+        return None
+    with _build_lock(GLOBAL_INDEX):
+        return build_index(GLOBAL_INDEX, np.concatenate(vectors), np.concatenate(ids),
+                           extra={"ids": INDEX_ID_KIND})
+
+
+def search_reviews(query, appid=None, top_k=10):
+    """
+    语义搜索评论。appid 为空时搜索全局索引。
+    返回: 评论 dict 列表 (附 similarity)，按相似度降序；没有可用索引时返回 None
+    """
+    top_k = max(1, min(int(top_k), SEARCH_TOP_K_MAX))
+    index = ensure_appid_index(appid) if appid is not None else load_index(GLOBAL_INDEX)
+    if not _usable(index):
+        return None
+
+    with timed("query_embedding"):
+        query_vector = _embed([query])[0]
+    with timed("vector_search"):
+        # 索引构建后评论表可能已刷新，部分评论已不在表中，多取一些候选再过滤
+        hit_ids, scores = index.search(query_vector, top_k * 2)
+
+    # 按 appid 分组回表
+    by_appid = {}
+    for hit_appid, steamid in hit_ids:
+        by_appid.setdefault(int(hit_appid), []).append(int(steamid))
+    reviews = {}
+    for hit_appid, steamids in by_appid.items():
+        for steamid, review in get_reviews_by_authors(hit_appid, steamids).items():
+            reviews[(hit_appid, steamid)] = review
+
+    results = []
+    for (hit_appid, steamid), score in zip(hit_ids, scores):
+        review = reviews.get((int(hit_appid), str(int(steamid))))
+        if review is None:
+            continue
+        review["similarity"] = round(float(score), 4)
+        results.append(review)
+        if len(results) >= top_k:
+            break
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="构建评论语义搜索索引")
+    parser.add_argument("--build", nargs="*", type=int, default=[], help="要 (重新) 构建索引的 appid")
+    parser.add_argument("--build-global", action="store_true", help="合并所有 appid 索引为全局索引")
+    args = parser.parse_args(argv)
+    if not args.build and not args.build_global:
+        parser.print_help()
+        return 1
+    for appid in args.build:
+        if build_appid_index(appid) is None:
+            print(f"⚠️ [Search] {appid} 没有缓存评论，跳过。")
+    if args.build_global:
+        build_global_index()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,35 @@
 from transformers import pipeline
 import torch
-import re
-
-# 文本清理函数 (保持不变)
-def clean_review_text(text):
-    text = str(text)
-    text = re.sub(r'http\S+', '', text)
-    text = re.sub(r'<[^>]+>', '', text)
-    text = re.sub(r'@\w+', '', text)
-    text = re.sub(r'#\w+', '', text)
-    text = text.strip()
-    return text
+from src.monitoring.metrics import timed_stage
+from src.inference.client import service_enabled, get_client
 
 class SentimentAnalyzer:
     """
     使用 Zero-Shot Classification 构建多维情感雷达
     """
-    def __init__(self):
+    def __init__(self, use_service=None):
+        # 定义雷达图的 5 个维度及其对应的“正向假设”
+        # 模型会计算评论与这些句子的相似度(蕴含概率)
+        self.dimension_map = {
+            "score_gameplay": "玩法很有趣",
+            "score_visuals":  "画面很精美",
+            "score_story":    "剧情很感人",
+            "score_opt":      "运行很流畅",  # 包含优化、服务器
+            "score_value":    "价格很良心"   # 性价比
+        }
+        # 提取标签列表供模型使用
+        self.labels = list(self.dimension_map.values())
+
+        # 配置了共享推理服务时，本进程不加载模型，只做瘦客户端
+        self.client = None
+        self.classifier = None
+        if use_service is None:
+            use_service = service_enabled()
+        if use_service:
+            self.client = get_client()
+            print(f"🤖 [SentimentAnalyzer] 使用共享推理服务: {self.client.address}")
+            return
+
         print("🤖 [SentimentAnalyzer] 正在加载 Zero-Shot Classification 模型...")
         # 使用支持中文的轻量级多语言 NLI 模型
         # 推荐: MoritzLaurer/mDeBERTa-v3-base-mnli-xnli (效果极佳且体积适中)
@@ -40,18 +53,7 @@ class SentimentAnalyzer:
             print(f"❌ [SentimentAnalyzer] 模型加载失败: {e}")
             self.classifier = None
 
-        # 定义雷达图的 5 个维度及其对应的“正向假设”
-        # 模型会计算评论与这些句子的相似度(蕴含概率)
-        self.dimension_map = {
-            "score_gameplay": "玩法很有趣",
-            "score_visuals":  "画面很精美",
-            "score_story":    "剧情很感人",
-            "score_opt":      "运行很流畅",  # 包含优化、服务器
-            "score_value":    "价格很良心"   # 性价比
-        }
-        # 提取标签列表供模型使用
-        self.labels = list(self.dimension_map.values())
-
+    @timed_stage("analyze_batch")
     def analyze_batch(self, texts):
         """
         对一个 列表/Series 的文本进行批量情感分析。
@@ -59,6 +61,18 @@ class SentimentAnalyzer:
         返回: 
         - 一个字典列表, e.g., [{'score_gameplay': 0.9, ...}, {...}]
         """
+        if self.client is None:
+            return self.analyze_local(texts)
+
+        try:
+            return self.client.score(list(texts))
+        except Exception as e:
+            print(f"❌ [SentimentAnalyzer] 推理服务调用失败: {e}")
+            default_scores = {k: 0.5 for k in self.dimension_map.keys()}
+            return [default_scores for _ in texts]
+
+    def analyze_local(self, texts):
+        """在本进程内用已加载的模型推理 (推理服务端也调用这个方法)"""
         # 定义回退的默认值
         default_scores = {k: 0.5 for k in self.dimension_map.keys()}
         
@@ -66,10 +80,10 @@ class SentimentAnalyzer:
             return [default_scores for _ in texts]
 
         try:
-            # 1. 批量清理和截断文本
+            # 1. 批量截断文本 (清洗已在入库时完成，调用方传入 text_model 列)
             cleaned_texts = []
             for text in texts:
-                cleaned = clean_review_text(text)[:512]
+                cleaned = str(text)[:512]
                 # 如果清理后为空，给一个空格，防止模型出错
                 cleaned_texts.append(cleaned if cleaned else " ") 
 
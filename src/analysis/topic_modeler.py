@@ -1,10 +1,12 @@
 import jieba
-import re
 import pandas as pd
 import numpy as np
 from bertopic import BERTopic
+from bertopic.backend import BaseEmbedder
 from sentence_transformers import SentenceTransformer
 from sklearn.feature_extraction.text import CountVectorizer
+from src.monitoring.metrics import timed
+from src.inference.client import service_enabled, get_client, EMBEDDING_MODEL_NAME
 
 # --- 1. 加载停用词 ---
 def _load_stopwords(filepath="static/cn_stopwords.txt"): #
@@ -42,37 +44,55 @@ def _load_stopwords(filepath="static/cn_stopwords.txt"): #
 
 stopwords = _load_stopwords()
 
-# --- 2. 文本预处理函数 ---
-def _clean_text(text):
-    text = re.sub(r'<[^>]+>', '', str(text)) # 移除 HTML
-    text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z]', ' ', text) # 只保留中英文和空格
-    text = text.strip()
-    return text
-
-# --- 3. Jieba 分词器 (用于 BERTopic) ---
+# --- 2. Jieba 分词器 (用于 BERTopic) ---
 # BERTopic 需要一个分词器来处理中文
 def _jieba_tokenizer(text):
     return jieba.lcut(text)
 
-# --- 4. 核心分析函数 (BERTopic 版) ---
+# --- 3. 核心分析函数 (BERTopic 版) ---
 
 # BERTopic 模型和嵌入模型是昂贵资源，全局加载一次
-# 我们将使用一个轻量级但高效的多语言模型
-print("正在加载 SentenceTransformer 模型 (paraphrase-multilingual-MiniLM-L12-v2)...")
-embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-print("模型加载完毕。")
+# 我们将使用一个轻量级但高效的多语言模型 (EMBEDDING_MODEL_NAME)
+
+class RemoteEmbedder(BaseEmbedder):
+    """通过共享推理服务计算嵌入的 BERTopic 后端 (本进程不加载模型)"""
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def embed(self, documents, verbose=False):
+        return self.client.embed(list(documents))
+
+    def encode(self, documents, **kwargs):
+        # 与 SentenceTransformer.encode 保持同样的调用方式
+        return self.embed(documents)
 
-def analyze_with_bertopic(reviews_series):
+
+if service_enabled():
+    print(f"使用共享推理服务计算句向量 ({EMBEDDING_MODEL_NAME})。")
+    embedding_model = RemoteEmbedder(get_client())
+else:
+    print(f"正在加载 SentenceTransformer 模型 ({EMBEDDING_MODEL_NAME})...")
+    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    print("模型加载完毕。")
+
+def analyze_with_bertopic(reviews_series, weights=None):
     """
     使用 BERTopic 进行语义主题分析
-    返回: (topic_map, echarts_word_data)
+    :param reviews_series: 预处理后的主题文本 (text_topic 列)
+    :param weights: 可选，每条评论代表的评论数 (去重后的簇大小)，用于加权主题计数
+    返回: (topic_map, echarts_word_data, doc_topics, embeddings)
+    doc_topics 为与 reviews_series 同索引的主题编号 Series (-1 为离群评论)；
+    embeddings 为与 reviews_series 逐行对应的句向量 (供语义搜索索引复用，未算出时为 None)
     """
+    empty_topics = pd.Series(dtype=int)
     if reviews_series.empty:
-        return {}, []
+        return {}, [], empty_topics, None
+    doc_weights = list(weights) if weights is not None else [1] * len(reviews_series)
 
     print("BERTopic 开始分析...")
-    # 1. 准备数据：清理文本
-    docs = reviews_series.apply(_clean_text).tolist()
+    # 1. 准备数据 (入库时已清洗为主题文本)
+    docs = reviews_series.fillna("").astype(str).tolist()
 
     # 2. 准备 BERTopic 的中文环境
     vectorizer_model = CountVectorizer(tokenizer=_jieba_tokenizer, stop_words=stopwords)
@@ -89,18 +109,28 @@ def analyze_with_bertopic(reviews_series):
     )
 
     # 4. 训练模型 (保持不变)
+    embeddings = None
     try:
-        topics, _ = topic_model.fit_transform(docs)
+        # 单独计算嵌入，便于分别统计嵌入和聚类/主题表示的耗时
+        with timed("embedding"):
+            embeddings = embedding_model.encode(docs, show_progress_bar=False)
+        with timed("bertopic_fit"):
+            topics, _ = topic_model.fit_transform(docs, embeddings)
         representative_docs = topic_model.get_representative_docs()
     except Exception as e:
         print(f"❌ BERTopic 训练失败: {e}")
-        return {}, []
+        return {}, [], empty_topics, embeddings
 
     print("BERTopic 训练完成。正在提取主题和摘要...")
 
     topic_map = {}
     echarts_word_data = []
     topic_info = topic_model.get_topic_info()
+
+    # 按去重权重统计每个主题覆盖的评论数
+    topic_counts = {}
+    for topic, weight in zip(topics, doc_weights):
+        topic_counts[topic] = topic_counts.get(topic, 0) + int(weight)
     
     # --- 【核心修改】---
     # 统一使用 get_topic() 和“筛选法”，彻底替换 row.Name 逻辑
@@ -135,7 +165,7 @@ def analyze_with_bertopic(reviews_series):
         summary_docs = []
         if topic_id in representative_docs:
             for doc in representative_docs[topic_id][:3]:
-                cleaned_doc = _clean_text(doc)
+                cleaned_doc = doc
                 if len(cleaned_doc) > 60: 
                     cleaned_doc = cleaned_doc[:60] + "..."
                 summary_docs.append(f'"{cleaned_doc}"') 
@@ -145,7 +175,8 @@ def analyze_with_bertopic(reviews_series):
         # 7. 存入 topic_map
         topic_map[topic_id] = {
             "keywords": keywords_str,
-            "summary": summary
+            "summary": summary,
+            "count": topic_counts.get(topic_id, 0)
         }
 
         # --- b. 构建 echarts_word_data (使用相同源) ---
@@ -159,4 +190,5 @@ def analyze_with_bertopic(reviews_series):
                 })
 
     print(f"BERTopic 分析完毕。找到 {len(topic_map)} 个有效主题。")
-    return topic_map, echarts_word_data
\ No newline at end of file
+    doc_topics = pd.Series([int(t) for t in topics], index=reviews_series.index)
+    return topic_map, echarts_word_data, doc_topics, embeddings
\ No newline at end of file
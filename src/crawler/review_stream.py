@@ -0,0 +1,137 @@
+"""
+大样本流式抓取评论。
+
+沿 appreviews 的 cursor 逐页读取 (每页 100 条)，整个流程是生成器流水线:
+    逐页请求 -> 解析 -> (可选) 抽样 -> 按块合并 -> 预处理 / 去重 / 打分 -> 调用方逐块写入
+任何时刻内存里只有一页原始评论和一块待打分的评论 (抽样时另有抽样池)。
+
+抽样 (sample 参数):
+- None:         不抽样，抓到的评论全部打分入库
+- "reservoir":  水塘抽样，均匀保留 sample_size 条
+- "stratified": 按 (发布年份, 游玩时长阶段) 分层，每层各做水塘抽样保留 sample_size 条
+抽样后每条评论带 sample_weight (所在层的评论数 / 保留数)，聚合统计按它加权还原整体。
+"""
+import numpy as np
+import pandas as pd
+from src.crawler import steam_api_crawler
+from src.crawler.steam_api_crawler import review_frame, score_review_frame
+from src.analysis.playtime_cohorts import DEFAULT_BOUNDARIES_HOURS
+from src.monitoring.metrics import count
+from src.monitoring import admission
+
+STREAM_PAGE_SIZE = 100
+# 每块打分的评论数 (情感模型按批推理，块太小浪费批处理)
+STREAM_CHUNK_SIZE = 500
+SAMPLE_MODES = ("reservoir", "stratified")
+_PLAYTIME_BOUNDS = np.array(DEFAULT_BOUNDARIES_HOURS) * 60
+
+
+def iter_review_pages(appid, review_type="all", max_reviews=1000, language="schinese"):
+    """沿 cursor 逐页产出原始评论列表，最多 max_reviews 条"""
+    cursor = "*"
+    seen_cursors = set()
+    fetched = 0
+    while fetched < max_reviews:
+        params = {
+            "json": 1,
+            "language": language,
+            "filter": "all",
+            "review_type": review_type,
+            "day_range": 9223372036854775807,
+            "num_per_page": min(STREAM_PAGE_SIZE, max_reviews - fetched),
+            "cursor": cursor,
+        }
+        with admission.slot("crawl"):
+            res = steam_api_crawler._steam_get(
+                f"{steam_api_crawler.STEAM_STORE_BASE_URL}/appreviews/{appid}", params=params
+            )
+        data = res.json()
+        reviews = data.get("reviews") or []
+        if not reviews:
+            break
+        reviews = reviews[:max_reviews - fetched]
+        fetched += len(reviews)
+        count("stream_reviews_fetched", len(reviews), "Reviews fetched by the streaming ingest.")
+        yield reviews
+        # 最后一页之后 Steam 会返回相同的 cursor
+        cursor = data.get("cursor")
+        if not cursor or cursor in seen_cursors:
+            break
+        seen_cursors.add(cursor)
+
+
+def parse_pages(pages, appid):
+    for reviews in pages:
+        yield review_frame(reviews, appid)
+
+
+def rechunk(frames, chunk_size=STREAM_CHUNK_SIZE):
+    """把小块 DataFrame 合并成约 chunk_size 行的块"""
+    buffer, rows = [], 0
+    for frame in frames:
+        if frame.empty:
+            continue
+        buffer.append(frame)
+        rows += len(frame)
+        if rows >= chunk_size:
+            yield pd.concat(buffer, ignore_index=True)
+            buffer, rows = [], 0
+    if buffer:
+        yield pd.concat(buffer, ignore_index=True)
+
+
+def _strata(frame):
+    """(发布年份, 游玩时长阶段) 分层键"""
+    years = pd.to_datetime(frame["timestamp_created"], unit="s", errors="coerce").dt.year.fillna(0).astype(int)
+    playtime = pd.to_numeric(frame["playtime_at_review"], errors="coerce").fillna(0).to_numpy()
+    stages = np.searchsorted(_PLAYTIME_BOUNDS, playtime, side="left")
+    return list(zip(years, stages))
+
+
+def sample_frames(frames, sample_size, mode="reservoir", seed=0, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    水塘抽样 (Algorithm R)，分层时每层一个水塘。
+    需要读完整个输入才能产出，内存占用上限为 sample_size (* 层数) 条评论。
+    """
+    if mode not in SAMPLE_MODES:
+        raise ValueError(f"未知的抽样方式: {mode}")
+    rng = np.random.default_rng(seed)
+    # 层 -> [见过的条数, 保留的行 (dict) 列表]
+    reservoirs = {}
+    for frame in frames:
+        keys = _strata(frame) if mode == "stratified" else [None] * len(frame)
+        for key, row in zip(keys, frame.to_dict("records")):
+            state = reservoirs.setdefault(key, [0, []])
+            seen, kept = state
+            if seen < sample_size:
+                kept.append(row)
+            else:
+                slot = rng.integers(0, seen + 1)
+                if slot < sample_size:
+                    kept[slot] = row
+            state[0] = seen + 1
+
+    rows = []
+    for seen, kept in reservoirs.values():
+        weight = seen / len(kept)
+        for row in kept:
+            row["sample_weight"] = weight
+            rows.append(row)
+    count("stream_reviews_sampled", len(rows), "Reviews kept by streaming ingest sampling.")
+    for start in range(0, len(rows), chunk_size):
+        yield pd.DataFrame(rows[start:start + chunk_size])
+
+
+def stream_reviews(appid, review_type, max_reviews, sample=None, sample_size=1000,
+                   language="schinese", chunk_size=STREAM_CHUNK_SIZE):
+    """
+    逐块产出打好分的评论 DataFrame (与 fetch_game_reviews 的列一致，另有 sample_weight)。
+    去重在块内进行，dup_of 指向同一块内代表评论的作者 steamid。
+    """
+    frames = parse_pages(iter_review_pages(appid, review_type, max_reviews, language), appid)
+    if sample:
+        frames = sample_frames(frames, sample_size, sample, chunk_size=chunk_size)
+    for chunk in rechunk(frames, chunk_size):
+        if "sample_weight" not in chunk.columns:
+            chunk["sample_weight"] = 1.0
+        yield score_review_frame(chunk)
@@ -1,49 +1,43 @@
+import os
 import requests
 import pandas as pd
 import numpy as np
 from src.analysis.sentiment_analysis import SentimentAnalyzer
+from src.monitoring.metrics import timed, count
+from src.monitoring import admission
+from src.preprocess.dedup import collapse_duplicates
+from src.preprocess.text_cleaner import preprocess_reviews
+
+SCORE_COLUMNS = ["score_gameplay", "score_visuals", "score_story", "score_opt", "score_value"]
 try:
     analyzer = SentimentAnalyzer()
 except Exception as e:
     print(f"CRITICAL: 无法初始化 SentimentAnalyzer. {e}")
     analyzer = None
 
-def fetch_game_reviews(appid, language="schinese", num_reviews=100, review_type="all"):
-    """
-    获取 Steam 游戏评论，返回 DataFrame 包含：
-    author_name、author_avatar、content、voted_up
-    """
-    url = (
-        f"https://store.steampowered.com/appreviews/{appid}"
-        f"?json=1"
-        f"&language={language}"
-        f"&filter=all"                     # ✅ 按“有帮助度”排序
-        f"&review_type={review_type}"
-        f"&day_range=9223372036854775807"  # ✅ 全时间范围
-        f"&num_per_page={num_reviews}"
-        f"&cursor=*"
-    )
-    params_summary = (
-        f"https://store.steampowered.com/appreviews/{appid}"
-        f"?json=1"
-        f"&language=all"
-        f"&review_type=all"
-        f"&num_per_page=0"
-        f"&cursor=*"
-    )
-    print(f"🕷️ [Crawler] Fetching: {url}")
-    res = requests.get(url)
-    data = res.json()
-    reviews = data.get("reviews", [])
+# Steam 商店接口地址 (基准测试时可指向本地替身)
+STEAM_STORE_BASE_URL = os.getenv("STEAM_STORE_BASE_URL", "https://store.steampowered.com")
 
-    if not reviews:
-        # 返回包含新列的空 DataFrame
-        cols = ["author_name", "author_avatar", "content", "voted_up", 
-                "score_gameplay", "score_visuals", "score_story", "score_opt", "score_value"]
-        return pd.DataFrame(columns=cols), {}
+def _steam_get(*args, **kwargs):
+    """带耗时统计的 requests.get (所有 Steam HTTP 调用都经过这里)"""
+    with timed("steam_http"):
+        return requests.get(*args, **kwargs)
 
-    # 1. 构造基础 DataFrame
-    df = pd.DataFrame([{
+
+def _record_dedup_stats(total, scored, spam):
+    avoided = total - scored
+    print(f"🧹 [Crawler] 去重: {total} 条评论 -> {scored} 条需推理 "
+          f"(折叠重复 {avoided - spam} 条，垃圾评论 {spam} 条，节省 {avoided / max(total, 1):.0%})")
+    help_text = "Reviews seen by the ingest dedup stage, by outcome."
+    count("dedup_reviews", total, help_text, kind="total")
+    count("dedup_reviews", scored, help_text, kind="scored")
+    count("dedup_reviews", avoided - spam, help_text, kind="duplicate")
+    count("dedup_reviews", spam, help_text, kind="spam")
+
+
+def review_frame(reviews, appid):
+    """Steam appreviews 接口返回的一页评论 -> 基础 DataFrame"""
+    return pd.DataFrame([{
         "author_name": r["author"].get("steamid", "匿名"),
         "author_avatar": r["author"].get("avatar", ""),
         "content": r.get("review", ""),
@@ -54,40 +48,95 @@ def fetch_game_reviews(appid, language="schinese", num_reviews=100, review_type=
         "timestamp_created": r.get("timestamp_created", 0)
     } for r in reviews])
 
-    # 2. 执行多维情感分析
+
+def score_review_frame(df):
+    """预处理 -> 去重 -> 只对代表评论做多维情感分析，再按簇广播分数"""
+    # 1. 文本预处理 (模型输入 / 主题文本 / 展示文本 / 语言 / 词元数，只做一次)
+    df = preprocess_reviews(df)
+
+    # 2. 去重 / 垃圾评论识别：每个重复簇只推理一次
+    df = collapse_duplicates(df)
+    representatives = df[df["dup_weight"] > 0]
+    _record_dedup_stats(len(df), len(representatives), int(df["is_spam"].sum()))
+
+    # 3. 执行多维情感分析 (只对代表评论)
     if analyzer:
-        print(f"🤖 [Crawler] 正在对 {len(df)} 条评论进行多维雷达分析...")
+        print(f"🤖 [Crawler] 正在对 {len(representatives)} 条代表评论进行多维雷达分析 (共 {len(df)} 条)...")
         
-        score_dicts = analyzer.analyze_batch(df['content'])
+        with admission.slot("inference"):
+            score_dicts = analyzer.analyze_batch(representatives['text_model'])
         
-        # 转换为 DataFrame 并合并
-        df_scores = pd.DataFrame(score_dicts)
+        # 按簇把代表的分数复制给所有成员；垃圾评论不参与打分 (NaN，均值计算时自动跳过)
+        df_scores = pd.DataFrame(score_dicts, index=representatives["author_name"].astype(str), columns=SCORE_COLUMNS)
+        df_scores = df_scores[~df_scores.index.duplicated()]
+        df_scores = df_scores.reindex(df["dup_of"])
+        df_scores.index = df.index
         df = pd.concat([df, df_scores], axis=1)
         
         print("✅ [Crawler] 多维分析完成。")
     else:
         # 填充默认值
-        for col in ["score_gameplay", "score_visuals", "score_story", "score_opt", "score_value"]:
+        for col in SCORE_COLUMNS:
             df[col] = 0.5
+    return df
+
 
-    # ... (Summary 获取部分保持不变) ...
-    res_summary = requests.get(params_summary)
+def fetch_review_summary(appid):
+    """全语言的评论总数和评级描述 (query_summary)，失败时返回 {}"""
+    params_summary = (
+        f"{STEAM_STORE_BASE_URL}/appreviews/{appid}"
+        f"?json=1"
+        f"&language=all"
+        f"&review_type=all"
+        f"&num_per_page=0"
+        f"&cursor=*"
+    )
+    res_summary = _steam_get(params_summary)
     summary = {}
     if res_summary.status_code == 200:
         summary_data = res_summary.json()
         if summary_data.get("success") == 1:
             summary = summary_data.get("query_summary", {})
+    return summary
+
+
+def fetch_game_reviews(appid, language="schinese", num_reviews=100, review_type="all"):
+    """
+    获取 Steam 游戏评论，返回 DataFrame 包含：
+    author_name、author_avatar、content、voted_up
+    """
+    url = (
+        f"{STEAM_STORE_BASE_URL}/appreviews/{appid}"
+        f"?json=1"
+        f"&language={language}"
+        f"&filter=all"                     # ✅ 按“有帮助度”排序
+        f"&review_type={review_type}"
+        f"&day_range=9223372036854775807"  # ✅ 全时间范围
+        f"&num_per_page={num_reviews}"
+        f"&cursor=*"
+    )
+    print(f"🕷️ [Crawler] Fetching: {url}")
+    with admission.slot("crawl"):
+        res = _steam_get(url)
+    data = res.json()
+    reviews = data.get("reviews", [])
+
+    if not reviews:
+        # 返回包含新列的空 DataFrame
+        cols = ["author_name", "author_avatar", "content", "voted_up"] + SCORE_COLUMNS
+        return pd.DataFrame(columns=cols), {}
 
-    return df, summary
+    df = score_review_frame(review_frame(reviews, appid))
+    return df, fetch_review_summary(appid)
 
 
 def get_appid_by_name(game_name):
     """
     根据游戏名从 Steam 搜索接口获取 appid、真实游戏名、封面图、游戏详情
     """
-    search_url = "https://store.steampowered.com/api/storesearch"
+    search_url = f"{STEAM_STORE_BASE_URL}/api/storesearch"
     params = {"term": game_name, "l": "schinese", "cc": "CN"}
-    res = requests.get(search_url, params=params)
+    res = _steam_get(search_url, params=params)
 
     data = res.json()
 
@@ -99,9 +148,19 @@ def get_appid_by_name(game_name):
     game_real_name = game["name"]
     img_url = game["tiny_image"]
 
-    # ====== 获取游戏详细信息 ======
-    detail_url = f"https://store.steampowered.com/api/appdetails?appids={appid}&l=schinese&cc=CN"
-    detail_res = requests.get(detail_url).json()
+    info = get_game_details(appid, img_url)
+
+    return appid, game_real_name, img_url, info
+
+
+def get_game_details(appid, img_url=""):
+    """
+    根据 appid 获取游戏详情 (用于 /game/<appid> 这类已知 appid 的请求)
+    """
+    detail_url = f"{STEAM_STORE_BASE_URL}/api/appdetails?appids={appid}&l=schinese&cc=CN"
+    detail_res = _steam_get(detail_url).json()
+    if not detail_res.get(str(appid), {}).get("success"):
+        return None
     detail = detail_res[str(appid)]["data"]
 
     info = {
@@ -113,8 +172,7 @@ def get_appid_by_name(game_name):
         "short_description": detail.get("short_description", "暂无简介"),
         "header_image": detail.get("header_image", img_url),
     }
-
-    return appid, game_real_name, img_url, info
+    return info
 
 # --- 【核心修改】替换这个函数 ---
 def fetch_data_for_timeseries(appid, max_pages=10):
@@ -142,7 +200,7 @@ def fetch_data_for_timeseries(appid, max_pages=10):
         }
         
         try:
-            res = requests.get(f"https://store.steampowered.com/appreviews/{appid}", params=params, timeout=10)
+            res = _steam_get(f"{STEAM_STORE_BASE_URL}/appreviews/{appid}", params=params, timeout=10)
             res.raise_for_status()
             data = res.json()
             
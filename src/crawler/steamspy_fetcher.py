@@ -1,10 +1,59 @@
 """
 获取 SteamSpy 元数据（价格、评分、发行商、发布时间）
 API: https://steamspy.com/api.php?request=appdetails&appid=<id>
+     https://steamspy.com/api.php?request=all&page=<n>  (全目录分页，每页 1000 个游戏)
 """
+import os
+import time
+import threading
 import requests
+from src.monitoring.metrics import timed
+
+# SteamSpy 接口地址 (基准测试时可指向本地替身)
+STEAMSPY_BASE_URL = os.getenv("STEAMSPY_BASE_URL", "https://steamspy.com")
+# SteamSpy 的限流: request=all 每分钟 1 次，其余请求每秒 1 次
+STEAMSPY_ALL_INTERVAL_SECONDS = float(os.getenv("STEAMSPY_ALL_INTERVAL_SECONDS", "60"))
+STEAMSPY_DETAILS_INTERVAL_SECONDS = 1.0
+STEAMSPY_TIMEOUT_SECONDS = 30
+
+# 限流状态: 请求类型 -> 上次请求时间
+_last_request = {}
+_rate_lock = threading.Lock()
+
+
+def _wait_turn(kind, interval):
+    """
+    同类请求之间至少间隔 interval 秒 (进程内所有线程共享)。
+    在锁内预订下一个时间点，锁外再睡眠，等待 all 的线程不会挡住 appdetails 请求。
+    """
+    with _rate_lock:
+        now = time.monotonic()
+        turn = max(now, _last_request.get(kind, float("-inf")) + interval)
+        _last_request[kind] = turn
+    if turn > now:
+        time.sleep(turn - now)
+
+
+def _steamspy_get(params, kind, interval):
+    _wait_turn(kind, interval)
+    with timed("steamspy_http"):
+        return requests.get(f"{STEAMSPY_BASE_URL}/api.php", params=params, timeout=STEAMSPY_TIMEOUT_SECONDS)
+
 
 def fetch_game_metadata(appid):
-    url = f"https://steamspy.com/api.php?request=appdetails&appid={appid}"
-    res = requests.get(url)
+    res = _steamspy_get({"request": "appdetails", "appid": appid}, "appdetails", STEAMSPY_DETAILS_INTERVAL_SECONDS)
     return res.json() if res.status_code == 200 else {}
+
+
+def fetch_catalog_page(page):
+    """
+    全目录的第 page 页 (从 0 开始): {appid(str): 游戏信息 dict}。
+    超出最后一页时返回空 dict；请求失败抛出 requests.RequestException。
+    """
+    res = _steamspy_get({"request": "all", "page": page}, "all", STEAMSPY_ALL_INTERVAL_SECONDS)
+    # 超出范围的页 SteamSpy 返回空对象或错误页
+    if res.status_code == 404:
+        return {}
+    res.raise_for_status()
+    data = res.json()
+    return data if isinstance(data, dict) else {}
@@ -0,0 +1,387 @@
+"""
+缓存容量管理。
+
+每个被搜索过的游戏都会留下一张 reviews_{appid} 表、若干分析缓存文件、词云 PNG、
+落盘的渲染结果和向量索引，
+不加管理时磁盘占用只增不减。这里定期 (后台线程) 做三件事:
+1. 把内存中的访问记录 (cache_manager.record_access) 批量写入 cache_access 表
+2. 总占用超过预算 (CACHE_BUDGET_MB) 时按 LRU / LFU 淘汰游戏，直到降到预算的
+   CACHE_LOW_WATERMARK 以下；热门游戏 (评论数 >= CACHE_PIN_MIN_REVIEWS)、
+   CACHE_PINNED_APPIDS 中的游戏、手动 pin 的游戏和最近刚访问过的游戏不淘汰
+3. 增量 VACUUM 归还空闲页 (替换评论表、淘汰游戏都会留下空闲页)，并执行 PRAGMA optimize
+
+已有数据库切换到增量 VACUUM 需要一次完整 VACUUM (期间锁住整个数据库)，
+不会由 Web 进程自动执行，需在低峰期手动运行:
+    python -m src.database.cache_governor --enable-incremental-vacuum
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from src.database import cache_manager
+from src.database.vector_index import VECTOR_INDEX_DIR
+from src.database.response_cache import RESPONSE_CACHE_DIR
+from src.monitoring.metrics import count, register_gauge
+
+CACHE_BUDGET_MB = float(os.getenv("CACHE_BUDGET_MB", "2048"))
+# 淘汰策略: lru (最久未访问) / lfu (访问次数最少，同次数再按最久未访问)
+CACHE_EVICTION_POLICY = os.getenv("CACHE_EVICTION_POLICY", "lru")
+# 超出预算后一直淘汰到预算的这个比例以下，避免每轮都在边缘反复淘汰
+CACHE_LOW_WATERMARK = 0.9
+# 评论总数达到这个量级的游戏 (与最短 TTL 档位一致) 视为热门，常驻不淘汰
+CACHE_PIN_MIN_REVIEWS = 100000
+CACHE_PINNED_APPIDS = {int(a) for a in os.getenv("CACHE_PINNED_APPIDS", "").split(",") if a.strip().isdigit()}
+# 最近这段时间内访问过的游戏不淘汰 (可能正在渲染或后台刷新)
+CACHE_EVICTION_GRACE_SECONDS = 3600
+CACHE_GOVERNOR_INTERVAL_SECONDS = int(os.getenv("CACHE_GOVERNOR_INTERVAL_SECONDS", "600"))
+# 每次增量 VACUUM 归还的页数 (分步执行，避免长时间占用写锁)
+INCREMENTAL_VACUUM_PAGES = 2048
+
+EVICTION_POLICIES = ("lru", "lfu")
+
+_run_lock = threading.Lock()
+_stats = {}
+_governor_thread = None
+_vacuum_hint_shown = False
+
+
+def _connect():
+    return sqlite3.connect(cache_manager.DB_NAME, timeout=30)
+
+
+def _analysis_dir():
+    # 延迟导入：analysis_manager 会加载模型
+    from src.analysis.analysis_manager import ANALYSIS_CACHE_DIR
+    return ANALYSIS_CACHE_DIR
+
+
+def _wordcloud_dir():
+    from src.visualization.wordcloud import WORDCLOUD_CACHE_DIR
+    return WORDCLOUD_CACHE_DIR
+
+
+def _appid_file_dirs():
+    """文件名以 "{appid}_" 开头的缓存目录: 分析缓存、词云 PNG、落盘的渲染结果"""
+    return [d for d in (_analysis_dir(), _wordcloud_dir(), RESPONSE_CACHE_DIR) if d and os.path.isdir(d)]
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _file_sizes_by_appid():
+    """分析缓存、词云 PNG、渲染结果文件 + 向量索引按 appid 汇总的字节数"""
+    sizes = {}
+    for directory in _appid_file_dirs():
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                appid = entry.name.split("_", 1)[0]
+                if appid.isdigit() and entry.is_file():
+                    try:
+                        sizes[int(appid)] = sizes.get(int(appid), 0) + entry.stat().st_size
+                    except OSError:
+                        pass  # 扫描期间被替换或删除
+    if os.path.isdir(VECTOR_INDEX_DIR):
+        for entry in os.listdir(VECTOR_INDEX_DIR):
+            if entry.isdigit():
+                sizes[int(entry)] = sizes.get(int(entry), 0) + _dir_size(os.path.join(VECTOR_INDEX_DIR, entry))
+    return sizes
+
+
+def _db_pages(conn):
+    """(已用字节, 空闲字节)"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - freelist) * page_size, freelist * page_size
+
+
+def flush_access_log(conn=None):
+    """把内存中的访问记录合并进 cache_access 表"""
+    log = cache_manager.drain_access_log()
+    if not log:
+        return 0
+    own = conn is None
+    conn = conn or _connect()
+    try:
+        conn.executemany(
+            """
+            INSERT INTO cache_access (appid, last_access, hits) VALUES (?, ?, ?)
+            ON CONFLICT(appid) DO UPDATE SET
+                last_access = MAX(last_access, excluded.last_access),
+                hits = hits + excluded.hits
+            """,
+            [(appid, last_access, hits) for appid, (last_access, hits) in log.items()]
+        )
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    return len(log)
+
+
+def pin(appid, pinned=True):
+    """手动固定 / 取消固定某个游戏 (固定的游戏不会被淘汰)"""
+    cache_manager._init_db()
+    conn = _connect()
+    try:
+        conn.execute(
+            """
+            INSERT INTO cache_access (appid, last_access, hits, pinned) VALUES (?, ?, 0, ?)
+            ON CONFLICT(appid) DO UPDATE SET pinned = excluded.pinned
+            """,
+            (int(appid), time.time(), int(pinned))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _list_games(conn):
+    """
+    所有缓存的游戏: [{appid, last_access, hits, pinned}]
+    从未记录过访问的旧缓存以写入时间作为最后访问时间
+    """
+    rows = conn.execute(
+        """
+        SELECT m.appid, m.last_updated, COALESCE(m.total_positive, 0) + COALESCE(m.total_negative, 0),
+               a.last_access, COALESCE(a.hits, 0), COALESCE(a.pinned, 0)
+        FROM metadata m LEFT JOIN cache_access a ON a.appid = m.appid
+        """
+    ).fetchall()
+    games = []
+    for appid, last_updated, total_reviews, last_access, hits, pinned in rows:
+        if last_access is None:
+            try:
+                last_access = datetime.fromisoformat(last_updated).timestamp()
+            except (TypeError, ValueError):
+                last_access = 0.0
+        games.append({
+            "appid": appid,
+            "last_access": last_access,
+            "hits": hits,
+            "pinned": bool(pinned) or appid in CACHE_PINNED_APPIDS or total_reviews >= CACHE_PIN_MIN_REVIEWS,
+        })
+    return games
+
+
+def _eviction_order(games, policy, now):
+    """可淘汰的游戏，最先淘汰的排在前面"""
+    if policy not in EVICTION_POLICIES:
+        raise ValueError(f"未知的淘汰策略: {policy}")
+    candidates = [
+        g for g in games if not g["pinned"] and now - g["last_access"] >= CACHE_EVICTION_GRACE_SECONDS
+    ]
+    if policy == "lfu":
+        return sorted(candidates, key=lambda g: (g["hits"], g["last_access"]))
+    return sorted(candidates, key=lambda g: g["last_access"])
+
+
+def evict_game(appid, conn=None):
+    """删除一个游戏的评论表、元数据、分析缓存文件、词云 PNG、渲染结果和向量索引"""
+    from src.analysis.leaderboard import remove_game
+    appid = int(appid)
+    own = conn is None
+    conn = conn or _connect()
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS reviews_{appid}")
+        conn.execute("DELETE FROM metadata WHERE appid = ?", (appid,))
+        conn.execute("DELETE FROM cache_access WHERE appid = ?", (appid,))
+        conn.execute("DELETE FROM review_aggregates WHERE appid = ?", (appid,))
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    for directory in _appid_file_dirs():
+        for path in glob.glob(os.path.join(directory, f"{appid}_*")):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"⚠️ [CacheGovernor] 删除 {path} 失败: {e}")
+    shutil.rmtree(os.path.join(VECTOR_INDEX_DIR, str(appid)), ignore_errors=True)
+    remove_game(appid)
+
+
+def _incremental_vacuum_enabled(conn):
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def enable_incremental_vacuum():
+    """
+    一次性维护步骤：已有数据库默认 auto_vacuum = NONE，需要一次完整 VACUUM 才能切换为增量模式。
+    VACUUM 期间整个数据库被锁住，请在停服或低峰期从命令行执行。
+    """
+    cache_manager._init_db()
+    conn = _connect()
+    try:
+        if _incremental_vacuum_enabled(conn):
+            print("✅ [CacheGovernor] 数据库已启用增量 VACUUM。")
+            return False
+        print("🧹 [CacheGovernor] 正在整理数据库并启用增量 VACUUM...")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        print("✅ [CacheGovernor] 已启用增量 VACUUM。")
+        return True
+    finally:
+        conn.close()
+
+
+def _incremental_vacuum(conn):
+    """分步归还空闲页，返回归还的字节数 (数据库未启用增量模式时跳过)"""
+    global _vacuum_hint_shown
+    if not _incremental_vacuum_enabled(conn):
+        if not _vacuum_hint_shown:
+            _vacuum_hint_shown = True
+            print("💡 [CacheGovernor] 数据库未启用增量 VACUUM，空闲页不会归还；"
+                  "低峰期运行 python -m src.database.cache_governor --enable-incremental-vacuum")
+        return 0
+    released = 0
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    while True:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if before == 0:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        released += (before - after) * page_size
+        if after >= before:
+            break
+    return released
+
+
+def _measure(conn):
+    db_used, db_free = _db_pages(conn)
+    file_sizes = _file_sizes_by_appid()
+    return db_used, db_free, file_sizes
+
+
+def run_governor(budget_mb=None, policy=None):
+    """执行一轮容量管理，返回本轮统计 (同时更新 cache_stats)"""
+    budget = int((CACHE_BUDGET_MB if budget_mb is None else budget_mb) * 1024 * 1024)
+    policy = policy or CACHE_EVICTION_POLICY
+    with _run_lock:
+        cache_manager._init_db()
+        conn = _connect()
+        try:
+            start = time.time()
+            flush_access_log(conn)
+
+            db_used, _, file_sizes = _measure(conn)
+            total = db_used + sum(file_sizes.values())
+            evicted = []
+            if total > budget:
+                target = budget * CACHE_LOW_WATERMARK
+                for game in _eviction_order(_list_games(conn), policy, start):
+                    if total <= target:
+                        break
+                    evict_game(game["appid"], conn)
+                    evicted.append(game["appid"])
+                    db_used, _ = _db_pages(conn)
+                    file_sizes.pop(game["appid"], None)
+                    total = db_used + sum(file_sizes.values())
+                if total > budget:
+                    print(f"⚠️ [CacheGovernor] 可淘汰的游戏已用尽，缓存仍超出预算 ({total / 1024 / 1024:.1f} MB)")
+
+            released = _incremental_vacuum(conn)
+            conn.execute("PRAGMA optimize")
+            db_used, db_free, file_sizes = _measure(conn)
+            games = _list_games(conn)
+        finally:
+            conn.close()
+
+    if evicted:
+        count("cache_evictions", len(evicted), "Games evicted from the review cache.", policy=policy)
+        print(f"🗑️ [CacheGovernor] 按 {policy} 淘汰了 {len(evicted)} 个游戏: {evicted}")
+    if released:
+        count("cache_vacuum_bytes", released, "Bytes returned to the filesystem by incremental VACUUM.")
+
+    stats = {
+        "budget_bytes": budget,
+        "policy": policy,
+        "db_bytes": db_used,
+        "db_free_bytes": db_free,
+        "file_bytes": sum(file_sizes.values()),
+        "total_bytes": db_used + sum(file_sizes.values()),
+        "games": len(games),
+        "pinned_games": sum(1 for g in games if g["pinned"]),
+        "evicted_last_run": evicted,
+        "evictions_total": _stats.get("evictions_total", 0) + len(evicted),
+        "vacuum_released_bytes": released,
+        "last_run": time.time(),
+        "last_run_seconds": round(time.time() - start, 3),
+    }
+    _stats.clear()
+    _stats.update(stats)
+    return stats
+
+
+def cache_stats():
+    """最近一轮的统计 (还没运行过时为空 dict)"""
+    return dict(_stats)
+
+
+def _gauge_values():
+    stats = cache_stats()
+    if not stats:
+        return {}
+    return {
+        (("kind", "db"),): stats["db_bytes"],
+        (("kind", "db_free"),): stats["db_free_bytes"],
+        (("kind", "files"),): stats["file_bytes"],
+        (("kind", "budget"),): stats["budget_bytes"],
+    }
+
+
+register_gauge("cache_bytes", _gauge_values, "Review cache disk usage and budget in bytes (as of the last governor run).")
+register_gauge("cache_games", lambda: {(): cache_stats().get("games", 0)}, "Games currently held in the review cache.")
+
+
+def _governor_loop():
+    while True:
+        try:
+            run_governor()
+        except Exception as e:
+            print(f"❌ [CacheGovernor] 容量管理失败: {e}")
+        time.sleep(CACHE_GOVERNOR_INTERVAL_SECONDS)
+
+
+def start_governor():
+    """启动后台容量管理线程 (重复调用无效)"""
+    global _governor_thread
+    if _governor_thread is None:
+        _governor_thread = threading.Thread(target=_governor_loop, name="cache-governor", daemon=True)
+        _governor_thread.start()
+    return _governor_thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="缓存容量管理")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="一次性完整 VACUUM，把已有数据库切换为增量 VACUUM (期间锁库)")
+    parser.add_argument("--run", action="store_true", help="立即执行一轮容量管理")
+    args = parser.parse_args(argv)
+    if not args.enable_incremental_vacuum and not args.run:
+        parser.print_help()
+        return 1
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+    if args.run:
+        stats = run_governor()
+        print(f"📦 [CacheGovernor] 总占用 {stats['total_bytes'] / 1024 / 1024:.1f} MB，共 {stats['games']} 个游戏")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
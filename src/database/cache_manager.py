@@ -1,16 +1,73 @@
 import sqlite3
+import json
 import pandas as pd
 from datetime import datetime, timedelta
 import os
-from src.crawler.steam_api_crawler import fetch_game_reviews
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.crawler.steam_api_crawler import fetch_game_reviews, fetch_review_summary
+from src.crawler.review_stream import stream_reviews
+from src.analysis.review_aggregates import ReviewAggregates
+from src.monitoring.metrics import timed, timed_stage, record_cache, register_queue
+from src.monitoring import admission
 
 DB_NAME = "steam_cache.db" 
 CACHE_DURATION_HOURS = 6   
 
+# 按热度分档的缓存有效期: (评论总数下限, 有效小时数)，从高到低匹配
+# 热门游戏评论变化快，有效期更短；冷门游戏可以缓存更久
+CACHE_TTL_TIERS = [
+    (100000, 2),
+    (10000, CACHE_DURATION_HOURS),
+    (0, 24),
+]
+# 按同时在线人数 (本地 SteamSpy 目录) 缩短有效期: (在线人数下限, 有效小时数)
+CACHE_TTL_CCU_TIERS = [
+    (10000, 2),
+    (1000, CACHE_DURATION_HOURS),
+]
+# 过期后仍可先返回旧数据 (stale-while-revalidate) 的最长时间
+MAX_STALENESS_HOURS = 72
+
+# 大样本流式入库: 每种极性沿 cursor 抓取的评论数 (0 为沿用 50 条好评 + 50 条差评)
+STREAM_INGEST_REVIEWS = int(os.getenv("STREAM_INGEST_REVIEWS", "0"))
+# 流式入库的抽样方式 (reservoir / stratified，留空不抽样) 和抽样规模 (分层抽样时为每层条数)
+STREAM_INGEST_SAMPLE = os.getenv("STREAM_INGEST_SAMPLE") or None
+STREAM_INGEST_SAMPLE_SIZE = int(os.getenv("STREAM_INGEST_SAMPLE_SIZE", "1000"))
+# 读入内存交给分析 (BERTopic / 句向量 / 玩家体验阶段) 的评论上限，每种极性按有用票数取前 N 条 (0 为不限)
+# 评论表保留全部评论，雷达图和推荐指数使用 review_aggregates 中的全量聚合量
+ANALYSIS_MAX_REVIEWS = int(os.getenv("ANALYSIS_MAX_REVIEWS", "5000"))
+
+# 后台刷新线程池 (单线程，避免同时爬取/推理拖垮 CPU)
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+register_queue("cache_refresh", lambda: len(_refreshing))
+# 同一 appid 的流式入库共用一张临时表，需要串行
+_ingest_locks = {}
+_ingest_locks_lock = threading.Lock()
+
+# 访问记录 (appid -> [最后访问时间, 访问次数])，先记在内存里，由 cache_governor 定期批量写入数据库
+_access_log = {}
+_access_lock = threading.Lock()
+
+# 评论流可用的排序键 -> 数据库列名
+REVIEW_SORT_COLUMNS = {
+    "votes_up": "votes_up",
+    "timestamp": "timestamp_created",
+    "playtime": "playtime_at_review"
+}
+REVIEW_PAGE_MAX_SIZE = 100
+# 评论流 / 搜索结果返回的列
+REVIEW_FEED_COLUMNS = "author_name, appid, content, voted_up, playtime_at_review, votes_up, timestamp_created"
+
 def _init_db():
     """初始化数据库，创建元数据表（如果不存在）"""
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
+    # 新建的数据库直接启用增量 VACUUM (已有数据库由 cache_governor 转换一次)
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
     
     # 最终的、完整的表结构
     cursor.execute("""
@@ -22,89 +79,391 @@ def _init_db():
         review_score_desc TEXT  
     )
     """)
+    # 缓存访问统计 (供 cache_governor 按 LRU / LFU 淘汰)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cache_access (
+        appid INTEGER PRIMARY KEY,
+        last_access REAL,
+        hits INTEGER DEFAULT 0,
+        pinned INTEGER DEFAULT 0
+    )
+    """)
+    # 入库时流式累加的聚合量 (ReviewAggregates，JSON)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS review_aggregates (
+        appid INTEGER PRIMARY KEY,
+        data TEXT
+    )
+    """)
 
     conn.commit()
     conn.close()
 
+def _ttl_hours(total_reviews, ccu=None):
+    """根据评论总数和同时在线人数 (热度) 选择缓存有效期，取两者中较短的"""
+    ttl = CACHE_DURATION_HOURS
+    for min_reviews, hours in CACHE_TTL_TIERS:
+        if total_reviews >= min_reviews:
+            ttl = hours
+            break
+    if ccu:
+        for min_ccu, hours in CACHE_TTL_CCU_TIERS:
+            if ccu >= min_ccu:
+                return min(ttl, hours)
+    return ttl
+
+
+def _catalog_ccu(cursor, appid):
+    """本地 SteamSpy 目录 (见 catalog.py) 中的同时在线人数；目录未同步时为 None"""
+    try:
+        row = cursor.execute("SELECT ccu FROM steamspy_catalog WHERE appid = ?", (appid,)).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
 def _check_cache_validity(appid):
-    """检查指定 appid 的缓存是否仍然有效"""
+    """
+    检查指定 appid 的缓存状态:
+    - "fresh": 在有效期内
+    - "stale": 已过期但未超过 MAX_STALENESS_HOURS，可先返回旧数据再后台刷新
+    - None: 没有缓存，或旧到不能再用
+    """
+    if not os.path.exists(DB_NAME):
+        return None
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT last_updated FROM metadata WHERE appid = ?", (appid,))
+        cursor.execute(
+            "SELECT last_updated, total_positive, total_negative FROM metadata WHERE appid = ?", (appid,)
+        )
         result = cursor.fetchone()
         if result:
             last_updated = datetime.fromisoformat(result[0])
-            if datetime.now() - last_updated < timedelta(hours=CACHE_DURATION_HOURS):
-                return True
+            age = datetime.now() - last_updated
+            ttl = _ttl_hours((result[1] or 0) + (result[2] or 0), _catalog_ccu(cursor, appid))
+            if age < timedelta(hours=ttl):
+                return "fresh"
+            if age < timedelta(hours=MAX_STALENESS_HOURS):
+                return "stale"
     except sqlite3.Error as e:
         print(f"❌ 检查缓存时出错: {e}")
-        return False
+        return None
     finally:
         conn.close()
-    return False
+    return None
+
+def record_access(appid):
+    """记录一次对该游戏缓存的访问 (只写内存)"""
+    with _access_lock:
+        entry = _access_log.setdefault(int(appid), [0.0, 0])
+        entry[0] = time.time()
+        entry[1] += 1
+
+
+def drain_access_log():
+    """取出并清空尚未落库的访问记录: {appid: (最后访问时间, 次数)}"""
+    global _access_log
+    with _access_lock:
+        log, _access_log = _access_log, {}
+    return {appid: tuple(entry) for appid, entry in log.items()}
+
 
-def get_reviews_with_cache(appid, game_real_name, force_update=False):
+def get_cache_state(appid):
+    """公开的缓存状态查询 ("fresh" / "stale" / None)"""
+    return _check_cache_validity(appid)
+
+def get_data_version(appid):
     """
-    核心函数：获取游戏评论，优先使用缓存。
-    返回: (DataFrame, is_fresh_fetch: bool, summary: dict)
+    返回指定 appid 缓存数据的版本号 (即 metadata.last_updated)。
+    缓存不存在或超过最大陈旧时间时返回 None，调用方应走完整的刷新流程。
     """
-    _init_db() 
-    table_name = f"reviews_{appid}"
-    
-    # 1. 检查缓存是否有效
-    if not force_update and _check_cache_validity(appid):
-        print(f"✅ [Cache HIT] 缓存有效，从数据库加载 {game_real_name}")
-        conn = sqlite3.connect(DB_NAME)
+    if _check_cache_validity(appid) is None:
+        return None
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        result = conn.execute("SELECT last_updated FROM metadata WHERE appid = ?", (appid,)).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return result[0] if result else None
+
+def _sort_expression(column):
+    # 排序列可能为 NULL (Steam 未返回该字段)，按 0 排序，游标里也存 0
+    return f"COALESCE({column}, 0)"
+
+
+def _create_review_indexes(conn, table_name):
+    """为评论流的键集分页 (keyset pagination) 建立复合索引 (表达式与 get_review_page 的排序键一致)"""
+    cursor = conn.cursor()
+    for column in REVIEW_SORT_COLUMNS.values():
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{column}_nn "
+            f"ON {table_name} (voted_up, {_sort_expression(column)})"
+        )
+    # 语义搜索按作者 steamid 回表
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_author ON {table_name} (author_name)")
+
+
+def get_review_page(appid, review_type="positive", sort_by="votes_up", cursor=None, limit=20):
+    """
+    键集分页读取评论流。
+    cursor 为上一页返回的 "排序值,rowid"，为空时从第一页开始。
+    返回: (评论 dict 列表, next_cursor 或 None)
+    """
+    column = REVIEW_SORT_COLUMNS.get(sort_by)
+    if column is None:
+        raise ValueError(f"不支持的排序方式: {sort_by}")
+    limit = max(1, min(int(limit), REVIEW_PAGE_MAX_SIZE))
+    voted_up = 1 if review_type == "positive" else 0
+    table_name = f"reviews_{int(appid)}"
+    sort_key = _sort_expression(column)
+
+    sql = (
+        f"SELECT rowid, {sort_key} AS sort_value, {REVIEW_FEED_COLUMNS} FROM {table_name} WHERE voted_up = ?"
+    )
+    params = [voted_up]
+    if cursor:
         try:
-            df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-            
-            summary = {}
-            cursor = conn.cursor()
-            
-            # --- 【核心修复】确保 SELECT 语句也更新了 ---
-            cursor.execute("SELECT total_positive, total_negative, review_score_desc FROM metadata WHERE appid = ?", (appid,))
-            summary_data = cursor.fetchone()
-            
-            if summary_data:
-                summary = {
-                    'total_positive': summary_data[0], 
-                    'total_negative': summary_data[1],
-                    'review_score_desc': summary_data[2] # <-- 现在 summary_data[2] 是安全的
-                }
-            # --- 修复结束 ---
-
-            conn.close()
-            if not df.empty:
-                return df, False, summary 
-        except Exception as e:
-            # 这里的 e 才是真正的错误（例如 "no such column"）
-            print(f"⚠️ 缓存读取失败 (table: {table_name})，将重新爬取... Error: {e}")
-            
-    # 2. [Cache MISS] 缓存无效或不存在，从 API 爬取
-    print(f"❌ [Cache MISS] 缓存无效，将为 {game_real_name} 爬取好评和差评...")
-    
+            # 游标总是由本函数写成两个 (SQLite 64 位范围内的) 整数
+            last_value, last_rowid = (int(part) for part in cursor.split(","))
+        except ValueError:
+            raise ValueError(f"无效的分页游标: {cursor}")
+        if not all(-2 ** 63 <= v < 2 ** 63 for v in (last_value, last_rowid)):
+            raise ValueError(f"无效的分页游标: {cursor}")
+        sql += f" AND ({sort_key}, rowid) < (?, ?)"
+        params += [last_value, last_rowid]
+    sql += f" ORDER BY {sort_key} DESC, rowid DESC LIMIT ?"
+    params.append(limit + 1)
+
+    conn = sqlite3.connect(DB_NAME)
+    conn.row_factory = sqlite3.Row
+    try:
+        with timed("sqlite_read"):
+            rows = conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        # 表不存在 (尚未爬取) 时返回空页
+        print(f"⚠️ 读取评论流失败 (table: {table_name}): {e}")
+        return [], None
+    finally:
+        conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    reviews = [dict(row) for row in rows]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = f"{int(last['sort_value'])},{last['rowid']}"
+    for review in reviews:
+        review.pop("rowid", None)
+        review.pop("sort_value", None)
+    return reviews, next_cursor
+
+
+def load_review_texts(appid):
+    """
+    读取需要建立语义索引的评论 (作者 steamid, 文本)，文本优先用预处理好的 text_model 列。
+    有去重信息时只取代表评论，跳过被折叠的重复评论和垃圾评论。
+    """
+    table_name = f"reviews_{int(appid)}"
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+        text_column = "text_model" if "text_model" in columns else "content"
+        sql = f"SELECT author_name, {text_column} FROM {table_name}"
+        if "dup_weight" in columns:
+            sql += " WHERE dup_weight > 0"
+        with timed("sqlite_read"):
+            return conn.execute(sql).fetchall()
+    except sqlite3.Error as e:
+        print(f"⚠️ 读取评论文本失败 (table: {table_name}): {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def get_reviews_by_authors(appid, authors):
+    """
+    按作者 steamid 回表读取评论 (同一游戏每人只有一条评论)，返回 {steamid: 评论 dict}。
+    评论表刷新后 steamid 仍对应同一条评论，已不在表中的评论直接跳过。
+    """
+    authors = [str(a) for a in authors]
+    if not authors:
+        return {}
+    table_name = f"reviews_{int(appid)}"
+    placeholders = ",".join("?" * len(authors))
+    conn = sqlite3.connect(DB_NAME)
+    conn.row_factory = sqlite3.Row
+    try:
+        with timed("sqlite_read"):
+            rows = conn.execute(
+                f"SELECT {REVIEW_FEED_COLUMNS} FROM {table_name} WHERE author_name IN ({placeholders})",
+                authors
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"⚠️ 按作者读取评论失败 (table: {table_name}): {e}")
+        return {}
+    finally:
+        conn.close()
+    return {str(row["author_name"]): dict(row) for row in rows}
+
+
+def load_review_columns(appid, columns):
+    """只读取评论表的指定列 (表里没有的列跳过)；没有缓存时返回空 DataFrame"""
+    table_name = f"reviews_{int(appid)}"
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+        selected = [c for c in columns if c in existing]
+        if not selected:
+            return pd.DataFrame()
+        with timed("sqlite_read"):
+            return pd.read_sql_query(f"SELECT {', '.join(selected)} FROM {table_name}", conn)
+    except sqlite3.Error as e:
+        print(f"⚠️ 读取评论列失败 (table: {table_name}): {e}")
+        return pd.DataFrame()
+    finally:
+        conn.close()
+
+
+def _read_analysis_frame(conn, table_name):
+    """读取交给分析的评论：每种极性最多 ANALYSIS_MAX_REVIEWS 条，不把大样本整表读入内存"""
+    if ANALYSIS_MAX_REVIEWS <= 0:
+        return pd.read_sql(f"SELECT * FROM {table_name}", conn)
+    frames = [
+        pd.read_sql(
+            f"SELECT * FROM {table_name} WHERE voted_up = ? ORDER BY votes_up DESC LIMIT ?",
+            conn, params=(voted_up, ANALYSIS_MAX_REVIEWS)
+        )
+        for voted_up in (1, 0)
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _load_cached_reviews(appid):
+    """从数据库读取评论和摘要，失败时返回 (空 DataFrame, {})"""
+    table_name = f"reviews_{appid}"
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        with timed("sqlite_read"):
+            df = _read_analysis_frame(conn, table_name)
+
+        summary = {}
+        cursor = conn.cursor()
+        cursor.execute("SELECT total_positive, total_negative, review_score_desc FROM metadata WHERE appid = ?", (appid,))
+        summary_data = cursor.fetchone()
+        if summary_data:
+            summary = {
+                'total_positive': summary_data[0],
+                'total_negative': summary_data[1],
+                'review_score_desc': summary_data[2]
+            }
+            try:
+                aggregates = cursor.execute("SELECT data FROM review_aggregates WHERE appid = ?", (appid,)).fetchone()
+            except sqlite3.OperationalError:
+                # 旧数据库还没有聚合表，雷达图和推荐指数回退到按评论计算
+                aggregates = None
+            if aggregates:
+                summary['aggregates'] = json.loads(aggregates[0])
+        return df, summary
+    except Exception as e:
+        # 这里的 e 才是真正的错误（例如 "no such column"）
+        print(f"⚠️ 缓存读取失败 (table: {table_name}) Error: {e}")
+        return pd.DataFrame(), {}
+    finally:
+        conn.close()
+
+
+def _ingest_lock(appid):
+    """同一 appid 的抓取 + 写入串行执行 (流式入库的临时表按 appid 命名)"""
+    with _ingest_locks_lock:
+        return _ingest_locks.setdefault(appid, threading.Lock())
+
+
+def _staging_table(appid):
+    return f"reviews_{appid}_staging"
+
+
+def _stream_crawl_reviews(appid):
+    """
+    大样本流式抓取：逐块打分并追加写入临时表，同时累加聚合量。
+    返回 (DataFrame, summary, 临时表名)；由 _write_reviews 把临时表替换为正式表。
+    """
+    staging = _staging_table(appid)
+    aggregates = ReviewAggregates()
+    rows = 0
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        for review_type in ("positive", "negative"):
+            print(f"  ...正在流式爬取 [{review_type}] (最多 {STREAM_INGEST_REVIEWS} 条，抽样: {STREAM_INGEST_SAMPLE or '无'})...")
+            for chunk in stream_reviews(appid, review_type, STREAM_INGEST_REVIEWS,
+                                        STREAM_INGEST_SAMPLE, STREAM_INGEST_SAMPLE_SIZE):
+                with timed("sqlite_write"):
+                    chunk.to_sql(staging, conn, if_exists="append", index=False)
+                    conn.commit()
+                aggregates.update(chunk)
+                rows += len(chunk)
+        if rows == 0:
+            print("爬取到空数据，不写入缓存。")
+            conn.execute(f"DROP TABLE IF EXISTS {staging}")
+            return pd.DataFrame(), {}, None
+        summary = fetch_review_summary(appid)
+        with timed("sqlite_read"):
+            df = _read_analysis_frame(conn, staging)
+    except Exception as e:
+        print(f"❌ 流式爬取失败: {e}")
+        conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        return pd.DataFrame(), {}, None
+    finally:
+        conn.close()
+    print(f"✅ [Crawler] 流式入库 {rows} 条评论")
+    summary["aggregates"] = aggregates.to_dict()
+    return df, summary, staging
+
+
+def _crawl_reviews(appid):
+    """
+    从 Steam API 爬取好评和差评，失败时返回 (空 DataFrame, {}, None)。
+    返回的第三项是流式入库的临时表名 (一次性抓取时为 None)，交给 _write_reviews。
+    """
+    if STREAM_INGEST_REVIEWS > 0:
+        return _stream_crawl_reviews(appid)
     try:
         print(f"  ...正在爬取 [好评]...")
         df_positive, summary = fetch_game_reviews(appid, review_type="positive", num_reviews=50) 
         
         print(f"  ...正在爬取 [差评]...")
         df_negative, _ = fetch_game_reviews(appid, review_type="negative", num_reviews=50)
-    
     except Exception as e:
         print(f"❌ 爬虫 fetch_game_reviews 失败: {e}")
-        return pd.DataFrame(), False, {} 
+        return pd.DataFrame(), {}, None
 
     df = pd.concat([df_positive, df_negative], ignore_index=True)
-        
     if df.empty:
         print("爬取到空数据，不写入缓存。")
-        return df, False, {} 
+        return df, {}, None
+    summary = dict(summary, aggregates=ReviewAggregates.from_frame(df).to_dict())
+    return df, summary, None
 
-    # 3. [Cache WRITE] 写入新缓存
+
+@timed_stage("sqlite_write")
+def _write_reviews(appid, df, summary, staging=None):
+    """
+    [Cache WRITE] 写入评论表和元数据 (元数据的 last_updated 即数据版本)。
+    staging 为流式入库的临时表时直接改名替换正式表，不再重写一遍评论。
+    """
+    table_name = f"reviews_{appid}"
     conn = sqlite3.connect(DB_NAME)
     try:
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
+        if staging:
+            conn.execute("BEGIN")
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            conn.execute(f"ALTER TABLE {staging} RENAME TO {table_name}")
+        else:
+            df.to_sql(table_name, conn, if_exists='replace', index=False)
+        _create_review_indexes(conn, table_name)
         
         cursor = conn.cursor()
         total_pos = summary.get('total_positive', 0)
@@ -116,12 +475,97 @@ def get_reviews_with_cache(appid, game_real_name, force_update=False):
             REPLACE INTO metadata (appid, last_updated, total_positive, total_negative, review_score_desc) 
             VALUES (?, ?, ?, ?, ?)
         """, (appid, datetime.now().isoformat(), total_pos, total_neg, score_desc))
+        if summary.get('aggregates'):
+            cursor.execute(
+                "REPLACE INTO review_aggregates (appid, data) VALUES (?, ?)",
+                (appid, json.dumps(summary['aggregates']))
+            )
         
         conn.commit()
         print(f"💾 [Cache WRITE] 成功将 {len(df)} 条评论和摘要写入数据库。")
     except Exception as e:
+        conn.rollback()
         print(f"❌ 写入数据库失败: {e}")
     finally:
         conn.close()
-        
-    return df, True, summary
\ No newline at end of file
+
+
+def _background_refresh(appid, game_real_name, on_refreshed):
+    try:
+        print(f"🔄 [Cache SWR] 后台刷新 {game_real_name or appid}...")
+        # 后台刷新排在前台请求之后，且不会因过载被降级
+        with admission.request_context(admission.PRIORITY_BACKGROUND), _ingest_lock(appid):
+            df, summary, staging = _crawl_reviews(appid)
+            if df.empty:
+                print(f"⚠️ [Cache SWR] 后台刷新失败，继续使用旧数据 ({appid})")
+                return
+            # 先刷新分析结果，再写入数据库：数据版本 (last_updated) 变化时，
+            # 分析缓存已经是新的，避免渲染缓存记录“新版本 + 旧分析”
+            if on_refreshed:
+                try:
+                    on_refreshed(df, summary)
+                except Exception as e:
+                    print(f"❌ [Cache SWR] 后台分析失败: {e}")
+            _write_reviews(appid, df, summary, staging)
+        print(f"✅ [Cache SWR] 后台刷新完成 ({appid})")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(appid)
+
+
+def schedule_refresh(appid, game_real_name=None, on_refreshed=None):
+    """
+    提交一次后台刷新 (同一 appid 同时只会有一个刷新任务)。
+    on_refreshed(df, summary) 会在写入数据库之前被调用，用于重算分析缓存。
+    返回: 是否提交了新任务
+    """
+    with _refreshing_lock:
+        if appid in _refreshing:
+            return False
+        _refreshing.add(appid)
+    _refresh_executor.submit(_background_refresh, appid, game_real_name, on_refreshed)
+    return True
+
+
+def get_reviews_with_cache(appid, game_real_name, force_update=False, on_refreshed=None):
+    """
+    核心函数：获取游戏评论，优先使用缓存。
+    缓存已过期但未超过 MAX_STALENESS_HOURS 时，立即返回旧数据并提交后台刷新
+    (on_refreshed 见 schedule_refresh)。
+    返回: (DataFrame, is_fresh_fetch: bool, summary: dict)
+    """
+    _init_db() 
+    record_access(appid)
+    
+    # 1. 检查缓存状态
+    cache_state = None if force_update else _check_cache_validity(appid)
+    record_cache("reviews", cache_state or "miss")
+    if cache_state:
+        df, summary = _load_cached_reviews(appid)
+        if not df.empty:
+            if cache_state == "stale":
+                print(f"⏳ [Cache STALE] 缓存已过期，先返回旧数据并后台刷新 {game_real_name}")
+                schedule_refresh(appid, game_real_name, on_refreshed)
+            else:
+                print(f"✅ [Cache HIT] 缓存有效，从数据库加载 {game_real_name}")
+            return df, False, summary
+        print(f"⚠️ 缓存读取失败，将重新爬取...")
+            
+    # 2. [Cache MISS] 缓存无效或不存在，从 API 爬取
+    print(f"❌ [Cache MISS] 缓存无效，将为 {game_real_name} 爬取好评和差评...")
+    with _ingest_lock(appid):
+        df, summary, staging = _crawl_reviews(appid)
+        # 3. [Cache WRITE] 写入新缓存
+        if not df.empty:
+            _write_reviews(appid, df, summary, staging)
+
+    if df.empty:
+        # 爬取失败时，只回退到未超过 MAX_STALENESS_HOURS 的旧数据，更旧的数据不再返回
+        if _check_cache_validity(appid) is None:
+            return df, False, summary
+        df, summary = _load_cached_reviews(appid)
+        if not df.empty:
+            print(f"⚠️ [Cache FALLBACK] 爬取失败，返回已过期的旧数据 {game_real_name}")
+        return df, False, summary
+
+    return df, True, summary
@@ -0,0 +1,353 @@
+"""
+本地游戏目录 (SteamSpy 全目录镜像)。
+
+按页拉取 SteamSpy request=all (每页 1000 个游戏，每分钟 1 页)，写入 steamspy_catalog 表；
+当前进度记在 steamspy_sync 表里，进程重启后从中断的那一页继续。
+多个 worker 进程都会启动同步线程，但同一时间只有持有 steamspy_sync 租约的进程在翻页，
+其他进程跳过本次检查 (持有者崩溃后租约到期即可被接管)。
+一轮同步完成后 CATALOG_REFRESH_HOURS 小时再开始下一轮。
+SteamSpy 的全目录接口不含标签，热门游戏 (按同时在线人数) 的标签另外用 appdetails 补齐。
+
+用途:
+- 按游戏名精确匹配 appid，搜索时不必先请求 Steam 商店搜索接口
+- 数值化的价格 (risk_model 判断是否付费)
+- 同时在线人数决定缓存有效期档位和预热哪些游戏
+
+用法:
+    python -m src.database.catalog --sync [--max-pages N]
+    python -m src.database.catalog --top 20
+"""
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import requests
+from src.database import cache_manager
+from src.crawler.steamspy_fetcher import fetch_catalog_page, fetch_game_metadata
+from src.monitoring.metrics import count, register_gauge
+
+CATALOG_REFRESH_HOURS = float(os.getenv("CATALOG_REFRESH_HOURS", "24"))
+# 后台线程检查是否需要同步的间隔
+CATALOG_SYNC_CHECK_SECONDS = 600
+# 每轮同步后补齐标签的热门游戏数 (appdetails 每秒 1 次)
+CATALOG_TAGS_PER_RUN = int(os.getenv("CATALOG_TAGS_PER_RUN", "200"))
+CATALOG_TAGS_MAX_AGE_HOURS = 7 * 24
+# 同步租约的有效期 (每拉取一页续期一次，须明显长于翻页间隔)
+CATALOG_SYNC_LEASE_SECONDS = 300
+
+_sync_lock = threading.Lock()
+_sync_thread = None
+
+
+def _connect():
+    return sqlite3.connect(cache_manager.DB_NAME, timeout=30)
+
+
+def _init_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS steamspy_catalog (
+        appid INTEGER PRIMARY KEY,
+        name TEXT,
+        name_lower TEXT,
+        developer TEXT,
+        publisher TEXT,
+        owners_low INTEGER,
+        owners_high INTEGER,
+        ccu INTEGER,
+        price_cents INTEGER,
+        initial_price_cents INTEGER,
+        discount INTEGER,
+        positive INTEGER,
+        negative INTEGER,
+        tags TEXT,
+        updated_at REAL,
+        tags_updated_at REAL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_steamspy_catalog_name ON steamspy_catalog (name_lower)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_steamspy_catalog_ccu ON steamspy_catalog (ccu)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS steamspy_sync (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        next_page INTEGER,
+        started_at REAL,
+        finished_at REAL
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO steamspy_sync (id, next_page) VALUES (1, 0)")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(steamspy_sync)")}
+    for column, kind in (("lease_owner", "TEXT"), ("lease_until", "REAL")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE steamspy_sync ADD COLUMN {column} {kind}")
+    conn.commit()
+
+
+def _lease_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _acquire_lease(conn, owner):
+    """获取或续期同步租约 (单条 UPDATE，多进程间原子)；返回是否持有租约"""
+    now = time.time()
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE steamspy_sync SET lease_owner = ?, lease_until = ?
+            WHERE id = 1 AND (lease_owner IS NULL OR lease_owner = ? OR lease_until < ?)
+            """,
+            (owner, now + CATALOG_SYNC_LEASE_SECONDS, owner, now)
+        )
+    return cursor.rowcount == 1
+
+
+def _release_lease(conn, owner):
+    with conn:
+        conn.execute(
+            "UPDATE steamspy_sync SET lease_owner = NULL, lease_until = NULL WHERE id = 1 AND lease_owner = ?",
+            (owner,)
+        )
+
+
+def _to_int(value):
+    try:
+        return int(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_owners(owners):
+    """"1,000,000 .. 2,000,000" -> (1000000, 2000000)"""
+    parts = str(owners or "").split("..")
+    if len(parts) != 2:
+        return None, None
+    return _to_int(parts[0]), _to_int(parts[1])
+
+
+def _catalog_row(item, now):
+    appid = _to_int(item.get("appid"))
+    name = item.get("name") or ""
+    owners_low, owners_high = _parse_owners(item.get("owners"))
+    return (
+        appid, name, name.strip().lower(), item.get("developer"), item.get("publisher"),
+        owners_low, owners_high, _to_int(item.get("ccu")),
+        _to_int(item.get("price")), _to_int(item.get("initialprice")), _to_int(item.get("discount")),
+        _to_int(item.get("positive")), _to_int(item.get("negative")), now,
+    )
+
+
+def _upsert_page(conn, items, next_page):
+    """写入一页并推进进度 (同一事务，中断后不会跳页)"""
+    now = time.time()
+    rows = [row for row in (_catalog_row(item, now) for item in items.values()) if row[0]]
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO steamspy_catalog (
+                appid, name, name_lower, developer, publisher, owners_low, owners_high, ccu,
+                price_cents, initial_price_cents, discount, positive, negative, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(appid) DO UPDATE SET
+                name = excluded.name, name_lower = excluded.name_lower,
+                developer = excluded.developer, publisher = excluded.publisher,
+                owners_low = excluded.owners_low, owners_high = excluded.owners_high, ccu = excluded.ccu,
+                price_cents = excluded.price_cents, initial_price_cents = excluded.initial_price_cents,
+                discount = excluded.discount, positive = excluded.positive, negative = excluded.negative,
+                updated_at = excluded.updated_at
+            """,
+            rows
+        )
+        conn.execute("UPDATE steamspy_sync SET next_page = ? WHERE id = 1", (next_page,))
+    return len(rows)
+
+
+def sync_catalog(max_pages=None, force=False):
+    """
+    从上次中断的页继续同步全目录。
+    :param max_pages: 本次最多拉取的页数 (None 表示直到最后一页)
+    :param force: 忽略 CATALOG_REFRESH_HOURS，立即开始新一轮
+    返回: 本次写入的游戏数 (其他进程正在同步时返回 0)
+    """
+    owner = _lease_owner()
+    with _sync_lock:
+        conn = _connect()
+        try:
+            _init_tables(conn)
+            if not _acquire_lease(conn, owner):
+                return 0
+            next_page, started_at, finished_at = conn.execute(
+                "SELECT next_page, started_at, finished_at FROM steamspy_sync WHERE id = 1"
+            ).fetchone()
+            now = time.time()
+            if next_page == 0:
+                if not force and finished_at and now - finished_at < CATALOG_REFRESH_HOURS * 3600:
+                    return 0
+                with conn:
+                    conn.execute("UPDATE steamspy_sync SET started_at = ? WHERE id = 1", (now,))
+            else:
+                print(f"📚 [Catalog] 从第 {next_page} 页继续同步 SteamSpy 目录...")
+
+            written, pages = 0, 0
+            page = next_page
+            while max_pages is None or pages < max_pages:
+                # 每页续期；租约被接管 (如本进程卡住超过有效期) 时停止，进度已在库里
+                if not _acquire_lease(conn, owner):
+                    print("⚠️ [Catalog] 同步租约已被其他进程接管，停止本次同步")
+                    break
+                items = fetch_catalog_page(page)
+                pages += 1
+                if not items:
+                    # 最后一页之后：本轮完成，下一轮从第 0 页开始
+                    with conn:
+                        conn.execute(
+                            "UPDATE steamspy_sync SET next_page = 0, finished_at = ? WHERE id = 1", (time.time(),)
+                        )
+                    print(f"✅ [Catalog] SteamSpy 目录同步完成 (共 {page} 页)")
+                    break
+                written += _upsert_page(conn, items, page + 1)
+                count("catalog_rows", len(items), "Games written by the SteamSpy catalog sync.")
+                page += 1
+            return written
+        finally:
+            _release_lease(conn, owner)
+            conn.close()
+
+
+def enrich_tags(limit=CATALOG_TAGS_PER_RUN):
+    """按同时在线人数从高到低，为标签缺失或过旧的游戏补齐标签 (appdetails)"""
+    conn = _connect()
+    try:
+        _init_tables(conn)
+        cutoff = time.time() - CATALOG_TAGS_MAX_AGE_HOURS * 3600
+        appids = [row[0] for row in conn.execute(
+            """
+            SELECT appid FROM steamspy_catalog
+            WHERE tags_updated_at IS NULL OR tags_updated_at < ?
+            ORDER BY ccu DESC LIMIT ?
+            """,
+            (cutoff, limit)
+        )]
+        for appid in appids:
+            try:
+                details = fetch_game_metadata(appid)
+            except (requests.RequestException, ValueError) as e:
+                print(f"⚠️ [Catalog] 获取 {appid} 的标签失败: {e}")
+                continue
+            tags = details.get("tags")
+            # 没有标签的游戏 SteamSpy 返回空列表
+            tags = sorted(tags, key=tags.get, reverse=True) if isinstance(tags, dict) else []
+            with conn:
+                conn.execute(
+                    "UPDATE steamspy_catalog SET tags = ?, tags_updated_at = ? WHERE appid = ?",
+                    (json.dumps(tags, ensure_ascii=False), time.time(), appid)
+                )
+        return len(appids)
+    finally:
+        conn.close()
+
+
+def _query(sql, params=()):
+    """只读查询；目录表还不存在 (从未同步过) 时返回空列表"""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error:
+        return []
+    finally:
+        conn.close()
+
+
+def _entry(row):
+    row.pop("name_lower", None)
+    row["tags"] = json.loads(row["tags"]) if row.get("tags") else []
+    return row
+
+
+def lookup_appid(name):
+    """按游戏名 (忽略大小写) 精确匹配，返回 (appid, 名称)；同名时取在线人数最多的；找不到返回 (None, None)"""
+    rows = _query(
+        "SELECT appid, name FROM steamspy_catalog WHERE name_lower = ? ORDER BY ccu DESC LIMIT 1",
+        ((name or "").strip().lower(),)
+    )
+    if not rows:
+        return None, None
+    return rows[0]["appid"], rows[0]["name"]
+
+
+def get_catalog_entry(appid):
+    """单个游戏的目录信息 (dict)；不在目录中时返回 None"""
+    rows = _query("SELECT * FROM steamspy_catalog WHERE appid = ?", (int(appid),))
+    return _entry(rows[0]) if rows else None
+
+
+def get_ccu(appid):
+    """同时在线人数；不在目录中时返回 None"""
+    rows = _query("SELECT ccu FROM steamspy_catalog WHERE appid = ?", (int(appid),))
+    return rows[0]["ccu"] if rows else None
+
+
+def popular_appids(limit):
+    """同时在线人数最多的 limit 个游戏"""
+    return [row["appid"] for row in _query(
+        "SELECT appid FROM steamspy_catalog ORDER BY ccu DESC LIMIT ?", (int(limit),)
+    )]
+
+
+def catalog_size():
+    rows = _query("SELECT COUNT(*) AS n FROM steamspy_catalog")
+    return rows[0]["n"] if rows else 0
+
+
+register_gauge("catalog_games", lambda: {(): catalog_size()}, "Games in the local SteamSpy catalog.")
+
+
+def _sync_loop(on_synced):
+    while True:
+        try:
+            if sync_catalog():
+                enrich_tags()
+                if on_synced:
+                    on_synced()
+        except Exception as e:
+            # 网络错误等：保留进度，下次检查时从中断的页继续
+            print(f"❌ [Catalog] SteamSpy 目录同步失败: {e}")
+        time.sleep(CATALOG_SYNC_CHECK_SECONDS)
+
+
+def start_catalog_sync(on_synced=None):
+    """
+    启动后台目录同步线程 (重复调用无效)。
+    on_synced() 在每轮有新数据写入后调用 (例如预热热门游戏)。
+    """
+    global _sync_thread
+    if _sync_thread is None:
+        _sync_thread = threading.Thread(target=_sync_loop, args=(on_synced,), name="catalog-sync", daemon=True)
+        _sync_thread.start()
+    return _sync_thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SteamSpy 全目录同步")
+    parser.add_argument("--sync", action="store_true", help="同步目录 (从上次中断的页继续)")
+    parser.add_argument("--force", action="store_true", help="忽略刷新间隔，立即开始新一轮")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--tags", type=int, default=0, help="为前 N 个热门游戏补齐标签")
+    parser.add_argument("--top", type=int, default=0, help="打印在线人数最多的 N 个游戏")
+    args = parser.parse_args(argv)
+
+    if args.sync:
+        print(f"📚 [Catalog] 写入 {sync_catalog(args.max_pages, args.force)} 个游戏，目录共 {catalog_size()} 个")
+    if args.tags:
+        print(f"🏷️ [Catalog] 补齐了 {enrich_tags(args.tags)} 个游戏的标签")
+    for appid in popular_appids(args.top):
+        entry = get_catalog_entry(appid)
+        print(f"{appid}\t{entry['ccu']}\t{entry['name']}\t{', '.join(entry['tags'][:5])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
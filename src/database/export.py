@@ -0,0 +1,276 @@
+"""
+评论批量导出 (流式)。
+
+按 appid 列表或整个目录，从 reviews_{appid} 表分块读取评论 (pd.read_sql 的 chunksize 走游标，
+不会一次读入全部行)，附上 score_* 列、主题编号、游戏元数据，逐块写出为:
+- NDJSON: 每行一条 JSON
+- Parquet: 每块一个 row group (zstd 压缩)，需要安装 pyarrow
+
+用法:
+    python -m src.database.export --appids 1245620,2358720 --format parquet --output reviews.parquet
+    python -m src.database.export --format ndjson --since 2024-01-01 --polarity negative > negative.ndjson
+
+模块本身不导入 cache_manager / analysis_manager (导入它们会加载模型)，
+数据库和分析缓存路径由调用方传入。
+"""
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+import pandas as pd
+from src.monitoring.metrics import count
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DEFAULT_DB_PATH = "steam_cache.db"
+DEFAULT_ANALYSIS_DIR = os.path.join("static", "analysis_cache")
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_FORMATS = ("ndjson", "parquet")
+
+SCORE_COLUMNS = ["score_gameplay", "score_visuals", "score_story", "score_opt", "score_value"]
+# 导出列及类型 (所有 appid 统一，旧表缺少的列填空值)
+REVIEW_COLUMNS = {
+    "author_name": "string",
+    "voted_up": "bool",
+    "content": "string",
+    "playtime_at_review": "int64",
+    "votes_up": "int64",
+    "timestamp_created": "int64",
+    **{col: "float64" for col in SCORE_COLUMNS},
+    "lang": "string",
+    "token_count": "int64",
+    "is_spam": "bool",
+    "dup_weight": "int64",
+}
+# 主题来自 {appid}_review_topics.json，其余来自 metadata 表
+EXPORT_COLUMNS = {
+    "appid": "int64",
+    **REVIEW_COLUMNS,
+    "topic_id": "int64",
+    "topic_keywords": "string",
+    "review_score_desc": "string",
+    "total_positive": "int64",
+    "total_negative": "int64",
+    "data_version": "string",
+}
+
+
+def parse_time(value):
+    """unix 时间戳或 ISO 日期 ("2024-01-01") -> unix 时间戳；空值返回 None"""
+    if value in (None, ""):
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise ValueError(f"无效的时间: {value}")
+
+
+def list_catalog_appids(db_path=DEFAULT_DB_PATH):
+    """数据库里所有已缓存评论的 appid"""
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        rows = conn.execute("SELECT appid FROM metadata ORDER BY appid").fetchall() if "metadata" in tables else []
+    finally:
+        conn.close()
+    return [row[0] for row in rows if f"reviews_{row[0]}" in tables]
+
+
+def _load_topics(appid, analysis_dir):
+    """(作者 -> 主题编号, (极性, 主题编号) -> 关键词)；没有缓存时为空"""
+    def _read(name):
+        try:
+            with open(os.path.join(analysis_dir, f"{appid}_{name}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    assignments = _read("review_topics")
+    keywords = {}
+    for voted_up, name in ((True, "pos_topics"), (False, "neg_topics")):
+        for topic_id, info in _read(name).get("topic_map", {}).items():
+            keywords[(voted_up, int(topic_id))] = info.get("keywords", "")
+    return assignments, keywords
+
+
+def _conform(chunk, columns):
+    """补齐缺失列并按统一的列顺序 / 类型输出"""
+    for column, dtype in columns.items():
+        if column not in chunk.columns:
+            chunk[column] = None
+    chunk = chunk[list(columns)]
+    for column, dtype in columns.items():
+        if dtype == "int64":
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype("Int64")
+        elif dtype == "float64":
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype("float64")
+        elif dtype == "bool":
+            chunk[column] = chunk[column].astype("boolean")
+        else:
+            chunk[column] = chunk[column].astype("string")
+    return chunk
+
+
+def iter_review_chunks(appids=None, since=None, until=None, polarity=None,
+                       db_path=DEFAULT_DB_PATH, analysis_dir=DEFAULT_ANALYSIS_DIR, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    逐块产出待导出的评论 DataFrame (列见 EXPORT_COLUMNS)。
+    :param appids: appid 列表，None 表示整个目录
+    :param since / until: 按 timestamp_created 过滤 (unix 时间戳，含边界)
+    :param polarity: "positive" / "negative" / None
+    """
+    if polarity not in (None, "positive", "negative"):
+        raise ValueError(f"无效的极性: {polarity}")
+    if appids is None:
+        appids = list_catalog_appids(db_path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        for appid in appids:
+            table_name = f"reviews_{int(appid)}"
+            table_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+            if not table_columns:
+                print(f"⚠️ [Export] {appid} 没有缓存评论，跳过。", file=sys.stderr)
+                continue
+            meta = conn.execute(
+                "SELECT review_score_desc, total_positive, total_negative, last_updated FROM metadata WHERE appid = ?",
+                (int(appid),)
+            ).fetchone() or (None, None, None, None)
+            assignments, keywords = _load_topics(appid, analysis_dir)
+
+            select = ", ".join(c for c in REVIEW_COLUMNS if c in table_columns)
+            sql = f"SELECT {select} FROM {table_name} WHERE 1 = 1"
+            params = []
+            if since is not None:
+                sql += " AND timestamp_created >= ?"
+                params.append(since)
+            if until is not None:
+                sql += " AND timestamp_created <= ?"
+                params.append(until)
+            if polarity:
+                sql += " AND voted_up = ?"
+                params.append(1 if polarity == "positive" else 0)
+
+            for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=chunk_size):
+                chunk["appid"] = int(appid)
+                voted_up = chunk["voted_up"].astype(bool)
+                topic_ids = chunk["author_name"].astype(str).map(assignments)
+                chunk["topic_id"] = topic_ids
+                chunk["topic_keywords"] = [
+                    keywords.get((up, int(t))) if pd.notna(t) else None for up, t in zip(voted_up, topic_ids)
+                ]
+                chunk["review_score_desc"], chunk["total_positive"], chunk["total_negative"], chunk["data_version"] = meta
+                count("export_rows", len(chunk), "Rows written by the bulk review export.")
+                yield _conform(chunk, EXPORT_COLUMNS)
+    finally:
+        conn.close()
+
+
+def iter_ndjson(chunks):
+    """NDJSON 字节流 (每块编码一次)"""
+    for chunk in chunks:
+        if not chunk.empty:
+            yield chunk.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n").encode("utf-8") + b"\n"
+
+
+class _StreamSink:
+    """ParquetWriter 的只追加输出：写入的字节暂存起来，由生成器逐块取走"""
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema():
+    types = {"int64": pa.int64(), "float64": pa.float64(), "bool": pa.bool_(), "string": pa.string()}
+    return pa.schema([(name, types[dtype]) for name, dtype in EXPORT_COLUMNS.items()])
+
+
+def iter_parquet(chunks, compression="zstd"):
+    """Parquet 字节流：每块写成一个 row group，写完立即吐出，文件尾在最后输出"""
+    if pa is None:
+        raise RuntimeError("导出 Parquet 需要安装 pyarrow (pip install pyarrow)")
+    schema = _arrow_schema()
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(fmt, chunks):
+    if fmt == "ndjson":
+        return iter_ndjson(chunks)
+    if fmt == "parquet":
+        return iter_parquet(chunks)
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流式导出评论、情感分数与主题")
+    parser.add_argument("--appids", default="", help="逗号分隔的 appid，留空导出整个目录")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--output", default="-", help="输出文件 (默认标准输出)")
+    parser.add_argument("--since", default=None, help="起始时间 (unix 时间戳或 YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="结束时间 (unix 时间戳或 YYYY-MM-DD)")
+    parser.add_argument("--polarity", choices=("positive", "negative"), default=None)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--analysis-dir", default=DEFAULT_ANALYSIS_DIR)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    appids = [int(a) for a in args.appids.split(",") if a.strip()] or None
+    chunks = iter_review_chunks(
+        appids, parse_time(args.since), parse_time(args.until), args.polarity,
+        db_path=args.db, analysis_dir=args.analysis_dir, chunk_size=args.chunk_size
+    )
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    written = 0
+    try:
+        for data in stream_export(args.format, chunks):
+            out.write(data)
+            written += len(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"✅ [Export] 已写出 {written / 1024 / 1024:.1f} MB ({args.format})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import glob
+import gzip
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 内存中最多缓存的渲染结果数量
+RESPONSE_CACHE_MAX_ENTRIES = 256
+# 渲染结果落盘目录 (留空只用内存)；文件名以 appid 开头，由 cache_governor 计入容量预算并随游戏淘汰
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR") or None
+
+
+class ResponseCache:
+    """
+    渲染结果缓存：键为 (appid, review_type, data_version)。
+    进程内使用 LRU，可选地落盘到 disk_dir (多进程 / 重启后复用)。
+    data_version 变化后旧键自然失效；落盘时同一 (appid, review_type) 的旧版本文件随之删除。
+    """
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_etag(appid, review_type, data_version):
+        raw = f"{appid}:{review_type}:{data_version}".encode("utf-8")
+        return hashlib.md5(raw).hexdigest()
+
+    def _disk_path(self, key):
+        appid, review_type, data_version = key
+        return os.path.join(self.disk_dir, f"{appid}_{review_type}_{self.make_etag(*key)}.html.gz")
+
+    def _remove_disk_files(self, pattern, keep=None):
+        for path in glob.glob(os.path.join(self.disk_dir, pattern)):
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # 其他进程已删除
+
+    def get(self, appid, review_type, data_version):
+        key = (appid, review_type, data_version)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    with gzip.open(path, "rb") as f:
+                        body = f.read()
+                except (OSError, EOFError, zlib.error) as e:
+                    # 截断或损坏的文件 (如写入时进程崩溃) 直接删除，下次重新渲染
+                    print(f"⚠️ [ResponseCache] 读取磁盘缓存失败，已删除: {e}")
+                    self._remove_disk_files(os.path.basename(path))
+                    return None
+                self._put_memory(key, body)
+                return body
+        return None
+
+    def put(self, appid, review_type, data_version, body):
+        key = (appid, review_type, data_version)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self._put_memory(key, body)
+        if self.disk_dir:
+            # 先写临时文件再替换，并发读取的进程不会读到写了一半的文件
+            path = self._disk_path(key)
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            try:
+                with gzip.open(tmp_path, "wb") as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"⚠️ [ResponseCache] 写入磁盘缓存失败: {e}")
+                self._remove_disk_files(os.path.basename(tmp_path))
+                return
+            # 同一视图的旧数据版本不会再被读取
+            self._remove_disk_files(f"{appid}_{review_type}_*.html.gz", keep=path)
+
+    def _put_memory(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, appid):
+        """强制更新后丢弃该 appid 的所有缓存 (内存和磁盘)"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == appid]:
+                del self._entries[key]
+        if self.disk_dir:
+            self._remove_disk_files(f"{appid}_*.html.gz")
@@ -0,0 +1,277 @@
+"""
+评论句向量索引 (numpy + 内存映射文件)。
+
+- 向量数 <= EXACT_SEARCH_MAX_VECTORS：整块矩阵乘法做精确检索
+- 更大的索引：IVF 倒排 (球面 k-means 粗聚类)，向量按簇连续存放，
+  查询时只扫描与查询最相近的 nprobe 个簇
+
+向量都做了 L2 归一化，内积即余弦相似度。
+每次构建写入独立的 build 目录 (构建期间带 .partial 后缀)，完成后在文件锁内
+改名并原子替换 current.json 指向它；多个 worker 同时构建同一索引时只发布最新的 build，
+并且只清理比已发布版本更旧的完整 build。
+查询进程用 np.load(mmap_mode="r") 打开，不会把整个矩阵读进内存。
+"""
+import os
+import json
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+
+# 超过这个规模改用 IVF (5 万 x 384 维的精确检索约几毫秒)
+EXACT_SEARCH_MAX_VECTORS = 50000
+IVF_DEFAULT_NPROBE = 32
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 65536
+_ASSIGN_CHUNK = 65536
+# 超过这个时间还没完成的 .partial 目录视为构建进程已崩溃，发布时一并清理
+PARTIAL_BUILD_MAX_AGE_SECONDS = 24 * 3600
+
+# 已打开的索引: name -> VectorIndex (按 build id 失效)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def normalize_rows(vectors):
+    """L2 归一化 (float32)，零向量保持为零"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    """返回得分最高的 k 个下标 (降序)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _kmeans(vectors, nlist, seed=0):
+    """球面 k-means，在最多 KMEANS_SAMPLE_SIZE 条样本上训练，返回归一化的簇中心"""
+    rng = np.random.RandomState(seed)
+    if len(vectors) > KMEANS_SAMPLE_SIZE:
+        sample = vectors[np.sort(rng.choice(len(vectors), KMEANS_SAMPLE_SIZE, replace=False))]
+    else:
+        sample = vectors
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(assign, minlength=nlist)
+        order = np.argsort(assign, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+        # 空簇重新随机挑一个样本点
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), len(empty))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def _assign(vectors, centroids):
+    """分块计算每个向量最近的簇中心"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_CHUNK):
+        chunk = np.asarray(vectors[start:start + _ASSIGN_CHUNK], dtype=np.float32)
+        assign[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assign
+
+
+def _index_dir(name):
+    return os.path.join(VECTOR_INDEX_DIR, str(name))
+
+
+def _read_current(name):
+    try:
+        with open(os.path.join(_index_dir(name), "current.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _publish_lock(name):
+    """跨进程串行发布同一索引 (没有 fcntl 的平台上退化为不加锁)"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(_index_dir(name), ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _publish(name, build_id, partial_dir, meta):
+    """
+    发布一次构建 (调用方持有 _publish_lock)。
+    current.json 已指向更新的 build 时丢弃本次构建；发布后只删除比它旧的完整 build。
+    """
+    index_dir = _index_dir(name)
+    current = _read_current(name)
+    if current is not None and int(current["build"]) > int(build_id):
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        return
+    os.rename(partial_dir, os.path.join(index_dir, build_id))
+    current_path = os.path.join(index_dir, "current.json")
+    tmp_path = f"{current_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, current_path)
+
+    # 清理旧的 build 目录 (已经 mmap 打开的旧文件在 POSIX 上仍可继续读)；
+    # 其他进程正在写的 .partial 目录不动，除非已经放置太久
+    for entry in os.listdir(index_dir):
+        path = os.path.join(index_dir, entry)
+        if not os.path.isdir(path):
+            continue
+        if entry.isdigit() and int(entry) < int(build_id):
+            shutil.rmtree(path, ignore_errors=True)
+        elif entry.endswith(".partial") and time.time() - os.path.getmtime(path) > PARTIAL_BUILD_MAX_AGE_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_index(name, vectors, ids, version=None, extra=None):
+    """
+    构建并发布一个向量索引。
+    :param name: 索引名 (appid 或 "global")
+    :param vectors: (n, dim) 句向量 (会重新归一化)
+    :param ids: (n, 2) int64，每行 [appid, 评论键] (如作者 steamid)，用于回表取评论
+    :param version: 数据版本 (cache_manager.get_data_version)，查询方据此判断是否过期
+    :param extra: 写入 current.json 的附加信息
+    返回: 打开的 VectorIndex
+    """
+    vectors = normalize_rows(vectors)
+    ids = np.asarray(ids, dtype=np.int64).reshape(-1, 2)
+    if len(vectors) != len(ids):
+        raise ValueError("vectors 与 ids 的行数不一致")
+
+    build_id = f"{time.time_ns()}"
+    build_dir = os.path.join(_index_dir(name), f"{build_id}.partial")
+    os.makedirs(build_dir, exist_ok=True)
+    meta = {
+        "build": build_id,
+        "version": version,
+        "count": int(len(vectors)),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+    }
+
+    if len(vectors) <= EXACT_SEARCH_MAX_VECTORS:
+        meta["kind"] = "exact"
+        np.save(os.path.join(build_dir, "vectors.npy"), vectors)
+        np.save(os.path.join(build_dir, "ids.npy"), ids)
+    else:
+        # IVF：约 sqrt(n) 个簇，每个簇的向量连续存放。
+        # 保持 float32：numpy 没有 float16 的 BLAS，查询时逐块转换比矩阵乘法本身慢一个数量级
+        nlist = int(np.sqrt(len(vectors)))
+        centroids = _kmeans(vectors, nlist)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=nlist)))).astype(np.int64)
+        meta["kind"] = "ivf"
+        meta["nlist"] = nlist
+        np.save(os.path.join(build_dir, "vectors.npy"), vectors[order])
+        np.save(os.path.join(build_dir, "ids.npy"), ids[order])
+        np.save(os.path.join(build_dir, "centroids.npy"), centroids)
+        np.save(os.path.join(build_dir, "offsets.npy"), offsets)
+
+    if extra:
+        meta.update(extra)
+    with _publish_lock(name):
+        _publish(name, build_id, build_dir, meta)
+
+    print(f"💾 [VectorIndex] 索引 {name} 已构建: {meta['count']} 条向量 ({meta['kind']})")
+    return load_index(name)
+
+
+class VectorIndex:
+    """一个已发布的索引 (内存映射只读打开)"""
+    def __init__(self, name, meta):
+        self.name = name
+        self.meta = meta
+        self.kind = meta["kind"]
+        self.version = meta.get("version")
+        build_dir = os.path.join(_index_dir(name), meta["build"])
+        self.vectors = np.load(os.path.join(build_dir, "vectors.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(build_dir, "ids.npy"), mmap_mode="r")
+        if self.kind == "ivf":
+            # 簇中心和偏移量很小，直接读入内存
+            self.centroids = np.load(os.path.join(build_dir, "centroids.npy"))
+            self.offsets = np.load(os.path.join(build_dir, "offsets.npy"))
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def search(self, query, top_k=10, nprobe=IVF_DEFAULT_NPROBE):
+        """
+        :param query: (dim,) 查询向量
+        返回: (ids (k, 2), scores (k,))，按相似度降序
+        """
+        query = normalize_rows(query).reshape(-1)
+        if len(self) == 0:
+            return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.kind == "exact":
+            scores = self.vectors @ query
+            top = _top_k(scores, top_k)
+            return np.asarray(self.ids[top]), scores[top]
+
+        lists = _top_k(self.centroids @ query, nprobe)
+        spans = [(self.offsets[l], self.offsets[l + 1]) for l in lists]
+        candidates = np.concatenate([np.arange(a, b) for a, b in spans])
+        if len(candidates) == 0:
+            return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float32)
+        # 逐簇直接对内存映射的切片做乘法，不拷贝拼接候选向量
+        scores = np.concatenate([self.vectors[a:b] @ query for a, b in spans])
+        top = _top_k(scores, top_k)
+        return np.asarray(self.ids[candidates[top]]), scores[top]
+
+
+def load_index(name):
+    """打开索引的当前版本；不存在时返回 None"""
+    meta = _read_current(name)
+    if meta is None:
+        return None
+    with _loaded_lock:
+        index = _loaded.get(name)
+        if index is not None and index.meta["build"] == meta["build"]:
+            return index
+    while True:
+        try:
+            index = VectorIndex(name, meta)
+            break
+        except (OSError, ValueError) as e:
+            # 读到 current.json 之后其他进程发布了更新的 build 并清理了这一个：改开新的
+            latest = _read_current(name)
+            if latest is None or latest["build"] == meta["build"]:
+                print(f"⚠️ [VectorIndex] 打开索引 {name} 失败: {e}")
+                return None
+            meta = latest
+    with _loaded_lock:
+        _loaded[name] = index
+    return index
+
+
+def list_indexes():
+    """所有已构建的索引名"""
+    if not os.path.isdir(VECTOR_INDEX_DIR):
+        return []
+    return sorted(
+        entry for entry in os.listdir(VECTOR_INDEX_DIR)
+        if os.path.exists(os.path.join(VECTOR_INDEX_DIR, entry, "current.json"))
+    )
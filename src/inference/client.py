@@ -0,0 +1,121 @@
+"""
+推理服务客户端。
+
+设置环境变量 INFERENCE_SERVICE_ADDRESS 后，情感分析和句向量嵌入
+不再在 Web 进程内加载模型，而是发给共享的推理服务 (src.inference.service)，
+由服务端把多个请求合并成微批次统一推理。
+地址格式: Unix socket 路径 (如 /tmp/steam_radar_inference.sock) 或 "host:port"。
+
+连接用 INFERENCE_AUTHKEY 做双向认证。multiprocessing.connection 会反序列化对端发来的 pickle，
+能通过认证就等于能在对端执行代码，所以密钥没有默认值:
+- "host:port" 地址必须设置 INFERENCE_AUTHKEY，否则服务端和客户端都拒绝启动
+- Unix socket 未设置时，服务端启动时生成随机密钥写入 "<socket 路径>.key" (权限 0600)，同一用户的 Web 进程从该文件读取
+"""
+import os
+import secrets
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+INFERENCE_SERVICE_ADDRESS = os.getenv("INFERENCE_SERVICE_ADDRESS")
+INFERENCE_AUTHKEY = os.getenv("INFERENCE_AUTHKEY") or None
+# 句向量模型 (本地模式和推理服务共用)
+EMBEDDING_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class InferenceServiceError(RuntimeError):
+    pass
+
+
+def parse_address(address):
+    """"host:port" -> (host, port)；其他视为 Unix socket 路径"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def key_file(address):
+    return f"{address}.key"
+
+
+def resolve_authkey(address, create=False):
+    """
+    连接密钥 (bytes)：优先使用 INFERENCE_AUTHKEY；
+    未设置时只允许 Unix socket，读取 (create=True 时由服务端生成) 密钥文件。
+    """
+    if INFERENCE_AUTHKEY:
+        return INFERENCE_AUTHKEY.encode("utf-8")
+    if not isinstance(address, str):
+        raise InferenceServiceError("推理服务使用 host:port 地址时必须设置 INFERENCE_AUTHKEY")
+    path = key_file(address)
+    if create:
+        key = secrets.token_hex(32)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # 文件已存在时 O_CREAT 的权限不生效，这里再收紧一次
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(key)
+        return key.encode("utf-8")
+    try:
+        with open(path, "r") as f:
+            return f.read().strip().encode("utf-8")
+    except OSError as e:
+        raise InferenceServiceError(f"读取推理服务密钥 {path} 失败 (或设置 INFERENCE_AUTHKEY): {e}") from e
+
+
+def service_enabled():
+    return bool(INFERENCE_SERVICE_ADDRESS)
+
+
+class InferenceClient:
+    """
+    线程安全的瘦客户端：每个线程复用自己的一条连接，
+    请求/响应都是 pickle 过的 dict。
+    """
+    def __init__(self, address=None, authkey=None):
+        self.address = parse_address(address or INFERENCE_SERVICE_ADDRESS)
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 每次重连都重新读取密钥 (推理服务重启后会生成新的密钥文件)
+            conn = Client(self.address, authkey=self.authkey or resolve_authkey(self.address))
+            self._local.conn = conn
+        return conn
+
+    def _call(self, op, texts):
+        try:
+            conn = self._connection()
+            conn.send({"op": op, "texts": list(texts)})
+            reply = conn.recv()
+        except (OSError, EOFError, AuthenticationError) as e:
+            # 连接断开后丢弃，下次调用重连
+            self._local.conn = None
+            raise InferenceServiceError(f"推理服务不可用: {e}") from e
+        if "error" in reply:
+            raise InferenceServiceError(reply["error"])
+        return reply["result"]
+
+    def score(self, texts):
+        """零样本多维情感打分，返回与 SentimentAnalyzer.analyze_batch 相同的 dict 列表"""
+        return self._call("score", texts)
+
+    def embed(self, texts):
+        """句向量嵌入，返回 numpy 数组 (n, dim)"""
+        return self._call("embed", texts)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """进程内共享的客户端实例"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient()
+        return _client
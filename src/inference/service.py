@@ -0,0 +1,164 @@
+"""
+共享推理服务：单独进程持有一份零样本分类模型和句向量模型，
+把来自多个 Web worker 的请求合并成微批次 (最长等待 MAX_WAIT_MS)，
+推理完成后按调用方拆分结果返回。
+
+启动:
+    INFERENCE_SERVICE_ADDRESS=/tmp/steam_radar_inference.sock python -m src.inference.service
+Web 进程设置同样的 INFERENCE_SERVICE_ADDRESS 即可改走服务。
+使用 host:port 地址时两边都必须设置相同的 INFERENCE_AUTHKEY (见 client 模块说明)。
+"""
+import os
+import time
+import queue
+import threading
+from multiprocessing.connection import Listener
+
+import numpy as np
+
+from src.inference.client import (
+    INFERENCE_SERVICE_ADDRESS, EMBEDDING_MODEL_NAME, InferenceServiceError, parse_address, resolve_authkey
+)
+
+# 单个微批次最多合并的文本条数
+MAX_BATCH_TEXTS = 64
+# 收到第一条请求后最多等待多久再开始推理 (毫秒)
+MAX_WAIT_MS = 20
+DEFAULT_ADDRESS = "/tmp/steam_radar_inference.sock" if os.name == "posix" else "127.0.0.1:50515"
+
+
+class _Pending:
+    __slots__ = ("texts", "event", "result", "error")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    把并发调用合并为微批次:
+    凑够 max_batch 条文本，或第一条请求等待超过 max_wait_ms，就执行一次 infer_func。
+    infer_func(texts) 必须返回与 texts 等长的结果 (list 或 numpy 数组)。
+    """
+    def __init__(self, name, infer_func, max_batch=MAX_BATCH_TEXTS, max_wait_ms=MAX_WAIT_MS):
+        self.name = name
+        self.infer_func = infer_func
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """阻塞直到结果可用"""
+        if not texts:
+            return []
+        pending = _Pending(texts)
+        self._queue.put(pending)
+        pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            total = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while total < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                total += len(item.texts)
+            self._run(batch, total)
+
+    def _run(self, batch, total):
+        texts = [text for item in batch for text in item.texts]
+        try:
+            start = time.perf_counter()
+            results = self.infer_func(texts)
+            print(f"🤖 [InferenceService] {self.name}: {len(batch)} 个请求 / {total} 条文本，"
+                  f"耗时 {time.perf_counter() - start:.3f}s")
+            offset = 0
+            for item in batch:
+                item.result = results[offset:offset + len(item.texts)]
+                offset += len(item.texts)
+        except Exception as e:
+            for item in batch:
+                item.error = e
+        finally:
+            for item in batch:
+                item.event.set()
+
+
+def _load_models():
+    # 延迟导入：只有服务进程需要加载模型
+    from src.analysis.sentiment_analysis import SentimentAnalyzer
+    from sentence_transformers import SentenceTransformer
+
+    analyzer = SentimentAnalyzer(use_service=False)
+    print(f"正在加载 SentenceTransformer 模型 ({EMBEDDING_MODEL_NAME})...")
+    embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    def embed(texts):
+        return np.asarray(embedder.encode(texts, batch_size=MAX_BATCH_TEXTS, show_progress_bar=False))
+
+    return {
+        "score": MicroBatcher("score", analyzer.analyze_local),
+        "embed": MicroBatcher("embed", embed),
+    }
+
+
+def _serve_connection(conn, batchers):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            batcher = batchers.get(request.get("op"))
+            if batcher is None:
+                conn.send({"error": f"未知操作: {request.get('op')}"})
+                continue
+            try:
+                conn.send({"result": batcher.submit(request.get("texts", []))})
+            except Exception as e:
+                conn.send({"error": repr(e)})
+
+
+def serve(address=None):
+    address = parse_address(address or INFERENCE_SERVICE_ADDRESS or DEFAULT_ADDRESS)
+    try:
+        # 先确定密钥再加载模型：TCP 地址没有密钥时直接退出
+        authkey = resolve_authkey(address, create=True)
+    except InferenceServiceError as e:
+        raise SystemExit(f"❌ [InferenceService] {e}")
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)  # 清理上次异常退出留下的 socket 文件
+    batchers = _load_models()
+    with Listener(address, authkey=authkey) as listener:
+        if isinstance(address, str):
+            os.chmod(address, 0o600)
+        print(f"✅ [InferenceService] 正在监听 {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"⚠️ [InferenceService] 接受连接失败: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, batchers), daemon=True).start()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,229 @@
+"""
+昂贵阶段的准入控制 (admission control)。
+
+爬取、情感推理、BERTopic、时序爬取共用同一台机器的 CPU 和网络，
+同时请求很多冷门游戏时所有请求会一起变慢。每类阶段有独立的并发预算:
+    with admission.slot("topics"):
+        ...
+预算用满后请求进入有界等待队列，按优先级 (已缓存 / 热门游戏优先) 依次放行；
+队列已满或等待超时抛出 AdmissionRejected，调用方可以降级 (跳过或推迟该阶段)。
+
+优先级由请求入口用 request_context(priority) 设置 (线程局部)，阶段代码不需要知道 appid。
+负载等级 (load_level) 见 /load 接口和 /metrics。
+"""
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from src.monitoring.metrics import observe, count, register_gauge
+
+# 优先级 (数值越小越先放行)
+PRIORITY_CACHED = 0       # 已缓存或热门游戏
+PRIORITY_DEFAULT = 1      # 普通前台请求
+PRIORITY_BACKGROUND = 2   # 后台刷新 / 推迟的分析
+
+# 阶段 -> (并发预算, 等待队列长度上限, 前台请求的等待超时秒数)
+STAGE_LIMITS = {
+    "crawl": (4, 16, 30),
+    "inference": (1, 8, 60),
+    "topics": (1, 4, 10),
+    "timeseries": (2, 4, 5),
+}
+# 覆盖并发预算，例如 ADMISSION_BUDGETS="inference=2,topics=2"
+ADMISSION_BUDGETS = os.getenv("ADMISSION_BUDGETS", "")
+# 任一阶段的等待队列达到上限的这个比例时视为过载，前台请求降级
+ADMISSION_OVERLOAD_QUEUE_RATIO = 0.5
+
+LOAD_LEVELS = ("normal", "busy", "overloaded")
+
+
+class AdmissionRejected(RuntimeError):
+    def __init__(self, stage, reason):
+        super().__init__(f"{stage} 阶段繁忙 ({reason})")
+        self.stage = stage
+        self.reason = reason
+
+
+class StageGate:
+    """
+    一个阶段的并发预算 + 按优先级排序的等待队列。
+    max_queue 只限制前台请求；后台任务排在所有前台请求之后，不占队列名额，
+    也不计入 waiting (负载等级只反映前台排队情况)。
+    """
+    def __init__(self, stage, budget, max_queue, timeout):
+        self.stage = stage
+        self.budget = budget
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiting = []  # (priority, seq) 小顶堆 (含后台任务)
+        self._background_waiting = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def waiting(self):
+        """排队中的前台请求数"""
+        return len(self._waiting) - self._background_waiting
+
+    def acquire(self, priority, timeout):
+        """
+        占用一个并发名额；timeout 为 None 时一直等。
+        返回 None 表示成功，否则返回拒绝原因 ("queue_full" / "timeout")。
+        """
+        with self._cond:
+            if self.active < self.budget and not self._waiting:
+                self.active += 1
+                return None
+            background = priority >= PRIORITY_BACKGROUND
+            if not background and self.waiting >= self.max_queue:
+                return "queue_full"
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            if background:
+                self._background_waiting += 1
+            deadline = None if timeout is None else time.monotonic() + timeout
+            try:
+                # 只有排在队首且有空闲名额时才放行
+                while not (self._waiting[0] == entry and self.active < self.budget):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                        return "timeout"
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+                self.active += 1
+                return None
+            finally:
+                if background:
+                    self._background_waiting -= 1
+                # 队首或名额变了，唤醒其他等待者
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def status(self):
+        return {
+            "active": self.active, "budget": self.budget, "waiting": self.waiting,
+            "background_waiting": self._background_waiting, "max_queue": self.max_queue
+        }
+
+
+def _parse_budgets(raw):
+    budgets = {}
+    for item in raw.split(","):
+        stage, sep, value = item.partition("=")
+        if sep and stage.strip() in STAGE_LIMITS and value.strip().isdigit():
+            budgets[stage.strip()] = max(1, int(value))
+    return budgets
+
+
+def _build_gates():
+    budgets = _parse_budgets(ADMISSION_BUDGETS)
+    return {
+        stage: StageGate(stage, budgets.get(stage, budget), max_queue, timeout)
+        for stage, (budget, max_queue, timeout) in STAGE_LIMITS.items()
+    }
+
+
+_gates = _build_gates()
+_local = threading.local()
+
+
+class RequestTicket:
+    """当前线程的准入上下文：优先级和被拒绝过的阶段"""
+    def __init__(self, priority):
+        self.priority = priority
+        self.rejected = set()
+
+
+def _current_ticket():
+    ticket = getattr(_local, "ticket", None)
+    return ticket if ticket is not None else RequestTicket(PRIORITY_DEFAULT)
+
+
+@contextmanager
+def request_context(priority=PRIORITY_DEFAULT):
+    """为当前线程内的所有阶段设置优先级 (可嵌套，退出后恢复)"""
+    previous = getattr(_local, "ticket", None)
+    ticket = RequestTicket(priority)
+    _local.ticket = ticket
+    try:
+        yield ticket
+    finally:
+        _local.ticket = previous
+
+
+def is_background():
+    return _current_ticket().priority >= PRIORITY_BACKGROUND
+
+
+@contextmanager
+def slot(stage):
+    """
+    占用 stage 的一个并发名额。后台任务一直等待，前台请求最多等该阶段的超时时间；
+    被拒绝时抛出 AdmissionRejected。
+    """
+    gate = _gates[stage]
+    ticket = _current_ticket()
+    timeout = None if ticket.priority >= PRIORITY_BACKGROUND else gate.timeout
+    start = time.perf_counter()
+    reason = gate.acquire(ticket.priority, timeout)
+    observe(f"admission_wait_{stage}", time.perf_counter() - start)
+    if reason:
+        ticket.rejected.add(stage)
+        count("admission_rejected", 1, "Requests rejected by admission control.", stage=stage, reason=reason)
+        print(f"🚦 [Admission] {stage} 阶段拒绝请求 ({reason})")
+        raise AdmissionRejected(stage, reason)
+    try:
+        yield
+    finally:
+        gate.release()
+
+
+def load_level():
+    """
+    normal: 所有阶段都有空闲名额；busy: 某阶段名额用满或有人排队；
+    overloaded: 某阶段前台排队数达到队列上限的 ADMISSION_OVERLOAD_QUEUE_RATIO
+    (后台任务只会让等级变为 busy，不会让前台请求降级)
+    """
+    level = 0
+    for gate in _gates.values():
+        if gate.waiting >= gate.max_queue * ADMISSION_OVERLOAD_QUEUE_RATIO:
+            return LOAD_LEVELS[2]
+        if gate.waiting or gate.active >= gate.budget:
+            level = 1
+    return LOAD_LEVELS[level]
+
+
+def should_degrade():
+    """前台请求在过载时降级；后台任务照常排队执行"""
+    return not is_background() and load_level() == "overloaded"
+
+
+def load_status():
+    """/load 接口的返回内容"""
+    return {"level": load_level(), "stages": {stage: gate.status() for stage, gate in _gates.items()}}
+
+
+register_gauge(
+    "admission_active",
+    lambda: {(("stage", stage),): gate.active for stage, gate in _gates.items()},
+    "Stage slots currently in use."
+)
+register_gauge(
+    "admission_waiting",
+    lambda: {(("stage", stage),): gate.waiting for stage, gate in _gates.items()},
+    "Requests waiting for a stage slot."
+)
+register_gauge(
+    "load_level",
+    lambda: {(): LOAD_LEVELS.index(load_level())},
+    "Current load level (0 normal, 1 busy, 2 overloaded)."
+)
@@ -0,0 +1,156 @@
+"""
+进程内性能指标：分阶段耗时直方图、缓存命中计数、队列深度，
+以 Prometheus 文本格式在 /metrics 输出。
+"""
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# 耗时直方图的桶边界 (秒)，覆盖 SQLite 毫秒级读取到 BERTopic 分钟级训练
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+# stage -> [每个桶的计数..., +Inf 计数, 总和]
+_stage_histograms = {}
+# (cache, result) -> count
+_cache_counters = {}
+# queue -> 回调函数 (返回当前深度)
+_queue_gauges = {}
+# metric -> (回调函数 (返回 {labels(tuple): value})，HELP 文本)
+_gauges = {}
+# metric -> {labels(tuple): count}，以及 metric -> HELP 文本
+_counters = {}
+_counter_help = {}
+
+
+def observe(stage, seconds):
+    """记录一次阶段耗时"""
+    with _lock:
+        hist = _stage_histograms.get(stage)
+        if hist is None:
+            hist = [0] * (len(STAGE_BUCKETS) + 1) + [0.0]
+            _stage_histograms[stage] = hist
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[len(STAGE_BUCKETS)] += 1
+        hist[-1] += seconds
+
+
+@contextmanager
+def timed(stage):
+    """
+    计时上下文管理器:
+        with timed("sqlite_read"):
+            ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed_stage(stage):
+    """计时装饰器，等价于在函数体外包一层 timed(stage)"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache, result):
+    """记录一次缓存访问，result 为 "hit" / "miss" / "stale" 等"""
+    with _lock:
+        key = (cache, result)
+        _cache_counters[key] = _cache_counters.get(key, 0) + 1
+
+
+def count(metric, value=1, help_text=None, **labels):
+    """
+    通用计数器，输出为 steam_radar_<metric>_total{labels}
+        count("dedup_reviews", 100, kind="total")
+    """
+    with _lock:
+        if help_text:
+            _counter_help[metric] = help_text
+        series = _counters.setdefault(metric, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+
+def register_queue(queue, depth_func):
+    """注册一个队列深度回调 (在 /metrics 被抓取时调用)"""
+    _queue_gauges[queue] = depth_func
+
+
+def register_gauge(metric, values_func, help_text=None):
+    """
+    注册一个仪表盘指标，输出为 steam_radar_<metric>{labels}；
+    values_func 返回 {labels(tuple of (key, value)): 数值}，在 /metrics 被抓取时调用
+    """
+    _gauges[metric] = (values_func, help_text or metric)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """输出 Prometheus text exposition format (0.0.4)"""
+    lines = []
+    with _lock:
+        histograms = {stage: list(hist) for stage, hist in _stage_histograms.items()}
+        counters = dict(_cache_counters)
+        generic = {metric: dict(series) for metric, series in _counters.items()}
+        generic_help = dict(_counter_help)
+
+    lines.append("# HELP steam_radar_stage_seconds Time spent in each pipeline stage.")
+    lines.append("# TYPE steam_radar_stage_seconds histogram")
+    for stage, hist in sorted(histograms.items()):
+        for bound, count in zip(STAGE_BUCKETS, hist):
+            lines.append(f'steam_radar_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        total = hist[len(STAGE_BUCKETS)]
+        lines.append(f'steam_radar_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {total}')
+        lines.append(f'steam_radar_stage_seconds_sum{{stage="{stage}"}} {_format_value(hist[-1])}')
+        lines.append(f'steam_radar_stage_seconds_count{{stage="{stage}"}} {total}')
+
+    lines.append("# HELP steam_radar_cache_requests_total Cache lookups by cache and result.")
+    lines.append("# TYPE steam_radar_cache_requests_total counter")
+    for (cache, result), count in sorted(counters.items()):
+        lines.append(f'steam_radar_cache_requests_total{{cache="{cache}",result="{result}"}} {count}')
+
+    for metric, series in sorted(generic.items()):
+        name = f"steam_radar_{metric}_total"
+        lines.append(f"# HELP {name} {generic_help.get(metric, metric)}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(series.items()):
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_str}}} {_format_value(value)}" if label_str else f"{name} {_format_value(value)}")
+
+    lines.append("# HELP steam_radar_queue_depth Current number of queued or running jobs.")
+    lines.append("# TYPE steam_radar_queue_depth gauge")
+    for queue, depth_func in sorted(_queue_gauges.items()):
+        try:
+            depth = depth_func()
+        except Exception:
+            continue
+        lines.append(f'steam_radar_queue_depth{{queue="{queue}"}} {depth}')
+
+    for metric, (values_func, help_text) in sorted(_gauges.items()):
+        try:
+            values = values_func()
+        except Exception:
+            continue
+        name = f"steam_radar_{metric}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in sorted(values.items()):
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_str}}} {_format_value(value)}" if label_str else f"{name} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,27 @@
+"""
+按需性能剖析：对单个慢请求运行 cProfile 并导出 .prof 文件。
+导出的文件可用 snakeviz / flameprof / py-spy 等工具查看或转换为火焰图。
+"""
+import os
+import re
+import time
+import cProfile
+
+PROFILE_DIR = "profiles"
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler, label):
+    """停止剖析并写入 PROFILE_DIR，返回文件路径"""
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_") or "request"
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{safe_label}.prof")
+    profiler.dump_stats(path)
+    print(f"🔬 [Profiling] 已导出性能剖析文件: {path}")
+    return path
@@ -0,0 +1,152 @@
+"""
+评论去重与垃圾评论识别 (在情感分析 / BERTopic 之前运行)。
+
+1. 垃圾评论：清洗后几乎没有有效字符 (字符画、纯符号、单字刷屏)
+2. 完全重复：规范化文本的哈希相同
+3. 近似重复：字符 3-gram 的 MinHash + LSH 分桶，估计 Jaccard >= NEAR_DUP_THRESHOLD 视为同一簇
+
+每个簇只保留第一条 (Steam 按“有帮助度”排序，第一条最有代表性) 作为代表参与推理，
+其余成员复制代表的分数；代表行的 dup_weight 为簇大小，用于主题计数加权。
+"""
+import re
+import zlib
+import numpy as np
+
+# 有效字符：中文、字母、数字
+_MEANINGFUL_RE = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]')
+_NORMALIZE_RE = re.compile(r'[^\u4e00-\u9fa5a-z0-9]+')
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+LSH_BANDS = 8          # 8 段 x 8 行，S 曲线拐点约在 Jaccard 0.77
+NEAR_DUP_THRESHOLD = 0.8
+MAX_PAIRWISE_BUCKET = 64
+MIN_MEANINGFUL_CHARS = 2
+MIN_MEANINGFUL_RATIO = 0.3
+
+_MERSENNE_PRIME = 4294967311  # 大于 2^32 的素数
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+
+
+def normalize(text):
+    """小写并去掉所有非中英文数字字符 (用于哈希和 shingle)"""
+    return _NORMALIZE_RE.sub('', str(text).lower())
+
+
+def is_spam(text):
+    """字符画、纯符号、有效字符过少的评论"""
+    text = str(text)
+    visible = re.sub(r'\s+', '', text)
+    if not visible:
+        return True
+    meaningful = len(_MEANINGFUL_RE.findall(visible))
+    if meaningful < MIN_MEANINGFUL_CHARS:
+        return True
+    if meaningful / len(visible) < MIN_MEANINGFUL_RATIO:
+        return True
+    # "哈哈哈哈哈哈哈哈哈哈哈" 这类单字刷屏
+    normalized = normalize(text)
+    return len(normalized) >= 8 and len(set(normalized)) <= 2
+
+
+def _minhash(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        # 以较小的下标 (更靠前 = 更有帮助) 作为根
+        if ra < rb:
+            self.parent[rb] = ra
+        else:
+            self.parent[ra] = rb
+
+
+def find_duplicates(texts, threshold=NEAR_DUP_THRESHOLD):
+    """
+    返回:
+    - groups: 每条评论所属簇的代表下标 (垃圾评论为 -1)
+    - spam: 每条评论是否为垃圾评论
+    """
+    texts = [str(t) for t in texts]
+    n = len(texts)
+    spam = [is_spam(t) for t in texts]
+    uf = _UnionFind(n)
+
+    # 1. 完全重复
+    exact = {}
+    candidates = []
+    for i, text in enumerate(texts):
+        if spam[i]:
+            continue
+        key = normalize(text)
+        first = exact.get(key)
+        if first is None:
+            exact[key] = i
+            candidates.append(i)
+        else:
+            uf.union(first, i)
+
+    # 2. 近似重复：MinHash + LSH，只对完全去重后的文本计算
+    if len(candidates) > 1:
+        signatures = {i: _minhash(normalize(texts[i])) for i in candidates}
+        rows = NUM_PERM // LSH_BANDS
+        checked = set()
+        for band in range(LSH_BANDS):
+            buckets = {}
+            for i in candidates:
+                key = signatures[i][band * rows:(band + 1) * rows].tobytes()
+                buckets.setdefault(key, []).append(i)
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                # 小桶两两比较；超大桶只与桶内第一条比较，避免平方级开销
+                heads = members if len(members) <= MAX_PAIRWISE_BUCKET else members[:1]
+                for a_pos, a in enumerate(heads):
+                    for b in members[a_pos + 1:]:
+                        if (a, b) in checked:
+                            continue
+                        checked.add((a, b))
+                        if np.mean(signatures[a] == signatures[b]) >= threshold:
+                            uf.union(a, b)
+
+    groups = [-1 if spam[i] else uf.find(i) for i in range(n)]
+    return groups, spam
+
+
+def collapse_duplicates(df, text_column="content", id_column="author_name"):
+    """
+    为 DataFrame 添加 dup_of / dup_weight / is_spam 三列 (原地修改并返回)。
+    - dup_of: 代表行的 id_column (作者 steamid，同一游戏每人只有一条评论)，垃圾评论为 None；
+      不依赖行的位置，重排、拼接、分块入库或从数据库读回后仍然有效
+    - dup_weight: 代表行为簇大小，被折叠的成员和垃圾评论为 0
+    """
+    groups, spam = find_duplicates(df[text_column].tolist())
+    ids = df[id_column].astype(str).tolist()
+    weights = np.zeros(len(groups), dtype=int)
+    for g in groups:
+        if g >= 0:
+            weights[g] += 1
+    df["dup_of"] = [ids[g] if g >= 0 else None for g in groups]
+    df["dup_weight"] = weights
+    df["is_spam"] = spam
+    return df
@@ -1,9 +1,105 @@
+"""
+评论文本预处理 (入库时只跑一次)。
+
+每条评论一次性生成下游需要的所有版本，作为列和评论一起写入数据库:
+- text_model:   情感模型 / 句向量的输入 (去掉链接、HTML、@提及、#话题)
+- text_topic:   BERTopic 的输入 (只保留中英文，其余字符折叠为空格)
+- text_display: 词云 / 展示用文本 (去 HTML，换行转空格，只保留中英文数字和常用标点)
+- lang:         语言 (zh / ja / ko / en ...，无法判断为 unknown)
+- token_count:  近似词元数 (每个汉字 / 假名 / 谚文算一个，连续的字母数字算一个)
+下游分析直接读这些列，不再各自重复清洗。
+"""
 import re
-from langdetect import detect
+from langdetect import detect, DetectorFactory, LangDetectException
+
+# langdetect 默认带随机性，固定种子保证同一文本结果稳定
+DetectorFactory.seed = 0
+
+# 所有正则预编译；能合并的规则合并为一次 sub
+_HTML_RE = re.compile(r'<[^>]+>')
+_MODEL_NOISE_RE = re.compile(r'http\S+|<[^>]+>|@\w+|#\w+')
+_TOPIC_DROP_RE = re.compile(r'[^\u4e00-\u9fa5a-zA-Z]+')
+_DISPLAY_WHITESPACE_RE = re.compile(r'[\n\r\t]')
+_DISPLAY_DROP_RE = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9\s.,!?]')
+_TOKEN_RE = re.compile(r'[\u4e00-\u9fa5\u3040-\u30ff\uac00-\ud7af]|[a-zA-Z0-9]+')
+_SCRIPT_RE = re.compile(r'(?P<han>[\u4e00-\u9fa5])|(?P<kana>[\u3040-\u30ff])|(?P<hangul>[\uac00-\ud7af])|(?P<latin>[a-zA-Z])')
+
+# 常见英文虚词：命中即判为英文，省掉 langdetect (单条约数毫秒) 的开销
+_ENGLISH_HINT_RE = re.compile(r'\b(?:the|and|is|are|was|this|that|with|for|not|but|you|it|of|to)\b', re.IGNORECASE)
+# 拉丁字母太少时 langdetect 结果不可靠，直接按英文处理
+LANGDETECT_MIN_LETTERS = 20
+
+PREPROCESSED_COLUMNS = ["text_model", "text_topic", "text_display", "lang", "token_count"]
+
+
+def model_text(text):
+    """情感模型 / 句向量输入"""
+    return _MODEL_NOISE_RE.sub('', str(text)).strip()
+
+
+def topic_text(text):
+    """BERTopic 输入 (只保留中英文)"""
+    return _TOPIC_DROP_RE.sub(' ', _HTML_RE.sub('', str(text))).strip()
+
+
+def display_text(text):
+    """展示 / 词云用文本"""
+    text = _HTML_RE.sub('', str(text))
+    text = _DISPLAY_WHITESPACE_RE.sub(' ', text)
+    return _DISPLAY_DROP_RE.sub('', text).strip()
+
+
+def detect_language(text):
+    """
+    先按文字系统判断 (中文评论占绝大多数，无需调用 langdetect)；
+    拉丁字母评论先看英文虚词，剩下的才交给 langdetect 区分具体语言。
+    """
+    counts = {"han": 0, "kana": 0, "hangul": 0, "latin": 0}
+    for match in _SCRIPT_RE.finditer(text):
+        counts[match.lastgroup] += 1
+    if counts["kana"]:
+        return "ja"
+    if counts["hangul"] > counts["han"]:
+        return "ko"
+    if counts["han"] and counts["han"] * 2 >= counts["latin"]:
+        return "zh"
+    if counts["latin"] < 3:
+        return "zh" if counts["han"] else "unknown"
+    if counts["latin"] < LANGDETECT_MIN_LETTERS or _ENGLISH_HINT_RE.search(text):
+        return "en"
+    try:
+        return detect(text)
+    except LangDetectException:
+        return "unknown"
+
+
+def preprocess_text(text):
+    """单条评论 -> 各预处理结果 (与 PREPROCESSED_COLUMNS 对应)"""
+    text = str(text)
+    model = model_text(text)
+    return (
+        model,
+        topic_text(text),
+        display_text(text),
+        detect_language(model),
+        len(_TOKEN_RE.findall(model)),
+    )
+
+
+def preprocess_reviews(df, text_column="content"):
+    """为评论 DataFrame 添加 PREPROCESSED_COLUMNS 各列 (原地修改并返回)"""
+    if df.empty:
+        for column in PREPROCESSED_COLUMNS:
+            df[column] = []
+        return df
+    rows = [preprocess_text(text) for text in df[text_column].fillna("")]
+    for i, column in enumerate(PREPROCESSED_COLUMNS):
+        df[column] = [row[i] for row in rows]
+    return df
 
-def clean_text(text):
-    text = re.sub(r"<.*?>", "", text)
-    text = re.sub(r"[\n\r\t]", " ", text)
-    text = re.sub(r"[^\u4e00-\u9fa5a-zA-Z0-9\s.,!?]", "", text)
-    return text.strip()
 
+def ensure_preprocessed(df, text_column="content"):
+    """旧缓存 (没有预处理列) 读出后现场补齐；不修改传入的 DataFrame"""
+    if any(column not in df.columns for column in PREPROCESSED_COLUMNS):
+        return preprocess_reviews(df.copy(), text_column)
+    return df
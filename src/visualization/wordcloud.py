@@ -1,68 +1,157 @@
 from wordcloud import WordCloud
-import matplotlib.pyplot as plt
 import os
-from src.preprocess.text_cleaner import clean_text
-from snownlp import SnowNLP
+import shutil
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+import jieba.posseg as pseg
+from src.preprocess.text_cleaner import display_text
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# 词云 PNG 缓存目录 (按 appid + 数据版本缓存)
+WORDCLOUD_CACHE_DIR = os.path.join(BASE_DIR, '..', '..', 'static', 'wordcloud_cache')
+# 单条评论的词性标注结果缓存上限 (按评论内容哈希，LRU)
+TAG_CACHE_MAX_SIZE = 20000
+
+_tag_cache = OrderedDict()
+_tag_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
 def load_stopwords(filepath):
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
-            # 使用 set 结构以便快速查找
-            return {line.strip() for line in f}
+            # 使用 frozenset 结构以便快速查找 (且可被 lru_cache 安全共享)
+            return frozenset(line.strip() for line in f)
     except FileNotFoundError:
         print(f"警告: 停用词文件未找到: {filepath}。词云可能包含无意义的词。")
-        return set()
+        return frozenset()
 
-def generate_wordcloud(df, column_name, output_path):
-    STOPWORDS = load_stopwords(os.path.join(BASE_DIR, '..', '..', 'static', 'cn_stopwords.txt'))
-    # 1. 【新增】一个列表来存储所有有意义的词
-    meaningful_words = []
-    
-    print(f"\n--- 开始为 {output_path} 提取关键词 ---")
-    
-    # 2. 【修改】逐条处理评论
-    # 使用 .dropna().astype(str) 确保数据是干净的字符串
-    for review in df[column_name].dropna().astype(str):
-        # 3. (不变) 清洗文本
-        cleaned_review = clean_text(review) # 使用你的清洗函数
-        if not cleaned_review:
-            continue
-
-        # 4. 【新增】使用 SnowNLP 进行词性标注
-        try:
-            s = SnowNLP(cleaned_review)
-            tags = s.tags
-        except Exception as e:
-            # print(f"SnowNLP 处理出错: {e} - 跳过: {cleaned_review[:20]}")
-            continue # SnowNLP 可能对某些特殊输入（如纯表情或太短）出错
-
-        # 5. 【新增】提取名词和形容词
-        for word, tag in tags:
+
+def _review_hash(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def _tag_reviews(cleaned_reviews):
+    """
+    批量词性标注：只标注缓存中没有的评论。
+    所有未命中的评论用换行拼接后一次性交给 jieba.posseg，
+    再按换行切回每条评论。
+    不使用 jieba 的并行模式：它的进程池是全局的，并发调用会互相关闭对方的进程池，
+    而且要从已加载模型的进程 fork；重复评论靠缓存跳过即可。
+    返回: 与输入等长的 [(word, flag), ...] 列表
+    """
+    keys = [_review_hash(text) for text in cleaned_reviews]
+    results = {}
+    missing = {}
+    with _tag_lock:
+        for key, text in zip(keys, cleaned_reviews):
+            tags = _tag_cache.get(key)
+            if tags is not None:
+                _tag_cache.move_to_end(key)
+                results[key] = tags
+            elif key not in missing:
+                missing[key] = text
+
+    if missing:
+        missing_keys = list(missing.keys())
+        # display_text 已将换行替换为空格，因此换行可安全作为分隔符
+        current = []
+        batch_tags = []
+        for word, flag in pseg.cut("\n".join(missing[k] for k in missing_keys)):
+            if word == "\n":
+                batch_tags.append(current)
+                current = []
+            else:
+                current.append((word, flag))
+        batch_tags.append(current)
+
+        with _tag_lock:
+            for key, tags in zip(missing_keys, batch_tags):
+                results[key] = tags
+                _tag_cache[key] = tags
+                _tag_cache.move_to_end(key)
+                while len(_tag_cache) > TAG_CACHE_MAX_SIZE:
+                    _tag_cache.popitem(last=False)
+
+    return [results[key] for key in keys]
+
+
+def extract_word_frequencies(df, column_name):
+    """
+    提取词云所需的词频字典 {word: count}。
+    只保留名词 (n*) 和形容词 (a*)，且长度 > 1、不在停用词表中。
+    """
+    stopwords = load_stopwords(os.path.join(BASE_DIR, '..', '..', 'static', 'cn_stopwords.txt'))
+
+    # 优先使用入库时预处理好的展示文本 (text_display 列)
+    if column_name == "content" and "text_display" in df.columns:
+        texts = df["text_display"].dropna().astype(str)
+    else:
+        texts = (display_text(r) for r in df[column_name].dropna().astype(str))
+    cleaned_reviews = [c for c in texts if c]
+    if not cleaned_reviews:
+        return Counter()
+
+    counter = Counter()
+    for tags in _tag_reviews(cleaned_reviews):
+        for word, flag in tags:
             word = word.strip()
-            # 核心过滤逻辑:
-            # 1. 是名词 (tag 以 'n' 开头) 或 形容词 (tag 以 'a' 开头)
+            # 1. 是名词 (flag 以 'n' 开头) 或 形容词 (flag 以 'a' 开头)
             # 2. 词的长度 > 1 (过滤单字)
-            # 3. 这个词不在我们的停用词表 (STOPWORDS) 中
-            if (tag.startswith('n') or tag.startswith('a')) and len(word) > 1 and word not in STOPWORDS:
-                meaningful_words.append(word)
-
-    # 6. 【修改】将所有提取到的“原因词”组合成一个长字符串
-    text = " ".join(meaningful_words)
-    
-    # 8. (不变) 检查分词后是否为空
-    font_path = "static/fonts/SIMHEI.TTF"   
-    
-    if not text.strip():
+            # 3. 这个词不在停用词表中
+            if (flag.startswith('n') or flag.startswith('a')) and len(word) > 1 and word not in stopwords:
+                counter[word] += 1
+    return counter
+
+
+def _data_version(df, column_name):
+    """未显式提供数据版本时，用评论内容的哈希作为版本号"""
+    digest = hashlib.md5()
+    for review in df[column_name].dropna().astype(str):
+        digest.update(review.encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()[:12]
+
+
+def generate_wordcloud(df, column_name, output_path, appid=None, data_version=None):
+    """
+    生成词云 PNG。
+    若提供 appid，则按 (appid, column_name, data_version) 缓存 PNG，
+    数据未变化时直接复用缓存文件。
+    """
+    cache_file = None
+    if appid is not None:
+        if data_version is None:
+            data_version = _data_version(df, column_name)
+        os.makedirs(WORDCLOUD_CACHE_DIR, exist_ok=True)
+        cache_file = os.path.join(WORDCLOUD_CACHE_DIR, f"{appid}_{column_name}_{data_version}.png")
+        if os.path.exists(cache_file):
+            print(f"✅ [WordCloud] 命中词云缓存: {cache_file}")
+            if os.path.abspath(cache_file) != os.path.abspath(output_path):
+                shutil.copyfile(cache_file, output_path)
+            return output_path
+
+    print(f"\n--- 开始为 {output_path} 提取关键词 ---")
+    frequencies = extract_word_frequencies(df, column_name)
+
+    font_path = "static/fonts/SIMHEI.TTF"
+
+    # 检查分词后是否为空
+    if not frequencies:
         return None
-    
-    # 9. (不变) 生成词云
+
+    # 直接使用词频生成词云，避免 WordCloud 重新分词
     wc = WordCloud(
         width=800,
         height=400,
-        background_color="black",   
-        colormap="cool",            
+        background_color="black",
+        colormap="cool",
         font_path=font_path
-    ).generate(text)
-    
+    ).generate_from_frequencies(frequencies)
+
     wc.to_file(output_path)
+    if cache_file and os.path.abspath(cache_file) != os.path.abspath(output_path):
+        shutil.copyfile(output_path, cache_file)
     return output_path
@@ -53,7 +53,12 @@ $(document).ready(function(){
     // ===================================
     // 2. 表单提交 "加载中" 提示 (无变化)
     // ===================================
-    $("form").on("submit", function() {
+    // 只对真正跳转页面的表单显示；AJAX 表单 (.js-ajax-form) 自己处理结果，不能被遮罩锁住
+    $("form:not(.js-ajax-form)").on("submit", function() {
+        $("#loadingOverlay").css("display", "flex");
+    });
+    // 好评/差评切换改为 GET 链接，同样显示加载提示
+    $("a.toggle-btn").on("click", function() {
         $("#loadingOverlay").css("display", "flex");
     });
 
@@ -68,9 +73,21 @@ $(document).ready(function(){
 
         console.log("Lazy Loading: initWordCloud");
 
-        wordCloudData = JSON.parse(chartDom.dataset.wordData);
         const topicMap = JSON.parse(chartDom.dataset.topicMap);
 
+        // 词云数据由 /word_data 接口单独提供 (压缩的平行数组，支持 ETag 缓存)
+        $.getJSON(chartDom.dataset.wordUrl, function (compact) {
+            // 还原为 ECharts 需要的对象数组
+            wordCloudData = compact.names.map((name, i) => ({
+                name: name,
+                value: compact.values[i],
+                topic_ids: compact.topics[i]
+            }));
+            renderWordCloud(chartDom, topicMap);
+        });
+    }
+
+    function renderWordCloud(chartDom, topicMap) {
         if (wordCloudData && wordCloudData.length > 0) {
             wordCloudChart = echarts.init(chartDom); // 赋值给全局变量
 
@@ -85,7 +102,7 @@ $(document).ready(function(){
                     extraCssText: 'max-width: 350px; white-space: normal; word-break: break-word;', 
                     formatter: function (params) {
                         const word = params.data.name;
-                        const topic_id = params.data.topic_id;
+                        const topic_id = params.data.topic_ids[0];
                         const topic_info = topicMap[topic_id]; 
                         if (topic_info) {
                             return `<strong style="font-size: 1.1em;">${word}</strong><br/>` +
@@ -299,6 +316,35 @@ $(document).ready(function(){
         }
     }
 
+    // 自定义分段 / 分位数分组：后端用前缀和索引即时计算，只替换图表数据
+    $('#playtimeCohortForm').on('submit', function (e) {
+        e.preventDefault();
+        const form = $(this);
+        const params = {};
+        const quantiles = form.find('[name=quantiles]').val();
+        const bins = $.trim(form.find('[name=bins]').val());
+        if (quantiles) params.quantiles = quantiles;
+        else if (bins) params.bins = bins;
+
+        $.getJSON(form.data('cohort-url'), params, function (data) {
+            const chartDom = document.getElementById('playtime_sentiment_chart');
+            const chart = chartDom && echarts.getInstanceByDom(chartDom);
+            if (chart) {
+                chart.setOption({
+                    xAxis: { data: data.cohorts.labels },
+                    series: [{ data: data.cohorts.positive_scores }, { data: data.cohorts.negative_scores }]
+                });
+            }
+            const refund = data.refund_window;
+            $('#refundWindowStats').text(
+                `退款窗口 (≤${refund.window_hours}h): ${refund.reviews} 条评论 (${refund.share ?? 0}%)，好评率 ${refund.positive_rate ?? '-'}%`
+            );
+        }).fail(function (xhr) {
+            const message = (xhr.responseJSON && xhr.responseJSON.error) || '分组失败';
+            $('#refundWindowStats').text(message);
+        });
+    });
+
     // ===================================
     // 6. 雷达图 (封装到函数)
     // ===================================
@@ -388,7 +434,7 @@ $(document).ready(function(){
         let highlightIndices = [];
         let downplayIndices = [];
         wordCloudData.forEach((item, index) => {
-            if (item.topic_id === topicId) {
+            if (item.topic_ids.includes(topicId)) {
                 highlightIndices.push(index);
             } else {
                 downplayIndices.push(index);
@@ -497,6 +543,206 @@ $(document).ready(function(){
         });
     }
     
+    // ===================================
+    // 9. 评论流 (键集分页 + 无限滚动)
+    // ===================================
+    const $reviewFeed = $("#reviewFeed");
+    const feedSentinel = document.getElementById('reviewFeedSentinel');
+    let feedSort = 'votes_up';
+    let feedCursor = null;
+    let feedLoading = false;
+    let feedDone = false;
+    let feedGeneration = 0;  // 切换排序后丢弃旧请求的结果
+
+    function buildReviewCard(review) {
+        const votedUp = Number(review.voted_up) === 1;
+        const content = review.content || '';
+        const $card = $('<div class="card mb-2 p-2 comment-card"></div>').data({
+            "steamid": review.author_name,
+            "appid": review.appid,
+            "content": content,
+            "voted-up": votedUp ? 1 : 0,
+            "playtime": review.playtime_at_review,
+            "votes": review.votes_up
+        });
+        $('<div class="d-flex justify-content-between align-items-center mb-1"></div>')
+            .append($('<span class="badge"></span>')
+                .addClass(votedUp ? 'bg-primary' : 'bg-danger')
+                .text(votedUp ? "👍好评" : "👎差评"))
+            .appendTo($card);
+        $('<p class="card-text"></p>')
+            .text(content.length > 100 ? content.slice(0, 100) + '...' : content)
+            .appendTo($card);
+        const $footer = $('<div class="card-footer-info mt-2"></div>');
+        $('<span><strong>🕓 时长:</strong> </span>')
+            .append(document.createTextNode((review.playtime_at_review / 60).toFixed(1) + ' 小时'))
+            .appendTo($footer);
+        $('<span><strong>🗳️ 获赞:</strong> </span>')
+            .append(document.createTextNode(review.votes_up))
+            .appendTo($footer);
+        $footer.appendTo($card);
+        return $('<div class="masonry-item"></div>').append($card);
+    }
+
+    function loadReviewPage() {
+        if (feedLoading || feedDone || !$reviewFeed.length) return;
+        feedLoading = true;
+        const generation = feedGeneration;
+        const params = { sort: feedSort, limit: 30 };
+        if (feedCursor) params.cursor = feedCursor;
+
+        $.getJSON($reviewFeed.data("feed-url"), params, function (data) {
+            if (generation !== feedGeneration) return;
+            $reviewFeed.append(data.reviews.map(buildReviewCard));
+            feedCursor = data.next_cursor;
+            if (!feedCursor) {
+                feedDone = true;
+                $(feedSentinel).text($reviewFeed.children().length ? '没有更多评论了' : '暂无评论');
+            }
+        }).fail(function () {
+            $(feedSentinel).text('评论加载失败');
+            feedDone = true;
+        }).always(function () {
+            if (generation !== feedGeneration) return;
+            feedLoading = false;
+            // 一页不足以填满视口时，观察器不会再次触发，这里主动续载
+            if (!feedDone && feedSentinel.getBoundingClientRect().top < window.innerHeight + 600) {
+                loadReviewPage();
+            }
+        });
+    }
+
+    $(document).on("click", ".review-sort-btn", function () {
+        $(".review-sort-btn").removeClass("active");
+        $(this).addClass("active");
+        feedSort = $(this).data("sort");
+        feedGeneration += 1;
+        feedCursor = null;
+        feedDone = false;
+        feedLoading = false;
+        $reviewFeed.empty();
+        $(feedSentinel).text('加载中...');
+        loadReviewPage();
+    });
+
+    // 语义搜索：结果替换评论流，点击任一排序按钮恢复
+    $("#reviewSearchForm").on("submit", function (e) {
+        e.preventDefault();
+        const query = $(this).find("input[name=q]").val().trim();
+        if (!query) return;
+        $(".review-sort-btn").removeClass("active");
+        feedGeneration += 1;
+        feedDone = true;
+        feedLoading = false;
+        const generation = feedGeneration;
+        $reviewFeed.empty();
+        $(feedSentinel).text('搜索中...');
+        $.getJSON($(this).data("search-url"), { q: query, k: 30 }, function (data) {
+            if (generation !== feedGeneration) return;
+            $reviewFeed.append(data.results.map(buildReviewCard));
+            $(feedSentinel).text(data.results.length ? `语义搜索结果 (${data.results.length} 条)` : '没有找到相关评论');
+        }).fail(function () {
+            if (generation !== feedGeneration) return;
+            $(feedSentinel).text('搜索失败');
+        });
+    });
+
+    if ($reviewFeed.length) {
+        if ('IntersectionObserver' in window) {
+            // 哨兵元素进入视口 (提前 600px) 时加载下一页
+            new IntersectionObserver(entries => {
+                if (entries[0].isIntersecting) loadReviewPage();
+            }, { rootMargin: '600px 0px' }).observe(feedSentinel);
+        }
+        loadReviewPage();
+    }
+
+    // ===================================
+    // 10. 多游戏对比 (叠加雷达 / 玩家体验阶段 / 月度好评率 / 推荐指数)
+    // ===================================
+    function initCompareCharts() {
+        const compareDom = document.getElementById('compareDashboard');
+        if (!compareDom) return;
+        const data = JSON.parse(compareDom.dataset.compare);
+        const games = data.games.filter(game => !game.error);
+        if (!games.length) return;
+
+        const baseOption = {
+            tooltip: {
+                backgroundColor: 'rgba(0,0,0,0.8)',
+                borderColor: '#66c0f4',
+                textStyle: { color: '#fff' }
+            },
+            legend: { data: games.map(game => game.name), textStyle: { color: '#e0e0e0' }, type: 'scroll' }
+        };
+        const axisStyle = {
+            axisLine: { lineStyle: { color: '#8392A5' } },
+            splitLine: { lineStyle: { color: 'rgba(255,255,255,0.1)' } }
+        };
+        const charts = [];
+        function render(id, option) {
+            const chart = echarts.init(document.getElementById(id));
+            chart.setOption($.extend(true, {}, baseOption, option));
+            charts.push(chart);
+        }
+
+        render('compare_score_chart', {
+            legend: { show: false },
+            tooltip: { trigger: 'axis' },
+            grid: { left: '3%', right: '4%', bottom: '3%', containLabel: true },
+            xAxis: $.extend({ type: 'category', data: games.map(game => game.name) }, axisStyle),
+            yAxis: $.extend({ type: 'value', min: 0, max: 100 }, axisStyle),
+            series: [{ type: 'bar', data: games.map(game => game.score), itemStyle: { color: '#66c0f4' } }]
+        });
+
+        const radarGames = games.filter(game => game.radar && game.radar.indicator);
+        if (radarGames.length) {
+            render('compare_radar_chart', {
+                radar: {
+                    indicator: radarGames[0].radar.indicator,
+                    axisName: { color: '#e0e0e0' },
+                    splitLine: { lineStyle: { color: 'rgba(255,255,255,0.2)' } },
+                    splitArea: { show: false }
+                },
+                series: [{
+                    type: 'radar',
+                    data: radarGames.map(game => ({ name: game.name, value: game.radar.value, areaStyle: { opacity: 0.15 } }))
+                }]
+            });
+        }
+
+        const playtimeGames = games.filter(game => game.playtime_sentiment && game.playtime_sentiment.labels);
+        if (playtimeGames.length) {
+            render('compare_playtime_chart', {
+                tooltip: { trigger: 'axis' },
+                grid: { left: '3%', right: '4%', bottom: '3%', containLabel: true },
+                xAxis: $.extend({ type: 'category', data: playtimeGames[0].playtime_sentiment.labels }, axisStyle),
+                yAxis: $.extend({ type: 'value', name: '平均情感分 (0-100)', min: 0, max: 100 }, axisStyle),
+                series: playtimeGames.map(game => ({
+                    name: game.name, type: 'line', smooth: true, data: game.playtime_sentiment.positive_scores
+                }))
+            });
+        }
+
+        if (data.trend.months.length) {
+            render('compare_trend_chart', {
+                tooltip: { trigger: 'axis' },
+                grid: { left: '3%', right: '4%', bottom: '10%', containLabel: true },
+                xAxis: $.extend({ type: 'category', boundaryGap: false, data: data.trend.months }, axisStyle),
+                yAxis: $.extend({ type: 'value', name: '好评率 (%)', min: 0, max: 100 }, axisStyle),
+                dataZoom: [{ type: 'inside', start: 0, end: 100 }, { start: 0, end: 100 }],
+                series: data.trend.series.map(item => ({
+                    name: item.name, type: 'line', smooth: true, connectNulls: true, data: item.positive_rate
+                }))
+            });
+        }
+
+        $(window).on('resize', function () {
+            charts.forEach(chart => chart.resize());
+        });
+    }
+    initCompareCharts();
+
     if (typeof tsParticles !== 'undefined') {
         console.log("tsParticles is available.");
         tsParticles.load("tsparticles", {